@@ -0,0 +1,74 @@
+'''
+Throughput of the `/add-scenarios` fan-out at rising concurrency caps, against the fake
+Gemini, a local fake Voxio server and an in-memory Mongo stand-in. With every stage
+waiting on I/O, items per second should grow close to linearly up to the cap.
+
+Usage : python benchmarks/add_scenarios.py
+'''
+
+import asyncio
+import time
+
+import yaml
+
+from vps.assets import AssetRegistry
+from vps.repository import ScenarioRepository
+from vps.routers import add_scenarios_route
+from vps.voxio import VoxioClient
+from stand_ins import FakeGeminiClient , FakeMongoClient , create_fake_voxio_app , free_port , serve_in_thread
+
+ITEMS : int = 64
+CONCURRENCY : tuple[int , ...] = (1 , 2 , 4 , 8 , 16 , 32)
+
+async def main() -> None : 
+
+    with open('config.yml') as file : config : dict = yaml.safe_load(file)
+
+    port : int = free_port()
+    serve_in_thread(create_fake_voxio_app(latency = 0.02) , port)
+
+    assets = AssetRegistry({'add-scenario' : config['add-scenario']})
+    await assets.load()
+
+    voxio_client = VoxioClient(f'http://127.0.0.1:{port}' , 'benchmark' , {**config['voxio'] , 'http2' : False})
+    gemini_client = FakeGeminiClient(token_latency = 0.004 , chunk_count = 50)
+
+    baseline : float | None = None
+
+    for concurrency in CONCURRENCY : 
+
+        repository = ScenarioRepository(FakeMongoClient(latency = 0.005)['vps']['scenarios'] , config['mongo'])
+        inserts : list[int] = []
+
+        insert_many = repository.insert_many
+
+        async def counting_insert_many(documents : list[dict]) -> dict[int , str] : 
+
+            inserts.append(len(documents))
+
+            return await insert_many(documents)
+
+        repository.insert_many = counting_insert_many
+
+        start_time = time.perf_counter()
+
+        results : list[dict] = [result async for result in add_scenarios_route(
+            queries = [f'Scenario {index}' for index in range(ITEMS)] , 
+            scenario_repository = repository , 
+            gemini_client = gemini_client , 
+            voxio_client = voxio_client , 
+            assets = assets.get('add-scenario') , 
+            config = {**config['add-scenario'] , 'max-concurrency' : 256} , 
+            max_concurrency = concurrency
+        )]
+
+        rate : float = ITEMS / (time.perf_counter() - start_time)
+        baseline = baseline or rate
+
+        succeeded : int = sum(result['status'] == 'success' for result in results)
+
+        print(f'concurrency {concurrency:>3} : {rate:7.1f} items/s , speedup {rate / baseline:5.1f}x , {succeeded}/{ITEMS} ok , {len(inserts)} insert_many calls')
+
+    await voxio_client.aclose()
+
+if __name__ == '__main__' : asyncio.run(main())
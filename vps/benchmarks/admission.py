@@ -0,0 +1,154 @@
+'''
+One tenant bursting `/edit-scenario` while another sends a steady trickle, with admission
+control off and on, against the fake Gemini, a local fake Voxio server and an in-memory
+Mongo stand-in. Reports the latency of the quiet tenant and what the noisy one got back.
+
+Then checks that load shedding fires with the limits of config.yml as shipped : far more
+generations than Gemini slots are started at once, the gemini bulkhead must see the queue
+and reject new callers, and callers that find no slot within `max-wait` must get a 503.
+
+Usage : python benchmarks/admission.py
+'''
+
+import asyncio
+import collections
+import os
+import statistics
+import time
+
+for name in ('ALLOWED_ORIGINS' , 'ALLOWED_CREDENTIALS' , 'ALLOWED_METHODS' , 'ALLOWED_HEADERS') : os.environ.setdefault(name , '')
+os.environ.setdefault('VOXIO_API_KEY' , 'benchmark')
+
+import httpx
+import yaml
+
+import vps.app as app_module
+from google.genai.types import GenerateContentConfig
+
+from vps.admission import Admission , AdmissionRejected , configure_bulkheads , get_bulkhead
+from vps.assets import AssetRegistry
+from vps.cache import ResultCache
+from vps.llm import run_gemini
+from vps.loader import load_scenario_repository , load_voxio_client
+from vps.startup import LazyClient , Startup
+from stand_ins import FakeGeminiClient , FakeMongoClient , create_fake_voxio_app , free_port , serve_in_thread
+
+BURST : int = 200
+QUIET_REQUESTS : int = 20
+QUIET_INTERVAL : float = 0.25
+GENERATIONS : int = 1000
+
+async def run(config : dict , enabled : bool) -> None : 
+
+    state = app_module.state
+
+    config['admission']['enabled'] = enabled
+    configure_bulkheads(config['admission']['upstreams'])
+    state.admission = Admission(config['admission'])
+
+    repository = load_scenario_repository(FakeMongoClient() , config['mongo'])
+
+    for api_key in ('noisy' , 'quiet') : await repository.insert({'api_key' : api_key , 'scenario_name' : api_key})
+
+    state.scenario_repository = repository
+
+    async with httpx.AsyncClient(transport = httpx.ASGITransport(app = app_module.app) , base_url = 'http://vps' , timeout = 120) as client : 
+
+        async def edit(api_key : str) -> tuple[int , float] : 
+
+            start_time : float = time.perf_counter()
+            response = await client.post('/edit-scenario' , json = {'api_key' : api_key , 'scenario_prompt' : 'Make it harder'})
+
+            return response.status_code , time.perf_counter() - start_time
+
+        async def quiet(index : int) -> tuple[int , float] : 
+
+            await asyncio.sleep(index * QUIET_INTERVAL)
+
+            return await edit('quiet')
+
+        noisy_task = asyncio.gather(*(edit('noisy') for _ in range(BURST)))
+        await asyncio.sleep(0.05)
+
+        quiet_results : list[tuple[int , float]] = await asyncio.gather(*(quiet(index) for index in range(QUIET_REQUESTS)))
+        noisy : list[tuple[int , float]] = await noisy_task
+
+    latencies : list[float] = sorted(latency for status , latency in quiet_results if status == 200)
+    statuses = collections.Counter(status for status , _ in noisy)
+
+    print(
+        f'admission {"on " if enabled else "off"} : quiet tenant p50 {statistics.median(latencies) * 1e3:7.0f} ms , '
+        f'max {latencies[-1] * 1e3:7.0f} ms , noisy tenant got {dict(statuses)}'
+    )
+
+async def shedding(config : dict) -> None : 
+
+    configure_bulkheads(config['admission']['upstreams'])
+
+    bulkhead = get_bulkhead('gemini')
+    edit_config : dict = config['edit-scenario']
+    gemini_client = FakeGeminiClient(token_latency = 0.01 , chunk_count = 50)
+
+    async def generate() -> int : 
+
+        try : await run_gemini(gemini_client , [] , GenerateContentConfig() , edit_config['model'] , edit_config['max-concurrency'] , edit_config['timeout'])
+        except AdmissionRejected as e : return e.status_code
+
+        return 200
+
+    start_time : float = time.perf_counter()
+    tasks : list[asyncio.Task] = [asyncio.create_task(generate()) for _ in range(GENERATIONS)]
+
+    # * Once the first generations are done, so the bulkhead has a service time to estimate the wait from
+    await asyncio.sleep(1.5)
+
+    try : 
+
+        bulkhead.check()
+        shed : str = 'admitted'
+
+    except AdmissionRejected as e : shed = f'rejected with {e.status_code}'
+
+    print(f'{GENERATIONS} generations at once : in_flight {bulkhead.in_flight} , waiting {bulkhead.waiting} , estimated wait {bulkhead.estimated_wait():.1f}s , a new caller is {shed}')
+
+    statuses = collections.Counter(await asyncio.gather(*tasks))
+
+    print(f'after {time.perf_counter() - start_time:.1f}s : {dict(statuses)} , max-wait {bulkhead.max_wait}s')
+
+    assert shed != 'admitted' , 'the gemini bulkhead did not shed with the default config'
+    assert statuses[503] , 'no caller gave up after max-wait'
+
+async def main() -> None : 
+
+    with open('config.yml') as file : config : dict = yaml.safe_load(file)
+
+    port : int = free_port()
+    serve_in_thread(create_fake_voxio_app() , port)
+
+    state = app_module.state
+    state.config = config
+
+    gemini_client = FakeGeminiClient(token_latency = 0.01 , chunk_count = 50)
+    state.gemini_client = LazyClient(lambda : gemini_client)
+    await state.gemini_client.get()
+
+    state.voxio_client = load_voxio_client({**config['voxio'] , 'base-url' : f'http://127.0.0.1:{port}' , 'http2' : False})
+    state.assets = AssetRegistry({name : config[name] for name in ('add-scenario' , 'edit-scenario')})
+    await state.assets.load()
+
+    state.generation_cache = None
+    state.idempotency = ResultCache(None , config['idempotency'])
+
+    state.startup = Startup()
+    state.startup.start()
+    await state.startup.wait()
+
+    print(f'{BURST} concurrent edits from one tenant , {QUIET_REQUESTS} edits from another over {QUIET_REQUESTS * QUIET_INTERVAL:.0f}s')
+
+    for enabled in (False , True) : await run(config , enabled)
+
+    await state.voxio_client.aclose()
+
+    await shedding(config)
+
+if __name__ == '__main__' : asyncio.run(main())
@@ -0,0 +1,52 @@
+'''
+Per-request cost of preparing the scenario prompt, generation config and workflow :
+reading the files on every request versus the cached `AssetRegistry`.
+
+Usage : python benchmarks/assets.py
+'''
+
+import asyncio
+import json
+import time
+
+import yaml
+
+from vps.assets import AssetRegistry
+from vps.services import create_generation_config
+
+ITERATIONS : int = 2000
+
+async def from_disk(config : dict) -> dict : 
+
+    with open(config['prompt-path']) as system_prompt_file : system_prompt : str = system_prompt_file.read()
+
+    await create_generation_config(system_prompt)
+
+    with open(config['workflow-path']) as workflow_file : return json.load(workflow_file)
+
+async def from_registry(registry : AssetRegistry) -> dict : 
+
+    assets = registry.get('add-scenario')
+    assets.generation_config
+
+    return assets.workflow
+
+async def measure(prepare) -> float : 
+
+    start_time = time.perf_counter()
+
+    for _ in range(ITERATIONS) : await prepare()
+
+    return (time.perf_counter() - start_time) / ITERATIONS * 1e6
+
+async def main() -> None : 
+
+    with open('config.yml') as config_file : config : dict = yaml.safe_load(config_file)['add-scenario']
+
+    registry = AssetRegistry({'add-scenario' : config})
+    await registry.load()
+
+    print(f'{"from disk":>14} {await measure(lambda : from_disk(config)):10.1f} us/request')
+    print(f'{"registry":>14} {await measure(lambda : from_registry(registry)):10.1f} us/request')
+
+if __name__ == '__main__' : asyncio.run(main())
@@ -0,0 +1,100 @@
+'''
+Encode and decode cost of the scenario payloads, before and after the serialization
+layer of `vps.codec` :
+
+- request : `await request.json()` and the key checks, against one typed model parse;
+- response : `jsonable_encoder` and the stdlib `JSONResponse`, against `FastJSONResponse`;
+- workflow : the flow document encoded twice (its hash, then the Voxio body), against
+  the pre-encoded `FlowTemplate` filled with the name and the two generated fields.
+
+The numbers depend on the JSON library `vps.codec` found, orjson in a normal install; the
+backend measured is printed first.
+
+Usage : python benchmarks/codec.py
+'''
+
+import asyncio
+import copy
+import hashlib
+import json
+import timeit
+
+import yaml
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from vps.assets import AssetRegistry
+from vps.codec import JSON_BACKEND , EditScenarioRequest , FastJSONResponse
+from vps.voxio import flow_document
+from stand_ins import FAKE_SCENARIO
+
+NUMBER : int = 2000
+
+REQUEST : bytes = json.dumps({'api_key' : 'a' * 32 , 'scenario_prompt' : 'Make the patient more anxious and add a history of smoking. ' * 4}).encode()
+
+RESPONSE : dict = {
+    **FAKE_SCENARIO , 
+    'api_key' : 'a' * 32 , 
+    '_id' : '0' * 24 , 
+    'status' : 'success' , 
+    'message' : 'Scenario added successfully'
+}
+
+def decode_before() -> dict : 
+
+    data : dict = json.loads(REQUEST)
+
+    if 'api_key' not in data or 'scenario_prompt' not in data : raise ValueError
+
+    return data
+
+def decode_after() -> dict : return EditScenarioRequest.model_validate_json(REQUEST).model_dump()
+
+def encode_before() -> bytes : return JSONResponse(jsonable_encoder({'response' : RESPONSE})).body
+
+def encode_after() -> bytes : return FastJSONResponse({'response' : RESPONSE}).body
+
+def workflow_before(assets) -> tuple[str , bytes] : 
+
+    workflow : dict = copy.deepcopy(assets.workflow)
+
+    workflow['variables']['feedback_questions']['value'] = RESPONSE['questions_for_feedback']
+    workflow['nodes']['llm']['parameters']['system_prompt'] = RESPONSE['scenario_prompt']
+
+    document : dict = flow_document(workflow , RESPONSE['scenario_name'])
+    flow_hash : str = hashlib.sha256(json.dumps(document , sort_keys = True , separators = (',' , ':') , ensure_ascii = False).encode()).hexdigest()[: 32]
+
+    return flow_hash , json.dumps(document , separators = (',' , ':') , ensure_ascii = False).encode()
+
+def workflow_after(assets) -> tuple[str , bytes] : 
+
+    body : bytes = assets.flow_template.render(RESPONSE['scenario_name'] , RESPONSE)
+
+    return assets.flow_template.flow_hash(RESPONSE['scenario_name'] , RESPONSE) , body
+
+def measure(function) -> float : return min(timeit.repeat(function , number = NUMBER , repeat = 5)) / NUMBER * 1e6
+
+async def main() -> None : 
+
+    with open('config.yml') as config_file : config : dict = yaml.safe_load(config_file)['edit-scenario']
+
+    registry = AssetRegistry({'edit-scenario' : config})
+    await registry.load()
+
+    assets = registry.get('edit-scenario')
+    body : bytes = workflow_after(assets)[1]
+
+    print(f'JSON backend {JSON_BACKEND} , request {len(REQUEST)} bytes , response {len(encode_after())} bytes , flow body {len(body)} bytes')
+
+    for name , before , after in (
+        ('request decode' , decode_before , decode_after) , 
+        ('response encode' , encode_before , encode_after) , 
+        ('workflow body' , lambda : workflow_before(assets) , lambda : workflow_after(assets))
+    ) : 
+
+        before_us : float = measure(before)
+        after_us : float = measure(after)
+
+        print(f'{name:<16} : before {before_us:8.2f} us , after {after_us:8.2f} us , {before_us / after_us:5.1f}x')
+
+if __name__ == '__main__' : asyncio.run(main())
@@ -0,0 +1,80 @@
+'''
+Time to first token of `/add-scenario` generations with Gemini context caching off and
+on, against the fake Gemini client, whose time to first token grows with the prompt
+characters it has to read (`PREFILL_LATENCY` seconds per thousand, cached ones excluded).
+The ratio depends on that model of prefill; in production compare the
+`vps_gemini_time_to_first_token_seconds` series by their `context_cache` label.
+
+Usage : python benchmarks/context_cache.py
+'''
+
+import asyncio
+import statistics
+import time
+
+import yaml
+
+import vps.llm.context_cache as context_cache_module
+from vps.assets import AssetRegistry
+from vps.llm import configure_context_cache , run_json_gemini
+from vps.metrics import GEMINI_TOKENS
+from vps.services import json_to_google_chat
+from stand_ins import FakeGeminiClient
+
+GENERATIONS : int = 30
+PREFILL_LATENCY : float = 0.02
+
+def tokens(model : str , kind : str) -> float : return GEMINI_TOKENS.labels(model , kind).value
+
+async def run(config : dict , assets , enabled : bool) -> None : 
+
+    scenario_config : dict = config['add-scenario']
+    model : str = scenario_config['model']
+
+    context_cache = configure_context_cache({**config['context-cache'] , 'enabled' : enabled}) if enabled else None
+    context_cache_module._context_cache = context_cache
+
+    gemini_client = FakeGeminiClient(token_latency = 0.001 , prefill_latency = PREFILL_LATENCY)
+
+    before : dict[str , float] = {kind : tokens(model , kind) for kind in ('prompt' , 'cached' , 'uncached')}
+    first_tokens : list[float] = []
+
+    for index in range(GENERATIONS) : 
+
+        contents : list = await json_to_google_chat([{'role' : 'user' , 'content' : f'A knee injury in a runner , case {index}'}])
+
+        start_time : float = time.perf_counter()
+        first : list[float] = []
+
+        await run_json_gemini(
+            gemini_client = gemini_client , 
+            contents = contents , 
+            generation_config = assets.get('add-scenario').generation_config , 
+            model = model , 
+            on_text = lambda text : first or first.append(time.perf_counter() - start_time)
+        )
+
+        first_tokens.append(first[0])
+
+    if context_cache is not None : await context_cache.stop()
+
+    used : dict[str , float] = {kind : tokens(model , kind) - before[kind] for kind in before}
+
+    print(
+        f'context cache {"on " if enabled else "off"} : TTFT p50 {statistics.median(first_tokens) * 1e3:6.1f} ms , '
+        f'max {max(first_tokens) * 1e3:6.1f} ms , prompt tokens {used["prompt"]:.0f} of which cached {used["cached"]:.0f} , '
+        f'uncached {used["uncached"]:.0f}'
+    )
+
+async def main() -> None : 
+
+    with open('config.yml') as file : config : dict = yaml.safe_load(file)
+
+    assets = AssetRegistry({name : config[name] for name in ('add-scenario' , 'edit-scenario')})
+    await assets.load()
+
+    print(f'{GENERATIONS} generations with the {len(assets.get("add-scenario").system_prompt)} character scenario prompt , {PREFILL_LATENCY * 1e3:.0f} ms of prefill per thousand characters')
+
+    for enabled in (False , True) : await run(config , assets , enabled)
+
+if __name__ == '__main__' : asyncio.run(main())
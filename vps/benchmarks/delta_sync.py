@@ -0,0 +1,129 @@
+'''
+Bytes sent to Voxio and Voxio round trips per `/edit-scenario`, with the full flow
+document on every edit, with JSON Patch against the last synced flow, and with the
+patch gzipped. Runs against the fake Gemini, an in-memory Mongo and a local fake
+Voxio server that counts what it receives.
+
+Each mode edits every scenario with a new generation, then once more with the same
+generation again, which no longer needs a Voxio write at all.
+
+Usage : python benchmarks/delta_sync.py
+'''
+
+import asyncio
+import os
+
+for name in ('ALLOWED_ORIGINS' , 'ALLOWED_CREDENTIALS' , 'ALLOWED_METHODS' , 'ALLOWED_HEADERS') : os.environ.setdefault(name , '')
+os.environ.setdefault('VOXIO_API_KEY' , 'benchmark')
+
+import httpx
+import yaml
+
+import vps.app as app_module
+from vps.admission import Admission
+from vps.assets import AssetRegistry
+from vps.cache import ResultCache
+from vps.loader import load_scenario_repository , load_voxio_client
+from vps.startup import LazyClient , Startup
+from stand_ins import FAKE_SCENARIO , FakeGeminiClient , FakeMongoClient , create_fake_voxio_app , free_port , serve_in_thread
+
+SCENARIOS : int = 20
+
+MODES : dict[str , dict] = {
+    'full document' : {'patch' : False , 'gzip' : False} , 
+    'json patch' : {'patch' : True , 'gzip' : False} , 
+    'json patch + gzip' : {'patch' : True , 'gzip' : True}
+}
+
+def voxio_writes(stats : dict) -> tuple[int , int] : return (
+    sum(stats.get(f'{method} requests' , 0) for method in ('PUT' , 'PATCH')) , 
+    sum(stats.get(f'{method} bytes' , 0) for method in ('PUT' , 'PATCH'))
+)
+
+async def run(config : dict , port : int , stats : dict , name : str , delta_sync : dict) -> None : 
+
+    state = app_module.state
+
+    state.voxio_client = load_voxio_client({
+        **config['voxio'] , 
+        'base-url' : f'http://127.0.0.1:{port}' , 
+        'http2' : False , 
+        'delta-sync' : {**config['voxio']['delta-sync'] , **delta_sync}
+    })
+    state.scenario_repository = load_scenario_repository(FakeMongoClient() , config['mongo'])
+
+    models = (await state.gemini_client.get()).aio.models
+    models.payload = FAKE_SCENARIO
+
+    async with httpx.AsyncClient(transport = httpx.ASGITransport(app = app_module.app) , base_url = 'http://vps' , timeout = 120) as client : 
+
+        async def edit(api_key : str) -> None : 
+
+            response = await client.post('/edit-scenario' , json = {'api_key' : api_key , 'scenario_prompt' : 'Make it harder'})
+
+            assert response.status_code == 200 and response.json()['response']['status'] == 'success' , response.text
+
+        api_keys : list[str] = []
+
+        for index in range(SCENARIOS) : 
+
+            response = await client.post('/add-scenario' , json = {'scenario_prompt' : f'Scenario {index}'})
+            api_keys.append(response.json()['response']['api_key'])
+
+        # * A different scenario prompt and question list from every edit generation
+        models.payload = {
+            **FAKE_SCENARIO , 
+            'scenario_prompt' : FAKE_SCENARIO['scenario_prompt'] + ' The patient is now anxious.' , 
+            'questions_for_feedback' : FAKE_SCENARIO['questions_for_feedback'] + ['Did the student calm the patient?']
+        }
+
+        stats.clear()
+
+        for api_key in api_keys : await edit(api_key)
+
+        changed_requests , changed_bytes = voxio_writes(stats)
+        stats.clear()
+
+        for api_key in api_keys : await edit(api_key)
+
+        same_requests , same_bytes = voxio_writes(stats)
+
+    await state.voxio_client.aclose()
+
+    print(
+        f'{name:<18} : changed edit {changed_bytes / SCENARIOS:8.0f} bytes in {changed_requests / SCENARIOS:.1f} Voxio writes , '
+        f'repeated edit {same_bytes / SCENARIOS:8.0f} bytes in {same_requests / SCENARIOS:.1f} Voxio writes , '
+        f'client {state.voxio_client.stats}'
+    )
+
+async def main() -> None : 
+
+    with open('config.yml') as file : config : dict = yaml.safe_load(file)
+
+    stats : dict = {}
+    port : int = free_port()
+    serve_in_thread(create_fake_voxio_app(latency = 0.001 , stats = stats) , port)
+
+    state = app_module.state
+    state.config = config
+    state.admission = Admission({**config['admission'] , 'enabled' : False})
+
+    gemini_client = FakeGeminiClient(token_latency = 0.0005)
+    state.gemini_client = LazyClient(lambda : gemini_client)
+    await state.gemini_client.get()
+
+    state.assets = AssetRegistry({name : config[name] for name in ('add-scenario' , 'edit-scenario')})
+    await state.assets.load()
+
+    state.generation_cache = None
+    state.idempotency = ResultCache(None , config['idempotency'])
+
+    state.startup = Startup()
+    state.startup.start()
+    await state.startup.wait()
+
+    print(f'{SCENARIOS} scenarios , each edited with a new generation and then with the same one again')
+
+    for name , delta_sync in MODES.items() : await run(config , port , stats , name , delta_sync)
+
+if __name__ == '__main__' : asyncio.run(main())
@@ -0,0 +1,91 @@
+'''
+Stage timeline of `edit_scenario_route` against the fake Gemini, a local fake Voxio
+server and an in-memory Mongo stand-in : when each stage starts and how long it takes,
+next to the wall time of the edit and the time the same stages would take in series.
+
+Usage : python benchmarks/edit_pipeline.py [runs]
+'''
+
+import asyncio
+import statistics
+import sys
+import time
+
+import yaml
+
+from vps.assets import AssetRegistry
+from vps.metrics import stage_listener_var
+from vps.repository import ScenarioRepository
+from vps.routers import add_scenario_route , edit_scenario_route
+from vps.voxio import VoxioClient
+from stand_ins import FakeGeminiClient , FakeMongoClient , create_fake_voxio_app , free_port , serve_in_thread
+
+RUNS : int = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+async def main() -> None : 
+
+    with open('config.yml') as file : config : dict = yaml.safe_load(file)
+
+    port : int = free_port()
+    serve_in_thread(create_fake_voxio_app(latency = 0.05) , port)
+
+    assets = AssetRegistry({name : config[name] for name in ('add-scenario' , 'edit-scenario')})
+    await assets.load()
+
+    voxio_client = VoxioClient(f'http://127.0.0.1:{port}' , 'benchmark' , {**config['voxio'] , 'http2' : False})
+    gemini_client = FakeGeminiClient(token_latency = 0.01 , chunk_count = 50)
+    repository = ScenarioRepository(FakeMongoClient(latency = 0.02)['vps']['scenarios'] , config['mongo'])
+
+    added : dict = await add_scenario_route(
+        query = 'Shoulder pain' , 
+        scenario_repository = repository , 
+        gemini_client = gemini_client , 
+        voxio_client = voxio_client , 
+        assets = assets.get('add-scenario') , 
+        config = config['add-scenario']
+    )
+
+    starts : dict[str , list[float]] = {}
+    durations : dict[str , list[float]] = {}
+    walls : list[float] = []
+
+    for _ in range(RUNS) : 
+
+        start_time : float = time.perf_counter()
+
+        def on_stage(stage : str , duration : float | None) -> None : 
+
+            if duration is None : starts.setdefault(stage , []).append(time.perf_counter() - start_time)
+            else : durations.setdefault(stage , []).append(duration)
+
+        token = stage_listener_var.set(on_stage)
+
+        try : response : dict = await edit_scenario_route(
+            query = 'Make the patient more anxious' , 
+            scenario_repository = repository , 
+            gemini_client = gemini_client , 
+            voxio_client = voxio_client , 
+            assets = assets.get('edit-scenario') , 
+            config = config['edit-scenario'] , 
+            api_key = added['api_key']
+        )
+
+        finally : stage_listener_var.reset(token)
+
+        walls.append(time.perf_counter() - start_time)
+
+        assert response['status'] == 'success' , response
+
+    print(f'{"stage":<18} {"start ms":>9} {"duration ms":>12}')
+
+    for stage in sorted(starts , key = lambda stage : statistics.median(starts[stage])) : 
+
+        print(f'{stage:<18} {statistics.median(starts[stage]) * 1e3:9.1f} {statistics.median(durations[stage]) * 1e3:12.1f}')
+
+    serial : float = sum(statistics.median(values) for values in durations.values())
+
+    print(f'\nwall {statistics.median(walls) * 1e3:.1f} ms , stages in series {serial * 1e3:.1f} ms , {RUNS} runs')
+
+    await voxio_client.aclose()
+
+if __name__ == '__main__' : asyncio.run(main())
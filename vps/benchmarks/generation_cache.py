@@ -0,0 +1,126 @@
+'''
+Single-flight and cancellation of the generation cache, with the `generation-cache`
+section of config.yml and no Mongo tier, against the fake Gemini client :
+
+- concurrent identical `/add-scenario` generations share one Gemini stream;
+- a shared run goes on while one of its callers is left, and is cancelled with the last;
+- a detached cache, as the idempotency keys use, lets a run go on without callers;
+- a streamed generation bypasses the cache, so it still sees its text arrive.
+
+Every check is asserted; the time of the shared generations is printed.
+
+Usage : python benchmarks/generation_cache.py
+'''
+
+import asyncio
+import time
+
+import yaml
+
+from vps.assets import AssetRegistry
+from vps.cache import ResultCache
+from vps.routers.routers import generate_scenario
+from stand_ins import FakeGeminiClient
+
+CALLERS : int = 8
+RUN_SECONDS : float = 0.2
+
+class Run :
+    '''
+    A cached run that records how it ended.
+    '''
+
+    def __init__(self) -> None : self.outcome : str = 'running'
+
+    async def __call__(self) -> dict :
+
+        try : await asyncio.sleep(RUN_SECONDS)
+
+        except asyncio.CancelledError :
+
+            self.outcome = 'cancelled'
+            raise
+
+        self.outcome = 'finished'
+
+        return {'value' : 1}
+
+async def left(cache : ResultCache , key : str , run : Run , callers : int , leaving : int) -> list :
+    '''
+    Starts `callers` callers of one key and cancels `leaving` of them halfway through the run.
+    '''
+
+    tasks : list[asyncio.Task] = [asyncio.create_task(cache.get_or_run(key , run)) for _ in range(callers)]
+
+    await asyncio.sleep(RUN_SECONDS / 2)
+
+    for task in tasks[: leaving] : task.cancel()
+
+    return await asyncio.gather(*tasks , return_exceptions = True)
+
+async def main() -> None :
+
+    with open('config.yml') as config_file : config : dict = yaml.safe_load(config_file)
+
+    registry = AssetRegistry({'add-scenario' : config['add-scenario']})
+    await registry.load()
+
+    assets = registry.get('add-scenario')
+    cache = ResultCache(None , config['generation-cache'])
+
+    gemini_client = FakeGeminiClient(token_latency = 0.005 , chunk_count = 50)
+    models = gemini_client.aio.models
+    streams : list[int] = [0]
+    stream = models.generate_content_stream
+
+    async def counted(**kwargs) :
+
+        streams[0] += 1
+
+        return await stream(**kwargs)
+
+    models.generate_content_stream = counted
+
+    def generate(query : str , on_text = None) : return generate_scenario(
+        query = query , 
+        gemini_client = gemini_client , 
+        assets = assets , 
+        config = config['add-scenario'] , 
+        generation_cache = cache , 
+        on_text = on_text
+    )
+
+    start_time : float = time.perf_counter()
+    results : list[dict] = await asyncio.gather(*(generate('A knee injury in a runner') for _ in range(CALLERS)))
+
+    assert streams[0] == 1 and all(result == results[0] for result in results) , streams
+    print(f'{CALLERS} identical generations : {streams[0]} Gemini stream , {(time.perf_counter() - start_time) * 1e3:.0f} ms , {cache.stats}')
+
+    run = Run()
+    outcomes : list = await left(cache , 'one-left' , run , 2 , 1)
+
+    assert run.outcome == 'finished' and outcomes[1] == {'value' : 1} , (run.outcome , outcomes)
+    print(f'one of two callers left : the run {run.outcome} for the other')
+
+    run = Run()
+    outcomes = await left(cache , 'all-left' , run , 2 , 2)
+    await asyncio.sleep(0)
+
+    assert run.outcome == 'cancelled' and not cache.inflight , (run.outcome , cache.inflight)
+    print(f'every caller left : the run was {run.outcome} , {cache.stats["abandoned"]} abandoned')
+
+    detached = ResultCache(None , config['idempotency'] , detached = True)
+    run = Run()
+    await left(detached , 'detached' , run , 1 , 1)
+    await asyncio.sleep(RUN_SECONDS)
+
+    assert run.outcome == 'finished' and await detached.get('detached') == {'value' : 1} , run.outcome
+    print(f'detached cache , its caller left : the run {run.outcome} and was kept')
+
+    texts : list[str] = []
+    await generate('A knee injury in a runner' , texts.append)
+
+    assert streams[0] == 2 and texts , streams
+    print(f'streamed generation of a cached query : {len(texts)} text chunks from a Gemini stream of its own')
+
+if __name__ == '__main__' : asyncio.run(main())
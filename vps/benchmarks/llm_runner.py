@@ -0,0 +1,47 @@
+'''
+Throughput of `run_gemini` against the fake Gemini stand-in at rising concurrency.
+
+Usage : python benchmarks/llm_runner.py
+'''
+
+import asyncio
+import time
+
+from google.genai.types import GenerateContentConfig
+
+from vps.llm import run_gemini
+from stand_ins import FakeGeminiClient
+
+async def measure(
+    client : FakeGeminiClient , 
+    concurrency : int , 
+    requests : int
+) -> float : 
+
+    queue : asyncio.Queue = asyncio.Queue()
+    for _ in range(requests) : queue.put_nowait(None)
+
+    async def worker() : 
+
+        while not queue.empty() : 
+
+            queue.get_nowait()
+            await run_gemini(client , [] , GenerateContentConfig() , 'fake-model' , max_concurrency = 256)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return requests / (time.perf_counter() - start_time)
+
+async def main() -> None : 
+
+    client = FakeGeminiClient(token_latency = 0.01 , chunk_count = 50)
+
+    print(f'{"concurrency":>12} {"req/s":>10}')
+
+    for concurrency in (1 , 4 , 16 , 64) : 
+
+        throughput : float = await measure(client , concurrency , requests = concurrency * 4)
+        print(f'{concurrency:>12} {throughput:>10.2f}')
+
+if __name__ == '__main__' : asyncio.run(main())
@@ -0,0 +1,327 @@
+'''
+Offline end-to-end load test. Boots `vps.app` through `vps.server.serve` (as
+`stand_in_app:app`) against a fake Voxio server, a fake Deepgram server used by the
+real Deepgram client, the fake streaming Gemini client and an in-memory Mongo, then
+drives mixed `/add-scenario`, `/edit-scenario`, `/stt` and `/tts` traffic at each
+concurrency level in turn.
+
+Every level records throughput, p50/p95/p99 latency overall and per endpoint, the
+event loop lag and the memory of the server, and the whole run is written as JSON
+with the commit it ran on. `--compare` prints how a run moved against an earlier report.
+
+The load generator runs in this process and shares the cores of the machine with
+the server, so compare reports taken on the same machine.
+
+Usage : python benchmarks/load_test.py [--concurrency 8 32] [--duration 10] [--output report.json] [--compare baseline.json]
+'''
+
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+import uvicorn
+
+from stand_ins import create_fake_deepgram_app , create_fake_voxio_app , free_port
+
+# * Share of requests per endpoint
+MIX : dict[str , float] = {
+    'add-scenario' : 0.3 , 
+    'edit-scenario' : 0.3 , 
+    'stt' : 0.2 , 
+    'tts' : 0.2
+}
+
+SEED_SCENARIOS : int = 20
+TTS_TEXTS : int = 50
+AUDIO_BYTES : int = 64 * 1024
+
+ENVIRONMENT : dict[str , str] = {
+    'ALLOWED_ORIGINS' : '' , 
+    'ALLOWED_CREDENTIALS' : '' , 
+    'ALLOWED_METHODS' : '' , 
+    'ALLOWED_HEADERS' : '' , 
+    'MONGO_URL' : 'mongodb://127.0.0.1:1' , 
+    'DEEPGRAM_API_KEY' : 'benchmark' , 
+    'GEMINI_API_KEY' : 'benchmark' , 
+    'VOXIO_API_KEY' : 'benchmark'
+}
+
+def run_fake(name : str , port : int) -> None : 
+
+    app = create_fake_voxio_app() if name == 'voxio' else create_fake_deepgram_app()
+
+    uvicorn.run(app , host = '127.0.0.1' , port = port , log_level = 'warning')
+
+def run_server(workers : int , port : int) -> None : 
+
+    from vps.loader import load_config
+    from vps.server import serve
+
+    serve('stand_in_app:app' , {**load_config()['server'] , 'host' : '127.0.0.1' , 'port' : port , 'workers' : workers})
+
+def wait_ready(port : int , timeout : float = 60) -> None : 
+
+    deadline : float = time.time() + timeout
+
+    while True : 
+
+        if time.time() > deadline : raise TimeoutError('The server never became ready.')
+
+        try : 
+            if httpx.get(f'http://127.0.0.1:{port}/ready').status_code == 200 : return
+
+        except httpx.HTTPError : pass
+
+        time.sleep(0.1)
+
+def quantiles(latencies : list[float]) -> dict : 
+
+    if not latencies : return {}
+
+    ordered : list[float] = sorted(latencies)
+
+    def at(q : float) -> float : return ordered[min(len(ordered) - 1 , int(q * len(ordered)))]
+
+    return {
+        'mean' : sum(ordered) / len(ordered) , 
+        'p50' : at(0.5) , 
+        'p95' : at(0.95) , 
+        'p99' : at(0.99) , 
+        'max' : ordered[-1]
+    }
+
+class Traffic : 
+    '''
+    Builds the requests of the mix and records what came back.
+    '''
+
+    def __init__(self , client : httpx.AsyncClient , api_keys : list[str]) -> None : 
+
+        self.client = client
+        self.api_keys = api_keys
+        self.audio : bytes = os.urandom(AUDIO_BYTES)
+
+        self.latencies : dict[str , list[float]] = {endpoint : [] for endpoint in MIX}
+        self.statuses : dict[str , dict[str , int]] = {endpoint : {} for endpoint in MIX}
+
+    async def send(self , endpoint : str) -> httpx.Response : 
+
+        if endpoint == 'add-scenario' : return await self.client.post('/add-scenario' , json = {'scenario_prompt' : f'A sprained ankle in a footballer , case {random.random()}'})
+
+        if endpoint == 'edit-scenario' : return await self.client.post('/edit-scenario' , json = {
+            'api_key' : random.choice(self.api_keys) , 
+            'scenario_prompt' : 'Make the patient more anxious'
+        })
+
+        if endpoint == 'stt' : return await self.client.post('/stt' , files = {'file' : ('sample.wav' , self.audio , 'audio/wav')})
+
+        # * A fixed pool of lines, so the TTS cache sees repeats as it would in practice
+        return await self.client.post('/tts' , params = {'text' : f'Please describe line {random.randrange(TTS_TEXTS)} of your symptoms.'})
+
+    async def user(self , deadline : float) -> None : 
+
+        endpoints : list[str] = list(MIX)
+        weights : list[float] = list(MIX.values())
+
+        while time.perf_counter() < deadline : 
+
+            endpoint : str = random.choices(endpoints , weights)[0]
+            start_time : float = time.perf_counter()
+
+            try : 
+
+                response : httpx.Response = await self.send(endpoint)
+                status : str = str(response.status_code)
+
+            except httpx.HTTPError as e : status = type(e).__name__
+
+            self.latencies[endpoint].append(time.perf_counter() - start_time)
+            self.statuses[endpoint][status] = self.statuses[endpoint].get(status , 0) + 1
+
+async def seed(client : httpx.AsyncClient) -> list[str] : 
+    '''
+    Adds the scenarios the edits of the mix work on.
+    '''
+
+    responses : list[httpx.Response] = await asyncio.gather(*(
+        client.post('/add-scenario' , json = {'scenario_prompt' : f'Seed scenario {index}'})
+        for index in range(SEED_SCENARIOS)
+    ))
+
+    scenarios : list[dict] = [response.json()['response'] for response in responses if response.status_code == 200]
+
+    return [scenario['api_key'] for scenario in scenarios if scenario.get('api_key')]
+
+async def run_level(port : int , api_keys : list[str] , concurrency : int , duration : float) -> dict : 
+
+    limits = httpx.Limits(max_connections = concurrency , max_keepalive_connections = concurrency)
+
+    async with httpx.AsyncClient(base_url = f'http://127.0.0.1:{port}' , timeout = 120 , limits = limits) as client : 
+
+        await client.get('/_bench/stats' , params = {'reset' : 'true'})
+
+        traffic = Traffic(client , api_keys)
+        start_time : float = time.perf_counter()
+
+        await asyncio.gather(*(traffic.user(start_time + duration) for _ in range(concurrency)))
+
+        elapsed : float = time.perf_counter() - start_time
+        server : dict = (await client.get('/_bench/stats')).json()
+
+    latencies : list[float] = [latency for endpoint in MIX for latency in traffic.latencies[endpoint]]
+    errors : int = sum(count for endpoint in MIX for status , count in traffic.statuses[endpoint].items() if status != '200')
+
+    return {
+        'concurrency' : concurrency , 
+        'seconds' : elapsed , 
+        'requests' : len(latencies) , 
+        'errors' : errors , 
+        'throughput' : len(latencies) / elapsed , 
+        'latency_seconds' : quantiles(latencies) , 
+        'endpoints' : {
+            endpoint : {
+                'requests' : len(traffic.latencies[endpoint]) , 
+                'statuses' : traffic.statuses[endpoint] , 
+                'latency_seconds' : quantiles(traffic.latencies[endpoint])
+            }
+            for endpoint in MIX
+        } , 
+        'loop_lag_seconds' : server['loop_lag_seconds'] , 
+        'rss_bytes' : server.get('rss_bytes') , 
+        'peak_rss_bytes' : server['peak_rss_bytes']
+    }
+
+def commit() -> str | None : 
+
+    try : return subprocess.run(['git' , 'rev-parse' , '--short' , 'HEAD'] , capture_output = True , text = True , check = True).stdout.strip()
+
+    except (OSError , subprocess.CalledProcessError) : return None
+
+def print_level(level : dict) -> None : 
+
+    latency : dict = level['latency_seconds']
+    lag : dict = level['loop_lag_seconds']
+
+    print(
+        f'concurrency {level["concurrency"]:>3} : {level["throughput"]:7.1f} requests/s , '
+        f'p50 {latency.get("p50" , 0) * 1e3:7.1f} ms , p95 {latency.get("p95" , 0) * 1e3:7.1f} ms , p99 {latency.get("p99" , 0) * 1e3:7.1f} ms , '
+        f'{level["errors"]} errors , loop lag p99 {lag.get("p99" , 0) * 1e3:5.1f} ms , RSS {(level["rss_bytes"] or 0) / 2 ** 20:6.1f} MiB'
+    )
+
+def compare(report : dict , baseline : dict) -> None : 
+
+    print(f'against {baseline.get("commit")} :')
+
+    levels : dict[int , dict] = {level['concurrency'] : level for level in baseline['levels']}
+
+    for level in report['levels'] : 
+
+        before : dict | None = levels.get(level['concurrency'])
+
+        if before is None : continue
+
+        def change(now : float , then : float) -> str : return f'{(now - then) / then * 100:+6.1f}%' if then else '   n/a'
+
+        print(
+            f'  concurrency {level["concurrency"]:>3} : throughput {change(level["throughput"] , before["throughput"])} , '
+            f'p50 {change(level["latency_seconds"]["p50"] , before["latency_seconds"]["p50"])} , '
+            f'p99 {change(level["latency_seconds"]["p99"] , before["latency_seconds"]["p99"])} , '
+            f'RSS {change(level["rss_bytes"] or 0 , before["rss_bytes"] or 0)}'
+        )
+
+def main() -> None : 
+
+    parser = argparse.ArgumentParser(description = 'Offline end-to-end load test of vps.')
+    parser.add_argument('--concurrency' , type = int , nargs = '+' , default = [8 , 32])
+    parser.add_argument('--duration' , type = float , default = 10.0 , help = 'Seconds per concurrency level.')
+    parser.add_argument('--workers' , type = int , default = 1 , help = 'Server workers, loop lag and memory come from one of them.')
+    parser.add_argument('--token-latency' , type = float , default = 0.002 , help = 'Seconds between fake Gemini chunks.')
+    parser.add_argument('--output' , help = 'Where to write the JSON report, stdout by default.')
+    parser.add_argument('--compare' , help = 'An earlier JSON report to compare against.')
+    arguments = parser.parse_args()
+
+    os.environ.update(ENVIRONMENT)
+    os.environ['VPS_STAND_IN_TOKEN_LATENCY'] = str(arguments.token_latency)
+
+    context = multiprocessing.get_context('spawn')
+    fakes : list = []
+
+    for name in ('voxio' , 'deepgram') : 
+
+        port : int = free_port()
+        os.environ[f'VPS_STAND_IN_{name.upper()}_PORT'] = str(port)
+
+        fake = context.Process(target = run_fake , args = (name , port) , daemon = True)
+        fake.start()
+        fakes.append(fake)
+
+    port = free_port()
+
+    server = subprocess.Popen(
+        [sys.executable , __file__ , '--serve' , str(arguments.workers) , str(port)] , 
+        stdout = subprocess.DEVNULL , 
+        stderr = subprocess.DEVNULL
+    )
+
+    report : dict = {
+        'commit' : commit() , 
+        'created' : datetime.datetime.now(datetime.timezone.utc).isoformat() , 
+        'cpu_count' : os.cpu_count() , 
+        'settings' : {
+            'workers' : arguments.workers , 
+            'duration' : arguments.duration , 
+            'token_latency' : arguments.token_latency , 
+            'mix' : MIX
+        } , 
+        'levels' : []
+    }
+
+    try : 
+
+        wait_ready(port)
+
+        async def run() -> None : 
+
+            async with httpx.AsyncClient(base_url = f'http://127.0.0.1:{port}' , timeout = 120) as client : api_keys : list[str] = await seed(client)
+
+            if not api_keys : raise RuntimeError('No scenario could be seeded, the server is not working.')
+
+            for concurrency in arguments.concurrency : 
+
+                level : dict = await run_level(port , api_keys , concurrency , arguments.duration)
+                report['levels'].append(level)
+
+                print_level(level)
+
+        asyncio.run(run())
+
+    finally : 
+
+        server.send_signal(signal.SIGTERM)
+        server.wait(60)
+
+        for fake in fakes : fake.terminate()
+
+    if arguments.output : 
+
+        with open(arguments.output , 'w') as file : json.dump(report , file , indent = 2)
+
+    else : print(json.dumps(report , indent = 2))
+
+    if arguments.compare : 
+
+        with open(arguments.compare) as file : compare(report , json.load(file))
+
+if __name__ == '__main__' : 
+
+    if '--serve' in sys.argv : run_server(int(sys.argv[2]) , int(sys.argv[3]))
+    else : main()
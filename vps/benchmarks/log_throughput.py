@@ -0,0 +1,72 @@
+'''
+Cost of a log call on the calling thread : the previous handler, which built a new
+`Formatter` per record and wrote synchronously, against the queued pipeline of `vps.logs`.
+
+Usage : python benchmarks/log_throughput.py
+'''
+
+import os
+import time
+from logging import Formatter , Logger , LogRecord , StreamHandler , getLogger , DEBUG
+
+import yaml
+
+from vps.logs import load_logger , stop_logger
+from vps.logs import logs
+
+RECORDS : int = 100_000
+
+class PerRecordFormatter(Formatter) : 
+
+    def __init__(self , fmt : str , config : dict) -> None : 
+
+        super().__init__(fmt , '')
+
+        self.color : str = config['color']['info']
+        self.reset : str = config['color']['reset']
+        self.fmt : str = fmt
+
+    def format(self , record : LogRecord) -> str : 
+
+        return Formatter(self.color + self.fmt + self.reset , self.datefmt).format(record)
+
+def records_per_second(logger : Logger) -> float : 
+
+    start_time = time.perf_counter()
+
+    for index in range(RECORDS) : logger.info(f'Scenario added with ID : {index}')
+
+    return RECORDS / (time.perf_counter() - start_time)
+
+def main() -> None : 
+
+    with open('config.yml') as file : config : dict = yaml.safe_load(file)['logger']
+
+    with open(os.devnull , 'w') as devnull : 
+
+        old_logger : Logger = getLogger('benchmark.old')
+        old_logger.setLevel(DEBUG)
+        old_logger.propagate = False
+
+        handler = StreamHandler(devnull)
+        handler.setFormatter(PerRecordFormatter(config['log-format'].replace(' - [%(request_id)s]' , '') , config))
+        old_logger.addHandler(handler)
+
+        old_rate : float = records_per_second(old_logger)
+
+        new_logger : Logger = load_logger(config)
+
+        # * The listener thread keeps writing, only the calling thread is measured
+        for console_handler in logs._listener.handlers : console_handler.setStream(devnull)
+
+        new_rate : float = records_per_second(new_logger)
+
+        drain_start = time.perf_counter()
+        stop_logger()
+        drain_time : float = time.perf_counter() - drain_start
+
+    print(f'per-record formatter, synchronous : {old_rate:>12,.0f} records/s')
+    print(f'queued, precompiled formatters    : {new_rate:>12,.0f} records/s')
+    print(f'listener drain after the run      : {drain_time * 1e3:>12.1f} ms')
+
+if __name__ == '__main__' : main()
@@ -0,0 +1,67 @@
+'''
+Overhead of the metrics layer : cost of a stage timer and of a histogram observation,
+and the latency added by `MetricsMiddleware` to a trivial endpoint.
+
+Usage : python benchmarks/metrics.py
+'''
+
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from vps.metrics import MetricsMiddleware , STAGE_SECONDS , stage_timer
+
+ITERATIONS : int = 200_000
+REQUESTS : int = 5_000
+
+def per_call(function , iterations : int = ITERATIONS) -> float : 
+
+    start_time = time.perf_counter()
+
+    for _ in range(iterations) : function()
+
+    return (time.perf_counter() - start_time) / iterations * 1e9
+
+def timed_stage() -> None : 
+
+    with stage_timer('benchmark') : pass
+
+def create_app(instrumented : bool) -> FastAPI : 
+
+    app = FastAPI()
+
+    @app.get('/ping')
+    async def ping() -> dict : return {'ok' : True}
+
+    if instrumented : app.add_middleware(MetricsMiddleware)
+
+    return app
+
+async def request_cost(app : FastAPI) -> float : 
+
+    async with httpx.AsyncClient(transport = httpx.ASGITransport(app = app) , base_url = 'http://bench') as client : 
+
+        for _ in range(200) : await client.get('/ping')
+
+        start_time = time.perf_counter()
+
+        for _ in range(REQUESTS) : await client.get('/ping')
+
+        return (time.perf_counter() - start_time) / REQUESTS * 1e6
+
+async def main() -> None : 
+
+    child = STAGE_SECONDS.labels('benchmark')
+
+    print(f'{"histogram observe":>22} {per_call(lambda : child.observe(0.01)):10.1f} ns')
+    print(f'{"stage timer":>22} {per_call(timed_stage):10.1f} ns')
+
+    bare : float = await request_cost(create_app(False))
+    instrumented : float = await request_cost(create_app(True))
+
+    print(f'{"request, bare":>22} {bare:10.1f} us')
+    print(f'{"request, middleware":>22} {instrumented:10.1f} us ({instrumented - bare:+.1f} us)')
+
+if __name__ == '__main__' : asyncio.run(main())
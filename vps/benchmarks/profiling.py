@@ -0,0 +1,101 @@
+'''
+What each diagnostic of `vps.profiling` costs while it runs, and that it costs nothing
+once it is off : a CPU-bound slice of the scenario pipeline (streaming a generation
+through `StringFieldStream`, rendering the flow body, encoding the response) runs as
+event loop tasks with every diagnostic off, then with each one on in turn, then off again.
+The single-core runs of this benchmark vary by several percent between identical passes.
+
+Usage : python benchmarks/profiling.py
+'''
+
+import asyncio
+import json
+import time
+import tracemalloc
+
+import yaml
+
+from vps.assets import AssetRegistry
+from vps.codec import dumps
+from vps.llm import StringFieldStream
+from vps.profiling import Profiling
+from stand_ins import FAKE_SCENARIO
+
+SECONDS : float = 2.0
+CHUNK_CHARS : int = 64
+
+GENERATION : str = json.dumps(FAKE_SCENARIO)
+CHUNKS : list[str] = [GENERATION[index : index + CHUNK_CHARS] for index in range(0 , len(GENERATION) , CHUNK_CHARS)]
+
+async def workload(assets , deadline : float) -> int : 
+
+    done : int = 0
+
+    while time.perf_counter() < deadline : 
+
+        fields = StringFieldStream(('scenario_name' , 'scenario_prompt'))
+
+        for chunk in CHUNKS : fields.feed(chunk)
+
+        assets.flow_template.render(FAKE_SCENARIO['scenario_name'] , FAKE_SCENARIO)
+        dumps({'response' : FAKE_SCENARIO})
+
+        done += 1
+
+        # * Yield like a request between two awaits
+        await asyncio.sleep(0)
+
+    return done
+
+async def throughput(assets , diagnostic = None) -> float : 
+
+    start_time : float = time.perf_counter()
+    deadline : float = start_time + SECONDS
+
+    runs : list = [workload(assets , deadline) for _ in range(4)]
+
+    if diagnostic is not None : runs.append(diagnostic())
+
+    results : list = await asyncio.gather(*runs)
+
+    return sum(results[: 4]) / (time.perf_counter() - start_time)
+
+async def main() -> None : 
+
+    with open('config.yml') as config_file : config : dict = yaml.safe_load(config_file)
+
+    registry = AssetRegistry({'add-scenario' : config['add-scenario']})
+    await registry.load()
+
+    assets = registry.get('add-scenario')
+    profiling = Profiling(config['profiling'])
+
+    # * What runs when every diagnostic is off, to check it is all put back afterwards
+    untouched : tuple = (asyncio.Handle._run , StringFieldStream.feed , tracemalloc.is_tracing())
+
+    async def traced() -> None : 
+
+        await profiling.memory.start(config['profiling']['tracemalloc-frames'])
+        await asyncio.sleep(SECONDS)
+        await profiling.memory.diff(config['profiling']['top'])
+        profiling.memory.stop()
+
+    baseline : float = await throughput(assets)
+
+    print(f'{"all off":<22} : {baseline:9.0f} scenarios/s')
+
+    for name , diagnostic in (
+        ('cpu profile' , lambda : profiling.cpu.profile(SECONDS)) , 
+        ('loop monitor' , lambda : profiling.loop.monitor(SECONDS)) , 
+        ('method timers' , lambda : profiling.methods.time(SECONDS)) , 
+        ('tracemalloc' , traced) , 
+        ('all off again' , None)
+    ) : 
+
+        rate : float = await throughput(assets , diagnostic)
+
+        print(f'{name:<22} : {rate:9.0f} scenarios/s , {(rate - baseline) / baseline * 100:+6.1f}%')
+
+    print(f'loop handles, marked methods and tracemalloc back as they were : {(asyncio.Handle._run , StringFieldStream.feed , tracemalloc.is_tracing()) == untouched}')
+
+if __name__ == '__main__' : asyncio.run(main())
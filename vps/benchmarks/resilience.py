@@ -0,0 +1,167 @@
+'''
+Failure handling of the upstream calls against injected faults : 
+
+- `GET /flow` latency with hedging off and on, when a few Voxio answers are slow.
+- The cost of a call to a failing Voxio, with the circuit breaker effectively off and on.
+- `POST /edit-scenario` against a stalled Gemini, without and with an `x-request-timeout`.
+
+Usage : python benchmarks/resilience.py
+'''
+
+import asyncio
+import os
+import statistics
+import time
+
+for name in ('ALLOWED_ORIGINS' , 'ALLOWED_CREDENTIALS' , 'ALLOWED_METHODS' , 'ALLOWED_HEADERS') : os.environ.setdefault(name , '')
+os.environ.setdefault('VOXIO_API_KEY' , 'benchmark')
+
+import httpx
+import yaml
+
+import vps.app as app_module
+from vps.admission import Admission
+from vps.assets import AssetRegistry
+from vps.cache import ResultCache
+from vps.loader import load_scenario_repository , load_voxio_client
+from vps.resilience import CircuitOpen , configure_breakers
+from vps.startup import LazyClient , Startup
+from stand_ins import FakeGeminiClient , FakeMongoClient , create_fake_voxio_app , free_port , serve_in_thread
+
+FLOW_CALLS : int = 400
+FLOW_CONCURRENCY : int = 4
+FAILING_CALLS : int = 50
+GEMINI_STALL : float = 20.0
+REQUEST_TIMEOUT : float = 2.0
+
+def quantile(latencies : list[float] , q : float) -> float : return sorted(latencies)[min(len(latencies) - 1 , int(q * len(latencies)))]
+
+async def flow_latencies(voxio_client) -> list[float] : 
+
+    latencies : list[float] = []
+    semaphore = asyncio.Semaphore(FLOW_CONCURRENCY)
+
+    async def call(index : int) -> None : 
+
+        async with semaphore : 
+
+            start_time : float = time.perf_counter()
+            await voxio_client.get_flow(f'key-{index}')
+            latencies.append(time.perf_counter() - start_time)
+
+    await asyncio.gather(*(call(index) for index in range(FLOW_CALLS)))
+
+    return latencies
+
+async def hedging(config : dict , port : int , faults : dict) -> None : 
+
+    faults.update({'slow-ratio' : 0.03 , 'slow-latency' : 0.5 , 'error-ratio' : 0})
+
+    print(f'{FLOW_CALLS} flow lookups , {FLOW_CONCURRENCY} at a time , 3% of answers take 500 ms')
+
+    for enabled in (False , True) : 
+
+        voxio_client = load_voxio_client({
+            **config['voxio'] , 
+            'base-url' : f'http://127.0.0.1:{port}' , 
+            'http2' : False , 
+            'hedge' : {**config['voxio']['hedge'] , 'enabled' : enabled}
+        })
+
+        latencies : list[float] = await flow_latencies(voxio_client)
+
+        await voxio_client.aclose()
+
+        print(
+            f'  hedging {"on " if enabled else "off"} : p50 {statistics.median(latencies) * 1e3:6.1f} ms , '
+            f'p95 {quantile(latencies , 0.95) * 1e3:6.1f} ms , p99 {quantile(latencies , 0.99) * 1e3:6.1f} ms'
+        )
+
+async def breaker(config : dict , port : int , faults : dict) -> None : 
+
+    faults.update({'slow-ratio' : 0 , 'error-ratio' : 1.0})
+
+    print(f'{FAILING_CALLS} flow lookups against a Voxio answering 503 to everything')
+
+    for threshold in (10 ** 9 , config['resilience']['breakers']['voxio']['failure-threshold']) : 
+
+        configure_breakers({'voxio' : {**config['resilience']['breakers']['voxio'] , 'failure-threshold' : threshold}})
+
+        voxio_client = load_voxio_client({**config['voxio'] , 'base-url' : f'http://127.0.0.1:{port}' , 'http2' : False})
+
+        latencies : list[float] = []
+        fast_failures : int = 0
+
+        for index in range(FAILING_CALLS) : 
+
+            start_time : float = time.perf_counter()
+
+            try : await voxio_client.get_flow(f'key-{index}')
+            except CircuitOpen : fast_failures += 1
+
+            latencies.append(time.perf_counter() - start_time)
+
+        await voxio_client.aclose()
+
+        print(
+            f'  breaker {"on " if threshold < 10 ** 9 else "off"} : {sum(latencies):6.2f} s in total , '
+            f'mean {statistics.mean(latencies) * 1e3:7.1f} ms per call , {fast_failures} failed fast'
+        )
+
+    faults.update({'error-ratio' : 0})
+    configure_breakers(config['resilience']['breakers'])
+
+async def deadline(config : dict , port : int) -> None : 
+
+    state = app_module.state
+
+    state.config = config
+    state.admission = Admission({**config['admission'] , 'enabled' : False})
+
+    gemini_client = FakeGeminiClient(token_latency = 0.001 , stall = GEMINI_STALL)
+    state.gemini_client = LazyClient(lambda : gemini_client)
+    await state.gemini_client.get()
+
+    state.voxio_client = load_voxio_client({**config['voxio'] , 'base-url' : f'http://127.0.0.1:{port}' , 'http2' : False})
+    state.assets = AssetRegistry({name : config[name] for name in ('add-scenario' , 'edit-scenario')})
+    await state.assets.load()
+
+    state.generation_cache = None
+    state.idempotency = ResultCache(None , config['idempotency'])
+
+    state.scenario_repository = load_scenario_repository(FakeMongoClient() , config['mongo'])
+    await state.scenario_repository.insert({'api_key' : 'stalled' , 'scenario_name' : 'stalled'})
+
+    state.startup = Startup()
+    state.startup.start()
+    await state.startup.wait()
+
+    print(f'/edit-scenario while Gemini stalls for {GEMINI_STALL:.0f}s before its first token')
+
+    async with httpx.AsyncClient(transport = httpx.ASGITransport(app = app_module.app) , base_url = 'http://vps' , timeout = 120) as client : 
+
+        for headers in ({} , {'x-request-timeout' : str(REQUEST_TIMEOUT)}) : 
+
+            start_time : float = time.perf_counter()
+            response = await client.post('/edit-scenario' , json = {'api_key' : 'stalled' , 'scenario_prompt' : 'Make it harder'} , headers = headers)
+
+            print(f'  {"with a " + str(REQUEST_TIMEOUT) + "s deadline" if headers else "without a deadline"} : {response.status_code} after {time.perf_counter() - start_time:5.2f} s')
+
+    await state.voxio_client.aclose()
+
+async def main() -> None : 
+
+    with open('config.yml') as file : config : dict = yaml.safe_load(file)
+
+    faults : dict = {}
+
+    port : int = free_port()
+    serve_in_thread(create_fake_voxio_app(faults = faults) , port)
+
+    configure_breakers(config['resilience']['breakers'])
+
+    await hedging(config , port , faults)
+    await breaker(config , port , faults)
+    await deadline(config , port)
+
+if __name__ == '__main__' : asyncio.run(main())
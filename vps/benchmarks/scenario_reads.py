@@ -0,0 +1,104 @@
+'''
+Latency of `GET /scenarios` and `GET /scenarios/{api_key}` against an in-memory Mongo
+that answers in `MONGO_LATENCY` seconds : read from Mongo every time (the cache dropped
+before each request, as after a write), served from the read cache, and revalidated
+with `If-None-Match` for an empty 304. Also walks every page once and checks that the
+cursors neither skip nor repeat a scenario.
+
+The fake collection filters in Python, so it says nothing about how the index scales;
+in Mongo a page is one range scan of the `_id` index, however deep it is.
+
+Usage : python benchmarks/scenario_reads.py
+'''
+
+import asyncio
+import os
+import time
+
+for name in ('ALLOWED_ORIGINS' , 'ALLOWED_CREDENTIALS' , 'ALLOWED_METHODS' , 'ALLOWED_HEADERS') : os.environ.setdefault(name , '')
+os.environ.setdefault('VOXIO_API_KEY' , 'benchmark')
+
+import httpx
+import yaml
+from bson import ObjectId
+
+import vps.app as app_module
+from vps.admission import Admission
+from vps.cache import ResultCache
+from vps.loader import load_scenario_repository
+from vps.startup import Startup
+from stand_ins import FAKE_SCENARIO , FakeMongoClient
+
+SCENARIOS : int = 1000
+MONGO_LATENCY : float = 0.002
+ITERATIONS : int = 300
+
+async def measure(client : httpx.AsyncClient , path : str , expected : int , before = None , headers : dict | None = None) -> float : 
+
+    start_time : float = time.perf_counter()
+
+    for _ in range(ITERATIONS) : 
+
+        if before is not None : before()
+
+        response : httpx.Response = await client.get(path , headers = headers)
+
+        assert response.status_code == expected , response.text
+
+    return (time.perf_counter() - start_time) / ITERATIONS * 1e3
+
+async def main() -> None : 
+
+    with open('config.yml') as file : config : dict = yaml.safe_load(file)
+
+    state = app_module.state
+    state.config = config
+    state.admission = Admission({**config['admission'] , 'enabled' : False})
+    state.scenario_reads = ResultCache(None , config['scenario-reads']['cache'])
+
+    mongo_client = FakeMongoClient(latency = MONGO_LATENCY)
+    state.scenario_repository = load_scenario_repository(mongo_client , config['mongo'])
+    state.scenario_repository.on_write = state.scenario_reads.clear
+
+    for index in range(SCENARIOS) : mongo_client.collection.documents[f'key-{index}'] = {
+        '_id' : ObjectId() , 
+        'api_key' : f'key-{index}' , 
+        **FAKE_SCENARIO
+    }
+
+    state.startup = Startup()
+    state.startup.start()
+    await state.startup.wait()
+
+    async with httpx.AsyncClient(transport = httpx.ASGITransport(app = app_module.app) , base_url = 'http://vps') as client : 
+
+        seen : list[str] = []
+        after : str | None = None
+
+        while True : 
+
+            page : dict = (await client.get('/scenarios' , params = {'limit' : 100 , **({'after' : after} if after else {})})).json()
+            seen.extend(scenario['api_key'] for scenario in page['scenarios'])
+
+            if (after := page['next_cursor']) is None : break
+
+        assert len(seen) == len(set(seen)) == SCENARIOS , len(seen)
+
+        full : httpx.Response = await client.get('/scenarios' , params = {'fields' : ','.join(app_module.SCENARIO_FIELDS)})
+        summary : httpx.Response = await client.get('/scenarios')
+
+        print(f'{SCENARIOS} scenarios walked in pages of 100 , first page {len(summary.content)} bytes with summary fields , {len(full.content)} bytes with all fields')
+
+        for path in ('/scenarios' , '/scenarios/key-500') : 
+
+            etag : str = (await client.get(path)).headers['etag']
+
+            mongo : float = await measure(client , path , 200 , state.scenario_reads.clear)
+            cached : float = await measure(client , path , 200)
+            revalidated : float = await measure(client , path , 304 , headers = {'If-None-Match' : etag})
+
+            print(f'{path:<18} : mongo {mongo:6.2f} ms , cached {cached:6.2f} ms , 304 {revalidated:6.2f} ms')
+
+        print(f'read cache {state.scenario_reads.stats}')
+
+if __name__ == '__main__' : asyncio.run(main())
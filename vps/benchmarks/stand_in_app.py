@@ -0,0 +1,127 @@
+'''
+`vps.app` wired to the stand-ins : the fake Gemini client, an in-memory Mongo, the
+fake Voxio server listening on `VPS_STAND_IN_VOXIO_PORT` and, when
+`VPS_STAND_IN_DEEPGRAM_PORT` is set, the real Deepgram client pointed at the fake
+Deepgram server. Importing this module in a worker process patches `load_all_clients`
+there, so `stand_in_app:app` can be served by `vps.server.serve` with any number of workers.
+
+Admission control is off, a benchmark measures what the server can do rather than
+what its limits let through. `GET /_bench/stats` reports the event loop lag and the
+memory of the worker that answers it; `?reset=true` starts a new measurement.
+'''
+
+import asyncio
+import os
+import resource
+import tempfile
+import time
+
+import vps.app as app_module
+from vps.loader import load_voxio_client
+from vps.startup import LazyClient
+from stand_ins import FakeGeminiClient , FakeMongoClient , fake_deepgram_environment
+
+load_all_clients = app_module.load_all_clients
+
+def load_fake_deepgram_client(port : int) : 
+
+    from deepgram import AsyncDeepgramClient
+
+    return AsyncDeepgramClient(api_key = 'benchmark' , environment = fake_deepgram_environment(port) , telemetry_opt_out = True)
+
+def load_stand_in_clients() : 
+
+    deepgram_client , config , logger , _ , _ , _ = load_all_clients()
+
+    config['tts']['cache']['prewarm'] = False
+    config['tts']['cache']['disk-path'] = tempfile.mkdtemp(prefix = 'vps-tts-')
+    config['generation-cache']['enabled'] = False
+    config['admission']['enabled'] = False
+
+    if 'VPS_STAND_IN_DEEPGRAM_PORT' in os.environ : 
+
+        deepgram_port : int = int(os.environ['VPS_STAND_IN_DEEPGRAM_PORT'])
+        deepgram_client = LazyClient(lambda : load_fake_deepgram_client(deepgram_port))
+
+    gemini_client = LazyClient(lambda : FakeGeminiClient(token_latency = float(os.environ.get('VPS_STAND_IN_TOKEN_LATENCY' , '0.001'))))
+    voxio_client = load_voxio_client({
+        **config['voxio'] , 
+        'base-url' : f'http://127.0.0.1:{os.environ["VPS_STAND_IN_VOXIO_PORT"]}' , 
+        'http2' : False
+    })
+
+    return deepgram_client , config , logger , gemini_client , FakeMongoClient() , voxio_client
+
+app_module.load_all_clients = load_stand_in_clients
+
+app = app_module.app
+
+class LoopMonitor : 
+    '''
+    Sleeps `interval` seconds in a loop and records how late each wake-up is, which is
+    how long the event loop was kept from running ready callbacks.
+    '''
+
+    def __init__(self , interval : float = 0.01) -> None : 
+
+        self.interval = interval
+        self.lags : list[float] = []
+        self.task : asyncio.Task | None = None
+
+    async def _watch(self) -> None : 
+
+        while True : 
+
+            start_time : float = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0 , time.perf_counter() - start_time - self.interval))
+
+    def reset(self) -> None : 
+
+        self.lags = []
+
+        if self.task is None : self.task = asyncio.create_task(self._watch())
+
+    def summary(self) -> dict : 
+
+        lags : list[float] = sorted(self.lags)
+
+        if not lags : return {'samples' : 0}
+
+        return {
+            'samples' : len(lags) , 
+            'p50' : lags[len(lags) // 2] , 
+            'p99' : lags[min(len(lags) - 1 , int(0.99 * len(lags)))] , 
+            'max' : lags[-1]
+        }
+
+def memory() -> dict : 
+    '''
+    Resident and peak resident memory of this process in bytes, from /proc where there is one.
+    '''
+
+    usage : dict = {'peak_rss_bytes' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+    try : 
+
+        with open('/proc/self/status') as file : 
+
+            for line in file : 
+
+                if line.startswith('VmRSS:') : usage['rss_bytes'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:') : usage['peak_rss_bytes'] = int(line.split()[1]) * 1024
+
+    except OSError : pass
+
+    return usage
+
+loop_monitor = LoopMonitor()
+
+@app.get('/_bench/stats')
+async def bench_stats(reset : bool = False) -> dict : 
+
+    stats : dict = {'pid' : os.getpid() , 'loop_lag_seconds' : loop_monitor.summary() , **memory()}
+
+    if reset : loop_monitor.reset()
+
+    return stats
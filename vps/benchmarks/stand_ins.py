@@ -0,0 +1,491 @@
+'''
+Local stand-ins for the upstream services used by `vps`, for benchmarks only.
+'''
+
+import asyncio
+import gzip
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import uvicorn
+from fastapi import FastAPI , Request
+from fastapi.responses import JSONResponse , StreamingResponse
+
+FAKE_SCENARIO : dict = {
+    'scenario_name' : 'Shoulder pain in a 45 year old painter' , 
+    'scenario_prompt' : 'Physiotherapy Case: Right Shoulder Pain ... ' * 40 , 
+    'questions_for_feedback' : [f'Did the student ask question {index}?' for index in range(23)] , 
+    'difficulty_level' : 'Medium'
+}
+
+class FakeAPIError(Exception) : 
+
+    def __init__(self , code : int , message : str) -> None : 
+
+        super().__init__(f'{code} {message}')
+        self.code = code
+
+def _text_of(value) -> str : 
+
+    if value is None : return ''
+
+    if isinstance(value , str) : return value
+
+    if isinstance(value , list) : return ''.join(_text_of(item) for item in value)
+
+    if getattr(value , 'parts' , None) is not None : return _text_of(value.parts)
+
+    return getattr(value , 'text' , None) or ''
+
+class FakeGeminiCaches : 
+    '''
+    Mimics `client.aio.caches`, keeping the cached system instructions in memory.
+    '''
+
+    def __init__(self , supported : bool = True) -> None : 
+
+        self.supported = supported
+        self.entries : dict[str , str] = {}
+
+    async def create(self , model : str , config) : 
+
+        if not self.supported : raise FakeAPIError(400 , 'Cached content is too small.')
+
+        name : str = f'cachedContents/{uuid.uuid4().hex[: 12]}'
+        self.entries[name] = _text_of(config.system_instruction)
+
+        return SimpleNamespace(name = name , expire_time = None)
+
+    async def update(self , name : str , config) : 
+
+        if name not in self.entries : raise FakeAPIError(404 , f'CachedContent {name} not found.')
+
+        return SimpleNamespace(name = name , expire_time = None)
+
+    async def delete(self , name : str) -> None : self.entries.pop(name , None)
+
+class FakeGeminiModels : 
+    '''
+    Streams a fixed JSON payload. The time to the first chunk grows with the prompt
+    characters the model has to read, `prefill_latency` seconds per thousand; the
+    characters of a cached system instruction are not counted.
+    '''
+
+    def __init__(
+        self , 
+        token_latency : float = 0.01 , 
+        chunk_count : int = 50 , 
+        payload : dict | None = None , 
+        stall : float = 0.0 , 
+        error : Exception | None = None , 
+        prefill_latency : float = 0.0 , 
+        caches : FakeGeminiCaches | None = None
+    ) -> None : 
+
+        self.token_latency = token_latency
+        self.chunk_count = chunk_count
+        self.payload = payload or FAKE_SCENARIO
+        self.prefill_latency = prefill_latency
+        self.caches = caches
+
+        # * Fault injection, both can be changed between calls
+        self.stall = stall
+        self.error = error
+
+    async def generate_content_stream(
+        self , 
+        model : str , 
+        contents : list , 
+        config = None
+    ) : 
+
+        if self.error is not None : raise self.error
+
+        prompt_chars : int = len(_text_of(contents))
+        cached_chars : int = 0
+
+        if config is not None and getattr(config , 'cached_content' , None) : 
+
+            if self.caches is None or config.cached_content not in self.caches.entries : raise FakeAPIError(404 , f'CachedContent {config.cached_content} not found.')
+
+            cached_chars = len(self.caches.entries[config.cached_content])
+
+        elif config is not None : prompt_chars += len(_text_of(config.system_instruction))
+
+        await asyncio.sleep(self.stall + self.prefill_latency * prompt_chars / 1000)
+
+        text : str = json.dumps(self.payload)
+        size : int = max(1 , len(text) // self.chunk_count + 1)
+
+        async def stream() : 
+
+            for start in range(0 , len(text) , size) : 
+
+                await asyncio.sleep(self.token_latency)
+
+                yield SimpleNamespace(text = text[start : start + size] , usage_metadata = None)
+
+            # * Roughly four characters a token
+            yield SimpleNamespace(text = '' , usage_metadata = SimpleNamespace(
+                prompt_token_count = (prompt_chars + cached_chars) // 4 , 
+                cached_content_token_count = cached_chars // 4 , 
+                candidates_token_count = len(text) // 4 , 
+                total_token_count = (prompt_chars + cached_chars + len(text)) // 4
+            ))
+
+        return stream()
+
+class FakeGeminiClient : 
+    '''
+    Mimics `google.genai.Client` closely enough for `vps.llm.run_gemini`.
+    '''
+
+    def __init__(self , caching : bool = True , **kwargs) -> None : 
+
+        caches = FakeGeminiCaches(caching)
+
+        self.aio = SimpleNamespace(models = FakeGeminiModels(caches = caches , **kwargs) , caches = caches)
+
+class FakeCollection : 
+    '''
+    In-memory stand-in for the handful of `AsyncCollection` calls `ScenarioRepository` makes.
+    '''
+
+    def __init__(self , latency : float = 0.001) -> None : 
+
+        self.latency = latency
+        self.documents : dict[str , dict] = {}
+        self.indexes : dict[str , dict] = {'_id_' : {'key' : [('_id' , 1)]}}
+
+    async def index_information(self) -> dict : 
+
+        await asyncio.sleep(self.latency)
+
+        return dict(self.indexes)
+
+    async def create_index(self , keys : list , unique : bool = False , name : str = '' , **options) -> str : 
+
+        await asyncio.sleep(self.latency)
+
+        self.indexes[name] = {'key' : keys , 'unique' : unique , **options}
+
+        return name
+
+    async def insert_one(self , document : dict) : 
+
+        await asyncio.sleep(self.latency)
+
+        document.setdefault('_id' , uuid.uuid4().hex)
+        self.documents[document['api_key']] = document
+
+        return SimpleNamespace(inserted_id = document['_id'])
+
+    async def insert_many(self , documents : list[dict] , ordered : bool = True) : 
+
+        await asyncio.sleep(self.latency)
+
+        for document in documents : 
+
+            document.setdefault('_id' , uuid.uuid4().hex)
+            self.documents[document['api_key']] = document
+
+        return SimpleNamespace(inserted_ids = [document['_id'] for document in documents])
+
+    async def update_one(self , query : dict , update : dict , upsert : bool = False) : 
+
+        await asyncio.sleep(self.latency)
+
+        document : dict | None = self.documents.get(query['api_key'])
+
+        if document is None : return SimpleNamespace(matched_count = 0 , modified_count = 0)
+
+        changed : bool = any(document.get(key) != value for key , value in update['$set'].items())
+        document.update(update['$set'])
+
+        return SimpleNamespace(matched_count = 1 , modified_count = int(changed))
+
+    async def replace_one(self , query : dict , document : dict , upsert : bool = False) : 
+
+        await asyncio.sleep(self.latency)
+
+        self.documents[query['_id']] = document
+
+        return SimpleNamespace(matched_count = 1 , modified_count = 1)
+
+    async def find_one(self , query : dict , projection : dict | None = None) -> dict | None : 
+
+        await asyncio.sleep(self.latency)
+
+        return self.documents.get(query['api_key'] if 'api_key' in query else query['_id'])
+
+    def find(self , query : dict , projection : dict | None = None) -> '_FakeCursor' : 
+
+        documents : list[dict] = list(self.documents.values())
+        before = query.get('_id' , {}).get('$lt')
+
+        if before is not None : documents = [document for document in documents if document['_id'] < before]
+
+        if projection : documents = [{key : value for key , value in document.items() if key in projection} for document in documents]
+
+        return _FakeCursor(documents , self.latency)
+
+class _FakeCursor : 
+
+    def __init__(self , documents : list[dict] , latency : float) -> None : 
+
+        self.documents = documents
+        self.latency = latency
+
+    def sort(self , key : str , direction : int) -> '_FakeCursor' : 
+
+        self.documents.sort(key = lambda document : document[key] , reverse = direction < 0)
+
+        return self
+
+    def limit(self , count : int) -> '_FakeCursor' : 
+
+        self.documents = self.documents[: count]
+
+        return self
+
+    async def to_list(self , length : int | None = None) -> list[dict] : 
+
+        await asyncio.sleep(self.latency)
+
+        return self.documents[: length]
+
+class FakeMongoClient : 
+    '''
+    Mimics `AsyncMongoClient` : every database and collection name maps to one `FakeCollection`.
+    '''
+
+    def __init__(self , latency : float = 0.001) -> None : 
+
+        self.latency = latency
+        self.collection = FakeCollection(latency)
+        self.admin = SimpleNamespace(command = self.command)
+
+    async def command(self , name : str) -> dict : 
+
+        await asyncio.sleep(self.latency)
+
+        return {'ok' : 1}
+
+    def __getitem__(self , name : str) -> '_FakeDatabase' : return _FakeDatabase(self.collection)
+
+    async def close(self) -> None : pass
+
+class _FakeDatabase : 
+
+    def __init__(self , collection : FakeCollection) -> None : self.collection = collection
+
+    def __getitem__(self , name : str) -> FakeCollection : return self.collection
+
+def create_fake_voxio_app(
+    latency : float = 0.005 , 
+    faults : dict | None = None , 
+    stats : dict | None = None , 
+    supports_patch : bool = True
+) -> FastAPI : 
+    '''
+    Builds an in-memory stand-in for `database.voxio.in`. Request bodies may be gzipped;
+    `PATCH /edit-flow` takes a JSON Patch, applied only when `If-Match` names the current flow.
+
+    Args : 
+        - latency (float) : Seconds each endpoint waits before answering.
+        - faults (dict) : Fault injection read on every request, so the caller can change it
+            while the server runs : `slow-ratio` of requests wait `slow-latency` seconds
+            instead, `error-ratio` of them answer 503.
+        - stats (dict) : Filled with the requests and request body bytes received, by method.
+        - supports_patch (bool) : Whether `PATCH /edit-flow` exists.
+
+    Returns : 
+        - FastAPI : The fake Voxio application.
+    '''
+
+    from vps.voxio import apply_patch , document_hash
+
+    app = FastAPI()
+    flows : dict[str , dict] = {}
+    faults = faults if faults is not None else {}
+    stats = stats if stats is not None else {}
+
+    async def read_json(request : Request) : 
+
+        body : bytes = await request.body()
+
+        stats[f'{request.method} requests'] = stats.get(f'{request.method} requests' , 0) + 1
+        stats[f'{request.method} bytes'] = stats.get(f'{request.method} bytes' , 0) + len(body)
+
+        if request.headers.get('content-encoding') == 'gzip' : body = gzip.decompress(body)
+
+        return json.loads(body)
+
+    @app.middleware('http')
+    async def inject_faults(request : Request , call_next) : 
+
+        if random.random() < faults.get('slow-ratio' , 0) : await asyncio.sleep(faults.get('slow-latency' , 1.0))
+
+        if random.random() < faults.get('error-ratio' , 0) : return JSONResponse({'detail' : 'injected fault'} , status_code = 503)
+
+        return await call_next(request)
+
+    @app.post('/add-flow')
+    async def add_flow(request : Request) -> dict : 
+
+        await asyncio.sleep(latency)
+
+        api_key : str = uuid.uuid4().hex
+        flows[api_key] = await read_json(request)
+
+        return {'api_key' : api_key}
+
+    @app.get('/flow')
+    async def flow(request : Request) -> dict : 
+
+        await asyncio.sleep(latency)
+
+        return {'agent_id' : request.headers.get('api_key' , '')}
+
+    @app.get('/agent')
+    async def agent(request : Request) -> dict : 
+
+        await asyncio.sleep(latency)
+
+        return flows.get(request.headers.get('agent_id' , '') , {'agent' : {}})
+
+    @app.put('/edit-flow')
+    async def edit_flow(request : Request) -> dict : 
+
+        await asyncio.sleep(latency)
+
+        flows[request.headers.get('api_key' , '')] = await read_json(request)
+
+        return {'status' : 'success'}
+
+    if not supports_patch : return app
+
+    @app.patch('/edit-flow')
+    async def patch_flow(request : Request) : 
+
+        await asyncio.sleep(latency)
+
+        api_key : str = request.headers.get('api_key' , '')
+        operations : list[dict] = await read_json(request)
+
+        if api_key not in flows : return JSONResponse({'detail' : 'Flow not found'} , status_code = 404)
+
+        if request.headers.get('if-match' , '').strip('"') != document_hash(flows[api_key]) : return JSONResponse({'detail' : 'Flow changed'} , status_code = 412)
+
+        try : flows[api_key] = apply_patch(flows[api_key] , operations)
+        except ValueError as e : return JSONResponse({'detail' : str(e)} , status_code = 422)
+
+        return {'status' : 'success'}
+
+    return app
+
+FAKE_TRANSCRIPT : str = 'The pain started two weeks ago after I lifted a heavy box.'
+
+def create_fake_deepgram_app(
+    latency : float = 0.05 , 
+    chunk_latency : float = 0.005 , 
+    audio_chunks : int = 8 , 
+    chunk_size : int = 4096
+) -> FastAPI : 
+    '''
+    Builds a stand-in for the Deepgram REST API, served to the real `AsyncDeepgramClient`
+    through `fake_deepgram_environment`.
+
+    Args : 
+        - latency (float) : Seconds before a transcript is returned or the first audio chunk is sent.
+        - chunk_latency (float) : Seconds between audio chunks.
+        - audio_chunks (int) : Chunks of canned audio per synthesis.
+        - chunk_size (int) : Bytes per audio chunk.
+
+    Returns : 
+        - FastAPI : The fake Deepgram application.
+    '''
+
+    app = FastAPI()
+    audio_chunk : bytes = bytes(range(256)) * (chunk_size // 256)
+
+    @app.post('/v1/listen')
+    async def listen(request : Request) -> dict : 
+
+        received : int = 0
+
+        async for chunk in request.stream() : received += len(chunk)
+
+        await asyncio.sleep(latency)
+
+        return {
+            'metadata' : {
+                'request_id' : uuid.uuid4().hex , 
+                'sha256' : '' , 
+                'created' : '2024-01-01T00:00:00Z' , 
+                'duration' : received / 32000 , 
+                'channels' : 1 , 
+                'models' : [] , 
+                'model_info' : {}
+            } , 
+            'results' : {'channels' : [{'alternatives' : [{'transcript' : FAKE_TRANSCRIPT , 'confidence' : 0.99 , 'words' : []}]}]}
+        }
+
+    @app.post('/v1/speak')
+    async def speak() -> StreamingResponse : 
+
+        async def audio() : 
+
+            await asyncio.sleep(latency)
+
+            for _ in range(audio_chunks) : 
+
+                yield audio_chunk
+
+                await asyncio.sleep(chunk_latency)
+
+        return StreamingResponse(audio() , media_type = 'audio/mpeg')
+
+    return app
+
+def fake_deepgram_environment(port : int) : 
+    '''
+    Points the Deepgram SDK at `create_fake_deepgram_app` served on `port`.
+    '''
+
+    from deepgram.environment import DeepgramClientEnvironment
+
+    return DeepgramClientEnvironment(
+        base = f'http://127.0.0.1:{port}' , 
+        production = f'ws://127.0.0.1:{port}' , 
+        agent = f'ws://127.0.0.1:{port}'
+    )
+
+def free_port() -> int : 
+
+    with socket.socket() as sock : 
+
+        sock.bind(('127.0.0.1' , 0))
+
+        return sock.getsockname()[1]
+
+def serve_in_thread(
+    app , 
+    port : int
+) -> uvicorn.Server : 
+    '''
+    Starts an ASGI app with uvicorn on a daemon thread and waits until it accepts connections.
+    '''
+
+    server = uvicorn.Server(uvicorn.Config(app , host = '127.0.0.1' , port = port , log_level = 'warning'))
+
+    threading.Thread(target = server.run , daemon = True).start()
+
+    while not server.started : time.sleep(0.01)
+
+    return server
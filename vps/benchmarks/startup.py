@@ -0,0 +1,100 @@
+'''
+Cold start of the service : time to import `vps.app` and time until `/ready` answers 200,
+each measured in a fresh interpreter, against local stand-ins for Mongo and Voxio.
+
+Usage : python benchmarks/startup.py [runs]
+'''
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RUNS : int = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] != '--child' else 5
+
+ENVIRONMENT : dict[str , str] = {
+    'ALLOWED_ORIGINS' : '' , 
+    'ALLOWED_CREDENTIALS' : '' , 
+    'ALLOWED_METHODS' : '' , 
+    'ALLOWED_HEADERS' : '' , 
+    'MONGO_URL' : 'mongodb://127.0.0.1:1' , 
+    'DEEPGRAM_API_KEY' : 'benchmark' , 
+    'GEMINI_API_KEY' : 'benchmark' , 
+    'VOXIO_API_KEY' : 'benchmark'
+}
+
+def child() -> None : 
+
+    start_time : float = time.perf_counter()
+
+    import vps.app as app_module
+
+    import_seconds : float = time.perf_counter() - start_time
+
+    from fastapi.testclient import TestClient
+    from vps.loader import load_voxio_client
+    from stand_ins import FakeMongoClient , create_fake_voxio_app , free_port , serve_in_thread
+
+    port : int = free_port()
+    serve_in_thread(create_fake_voxio_app() , port)
+
+    load_all_clients = app_module.load_all_clients
+
+    def patched_load_all_clients() : 
+
+        deepgram_client , config , logger , gemini_client , _ , voxio_client = load_all_clients()
+
+        config['tts']['cache']['prewarm'] = False
+        voxio_client = load_voxio_client({**config['voxio'] , 'base-url' : f'http://127.0.0.1:{port}'})
+
+        return deepgram_client , config , logger , gemini_client , FakeMongoClient() , voxio_client
+
+    app_module.load_all_clients = patched_load_all_clients
+
+    with TestClient(app_module.app) as client : 
+
+        listening_seconds : float = time.perf_counter() - start_time
+
+        while client.get('/ready').status_code != 200 : time.sleep(0.005)
+
+        ready_seconds : float = time.perf_counter() - start_time
+
+    print(json.dumps({
+        'import_seconds' : import_seconds , 
+        'listening_seconds' : listening_seconds , 
+        'ready_seconds' : ready_seconds , 
+        'checks' : app_module.state.startup.durations
+    }))
+
+def main() -> None : 
+
+    results : list[dict] = []
+
+    for _ in range(RUNS) : 
+
+        output = subprocess.run(
+            [sys.executable , __file__ , '--child'] , 
+            env = {**os.environ , **ENVIRONMENT} , 
+            capture_output = True , 
+            text = True , 
+            check = True
+        )
+
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    for field in ('import_seconds' , 'listening_seconds' , 'ready_seconds') : 
+
+        values : list[float] = [result[field] for result in results]
+
+        print(f'{field:<18} : median {statistics.median(values) * 1e3:8.1f} ms , max {max(values) * 1e3:8.1f} ms')
+
+    for name in results[0]['checks'] : 
+
+        print(f'  check {name:<10} : median {statistics.median(result["checks"][name] for result in results) * 1e3:8.1f} ms')
+
+if __name__ == '__main__' : 
+
+    if '--child' in sys.argv : child()
+    else : main()
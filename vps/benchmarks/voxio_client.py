@@ -0,0 +1,77 @@
+'''
+p50/p99 latency of the edit-scenario Voxio calls (`/flow`, `/edit-flow`)
+against a local fake Voxio server, one fresh connection per call versus the pooled `VoxioClient`.
+
+Usage : python benchmarks/voxio_client.py
+'''
+
+import asyncio
+import statistics
+import time
+
+import httpx
+import yaml
+
+from vps.voxio import VoxioClient
+from stand_ins import create_fake_voxio_app , free_port , serve_in_thread
+
+WORKFLOW : dict = {'nodes' : {'llm' : {'parameters' : {'system_prompt' : 'x' * 4000}}}}
+
+async def fresh_edit(base_url : str , api_key : str) -> None : 
+
+    # * Mirrors the old behaviour : a new connection for every call
+    for method , path in (('GET' , '/flow') , ('PUT' , '/edit-flow')) : 
+
+        async with httpx.AsyncClient(base_url = base_url) as client : 
+
+            await client.request(method , path , headers = {'api_key' : api_key} , json = WORKFLOW if method == 'PUT' else None)
+
+async def pooled_edit(client : VoxioClient , api_key : str) -> None : 
+
+    await client.get_flow(api_key)
+    await client.edit_flow(api_key , WORKFLOW , 'benchmark')
+
+async def measure(
+    edit , 
+    concurrency : int , 
+    rounds : int
+) -> list[float] : 
+
+    latencies : list[float] = []
+
+    async def one() : 
+
+        start_time = time.perf_counter()
+        await edit()
+        latencies.append(time.perf_counter() - start_time)
+
+    for _ in range(rounds) : await asyncio.gather(*(one() for _ in range(concurrency)))
+
+    return latencies
+
+def report(name : str , latencies : list[float]) -> None : 
+
+    percentiles : list[float] = statistics.quantiles(latencies , n = 100)
+
+    print(f'{name:>8} p50 {percentiles[49] * 1000:8.2f} ms   p99 {percentiles[98] * 1000:8.2f} ms')
+
+async def main() -> None : 
+
+    port : int = free_port()
+    server = serve_in_thread(create_fake_voxio_app() , port)
+    base_url : str = f'http://127.0.0.1:{port}'
+
+    with open('config.yml') as config_file : config : dict = yaml.safe_load(config_file)['voxio']
+
+    client = VoxioClient(base_url = base_url , user_api_key = 'benchmark' , config = config)
+
+    for concurrency in (1 , 16 , 64) : 
+
+        print(f'concurrency {concurrency}')
+        report('fresh' , await measure(lambda : fresh_edit(base_url , 'key') , concurrency , 20))
+        report('pooled' , await measure(lambda : pooled_edit(client , 'key') , concurrency , 20))
+
+    await client.aclose()
+    server.should_exit = True
+
+if __name__ == '__main__' : asyncio.run(main())
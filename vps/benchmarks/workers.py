@@ -0,0 +1,146 @@
+'''
+Requests per second of `POST /add-scenario` across server worker counts, each server
+started through `vps.server.serve` on `stand_in_app:app`, so every worker runs the real
+lifespan against the fake Gemini, an in-memory Mongo and a fake Voxio server.
+
+Load comes from separate client processes so the generator does not share a core
+with the server. Scaling is bounded by the cores of the machine.
+
+Usage : python benchmarks/workers.py [worker counts ...]
+'''
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+import uvicorn
+
+from stand_ins import create_fake_voxio_app , free_port
+
+WORKERS : list[int] = [1 , 2 , 4]
+CLIENT_PROCESSES : int = 2
+CONCURRENCY : int = 32
+DURATION : float = 10.0
+
+ENVIRONMENT : dict[str , str] = {
+    'ALLOWED_ORIGINS' : '' , 
+    'ALLOWED_CREDENTIALS' : '' , 
+    'ALLOWED_METHODS' : '' , 
+    'ALLOWED_HEADERS' : '' , 
+    'MONGO_URL' : 'mongodb://127.0.0.1:1' , 
+    'DEEPGRAM_API_KEY' : 'benchmark' , 
+    'GEMINI_API_KEY' : 'benchmark' , 
+    'VOXIO_API_KEY' : 'benchmark'
+}
+
+def run_voxio(port : int) -> None : uvicorn.run(create_fake_voxio_app(latency = 0.005) , host = '127.0.0.1' , port = port , log_level = 'warning')
+
+def run_server(workers : int , port : int) -> None : 
+
+    from vps.loader import load_config
+    from vps.server import serve
+
+    serve('stand_in_app:app' , {**load_config()['server'] , 'host' : '127.0.0.1' , 'port' : port , 'workers' : workers})
+
+async def load(port : int , deadline : float) -> tuple[int , int] : 
+
+    completed : int = 0
+    failed : int = 0
+
+    async with httpx.AsyncClient(base_url = f'http://127.0.0.1:{port}' , timeout = 30) as client : 
+
+        async def user(index : int) -> None : 
+
+            nonlocal completed , failed
+
+            while time.time() < deadline : 
+
+                response = await client.post('/add-scenario' , json = {'scenario_prompt' : f'Scenario {index} {completed}'})
+
+                if response.status_code == 200 : completed += 1
+                else : failed += 1
+
+        await asyncio.gather(*(user(index) for index in range(CONCURRENCY)))
+
+    return completed , failed
+
+def run_client(port : int , deadline : float , results) -> None : results.put(asyncio.run(load(port , deadline)))
+
+def wait_ready(port : int , timeout : float = 60) -> None : 
+
+    deadline : float = time.time() + timeout
+    streak : int = 0
+
+    # * Each worker has its own readiness, so wait for a run of 200s across connections
+    while streak < 20 : 
+
+        if time.time() > deadline : raise TimeoutError('The server never became ready.')
+
+        try : streak = streak + 1 if httpx.get(f'http://127.0.0.1:{port}/ready').status_code == 200 else 0
+
+        except httpx.HTTPError : streak = 0
+
+        time.sleep(0.01 if streak else 0.1)
+
+def main() -> None : 
+
+    os.environ.update(ENVIRONMENT)
+
+    voxio_port : int = free_port()
+    os.environ['VPS_STAND_IN_VOXIO_PORT'] = str(voxio_port)
+
+    context = multiprocessing.get_context('spawn')
+
+    voxio = context.Process(target = run_voxio , args = (voxio_port ,) , daemon = True)
+    voxio.start()
+
+    print(f'{os.cpu_count()} cores , {CLIENT_PROCESSES} x {CONCURRENCY} concurrent clients , {DURATION:.0f}s per run')
+
+    baseline : float | None = None
+
+    for workers in [int(argument) for argument in sys.argv[1:]] or WORKERS : 
+
+        port : int = free_port()
+
+        server = subprocess.Popen(
+            [sys.executable , __file__ , '--serve' , str(workers) , str(port)] , 
+            stdout = subprocess.DEVNULL , 
+            stderr = subprocess.DEVNULL
+        )
+
+        try : 
+
+            wait_ready(port)
+
+            results = context.Queue()
+            deadline : float = time.time() + DURATION
+
+            clients = [context.Process(target = run_client , args = (port , deadline , results)) for _ in range(CLIENT_PROCESSES)]
+
+            for client in clients : client.start()
+
+            counts : list[tuple[int , int]] = [results.get() for _ in clients]
+
+            for client in clients : client.join()
+
+        finally : 
+
+            server.send_signal(signal.SIGTERM)
+            server.wait(60)
+
+        rate : float = sum(completed for completed , _ in counts) / DURATION
+        baseline = baseline or rate
+
+        print(f'workers {workers:>2} : {rate:8.1f} requests/s , speedup {rate / baseline:4.2f}x , {sum(failed for _ , failed in counts)} failed')
+
+    voxio.terminate()
+
+if __name__ == '__main__' : 
+
+    if '--serve' in sys.argv : run_server(int(sys.argv[2]) , int(sys.argv[3]))
+    else : main()
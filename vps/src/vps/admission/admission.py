@@ -0,0 +1,321 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+
+from ..services import method_log_timer
+from ..metrics import ADMISSION_IN_FLIGHT , ADMISSION_REJECTED , ADMISSION_WAIT_SECONDS , ADMISSION_WAITING
+
+class AdmissionRejected(Exception) : 
+
+    def __init__(
+        self , 
+        message : str , 
+        status_code : int , 
+        retry_after : float
+    ) -> None : 
+
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after : int = max(1 , math.ceil(retry_after))
+
+class TokenBucket : 
+    '''
+    Refills `rate` tokens a second up to `burst`; refilling is computed on use, so an idle bucket costs nothing.
+    '''
+
+    __slots__ = ('rate' , 'burst' , 'tokens' , 'updated_at')
+
+    def __init__(self , rate : float , burst : float) -> None : 
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens : float = burst
+        self.updated_at : float = time.monotonic()
+
+    def _refill(self) -> None : 
+
+        now : float = time.monotonic()
+
+        self.tokens = min(self.burst , self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self) -> float : 
+        '''
+        Takes a token when one is available.
+
+        Returns : 
+            - float : 0 when a token was taken, otherwise the seconds until one will be.
+        '''
+
+        self._refill()
+
+        if self.tokens >= 1 : 
+
+            self.tokens -= 1
+
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None : 
+        '''
+        Gives back a token taken for a request that was rejected further on.
+        '''
+
+        self.tokens = min(self.burst , self.tokens + 1)
+
+    @property
+    def level(self) -> float : 
+
+        self._refill()
+
+        return self.tokens
+
+class Bulkhead : 
+    '''
+    Global concurrency limit of one upstream, entered through `slot()`. Besides the
+    semaphore it keeps a moving average of how long a call holds its slot, so the wait
+    of a new caller can be estimated before it joins the queue.
+    '''
+
+    def __init__(
+        self , 
+        name : str , 
+        max_concurrency : int , 
+        max_waiting : int , 
+        max_wait : float
+    ) -> None : 
+
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.in_flight : int = 0
+        self.waiting : int = 0
+        self.service_seconds : float = 0.0
+
+        self.in_flight_gauge = ADMISSION_IN_FLIGHT.labels(name)
+        self.waiting_gauge = ADMISSION_WAITING.labels(name)
+        self.wait_histogram = ADMISSION_WAIT_SECONDS.labels(name)
+
+    def estimated_wait(self) -> float : 
+
+        if self.in_flight < self.max_concurrency : return 0.0
+
+        return self.service_seconds * (self.waiting + 1) / self.max_concurrency
+
+    def check(self) -> None : 
+        '''
+        Raises `AdmissionRejected` when a new caller would find the queue full or wait past `max_wait`.
+        '''
+
+        if self.waiting >= self.max_waiting : raise AdmissionRejected(
+            f'Too many requests are waiting for {self.name}.' , 
+            503 , 
+            self.estimated_wait()
+        )
+
+        wait : float = self.estimated_wait()
+
+        if wait > self.max_wait : raise AdmissionRejected(
+            f'{self.name} is overloaded, the expected wait is {wait:.1f}s.' , 
+            503 , 
+            wait
+        )
+
+    def slot(self) -> '_Slot' : return _Slot(self)
+
+class _Slot : 
+
+    __slots__ = ('bulkhead' , 'acquired_at')
+
+    def __init__(self , bulkhead : Bulkhead) -> None : self.bulkhead = bulkhead
+
+    async def __aenter__(self) -> '_Slot' : 
+
+        bulkhead : Bulkhead = self.bulkhead
+
+        bulkhead.waiting += 1
+        bulkhead.waiting_gauge.set(bulkhead.waiting)
+
+        start_time : float = time.perf_counter()
+
+        # * Admitted callers may still find the slots taken longer than expected, they give up after `max_wait` too
+        try : 
+
+            async with asyncio.timeout(None if math.isinf(bulkhead.max_wait) else bulkhead.max_wait) : await bulkhead.semaphore.acquire()
+
+        except TimeoutError : raise AdmissionRejected(
+            f'{bulkhead.name} is overloaded, no slot freed up within {bulkhead.max_wait:.0f}s.' , 
+            503 , 
+            bulkhead.estimated_wait()
+        ) from None
+
+        finally : 
+
+            bulkhead.waiting -= 1
+            bulkhead.waiting_gauge.set(bulkhead.waiting)
+
+        bulkhead.wait_histogram.observe(time.perf_counter() - start_time)
+
+        bulkhead.in_flight += 1
+        bulkhead.in_flight_gauge.set(bulkhead.in_flight)
+
+        self.acquired_at : float = time.perf_counter()
+
+        return self
+
+    async def __aexit__(self , *exc_info) -> None : 
+
+        bulkhead : Bulkhead = self.bulkhead
+
+        bulkhead.service_seconds += 0.2 * (time.perf_counter() - self.acquired_at - bulkhead.service_seconds)
+
+        bulkhead.in_flight -= 1
+        bulkhead.in_flight_gauge.set(bulkhead.in_flight)
+
+        bulkhead.semaphore.release()
+
+# * One bulkhead per upstream, shared by every caller of the process
+_bulkheads : dict[str , Bulkhead] = {}
+
+def configure_bulkheads(config : dict) -> None : 
+    '''
+    Builds the bulkheads of the `admission.upstreams` section of the config.
+    '''
+
+    for name , upstream in config.items() : _bulkheads[name] = Bulkhead(
+        name , 
+        upstream['max-concurrency'] , 
+        upstream['max-waiting'] , 
+        upstream['max-wait']
+    )
+
+def get_bulkhead(name : str) -> Bulkhead : 
+    '''
+    Returns the bulkhead of an upstream, creating a generous one when none was configured.
+    '''
+
+    bulkhead : Bulkhead | None = _bulkheads.get(name)
+
+    if bulkhead is None : 
+
+        bulkhead = Bulkhead(name , 1024 , 4096 , math.inf)
+        _bulkheads[name] = bulkhead
+
+    return bulkhead
+
+class Admission : 
+    '''
+    Decides at the edge whether a request may start : a token bucket per endpoint, one
+    per endpoint and tenant, then the upstreams of the endpoint must not be overloaded.
+    Rate limits answer 429, overload answers 503, both with the seconds to wait.
+    '''
+
+    def __init__(self , config : dict) -> None : 
+
+        self.enabled : bool = config['enabled']
+        self.max_tracked_keys : int = config['max-tracked-keys']
+        self.endpoints : dict[str , dict] = config['endpoints']
+
+        self.buckets : dict[str , TokenBucket] = {
+            endpoint : TokenBucket(limits['rate'] , limits['burst'])
+            for endpoint , limits in self.endpoints.items()
+        }
+
+        self.key_buckets : OrderedDict[tuple[str , str] , TokenBucket] = OrderedDict()
+
+    def _key_bucket(self , endpoint : str , key : str) -> TokenBucket : 
+
+        bucket : TokenBucket | None = self.key_buckets.get((endpoint , key))
+
+        if bucket is None : 
+
+            limits : dict = self.endpoints[endpoint]
+
+            bucket = TokenBucket(limits['key-rate'] , limits['key-burst'])
+            self.key_buckets[(endpoint , key)] = bucket
+
+            # * The least recently seen tenant is dropped first, a full bucket is lost at worst
+            while len(self.key_buckets) > self.max_tracked_keys : self.key_buckets.popitem(last = False)
+
+        else : self.key_buckets.move_to_end((endpoint , key))
+
+        return bucket
+
+    @method_log_timer
+    def admit(
+        self , 
+        endpoint : str , 
+        key : str , 
+        shed : bool = True
+    ) -> None : 
+        '''
+        Admits one request or raises `AdmissionRejected`.
+
+        Args : 
+            - endpoint (str) : The endpoint name in `admission.endpoints`.
+            - key (str) : The tenant of the request, its `api_key` or its client address.
+            - shed (bool) : Whether to also reject when an upstream is overloaded.
+        '''
+
+        if not self.enabled or endpoint not in self.endpoints : return
+
+        try : 
+
+            key_bucket : TokenBucket = self._key_bucket(endpoint , key)
+            bucket : TokenBucket = self.buckets[endpoint]
+
+            # * The tenant bucket goes first, so one tenant in a burst does not drain the shared bucket
+            wait : float = key_bucket.take()
+
+            if wait : raise AdmissionRejected(f'Rate limit of {endpoint} exceeded for this key.' , 429 , wait)
+
+            # * A request rejected past a bucket gives its tokens back, so rejected retries cost the tenant nothing
+            wait = bucket.take()
+
+            if wait : 
+
+                key_bucket.refund()
+
+                raise AdmissionRejected(f'Rate limit of {endpoint} exceeded.' , 429 , wait)
+
+            if shed : 
+
+                try : 
+
+                    for upstream in self.endpoints[endpoint]['upstreams'] : get_bulkhead(upstream).check()
+
+                except AdmissionRejected : 
+
+                    key_bucket.refund()
+                    bucket.refund()
+
+                    raise
+
+        except AdmissionRejected as e : 
+
+            ADMISSION_REJECTED.labels(endpoint , e.status_code).inc()
+            raise
+
+    def collect(self) -> list[str] : 
+        '''
+        Renders the limiter state at scrape time : tokens left per endpoint and tracked tenants.
+        '''
+
+        lines : list[str] = [
+            '# HELP vps_admission_tokens Tokens left in the rate limit bucket of each endpoint.' , 
+            '# TYPE vps_admission_tokens gauge'
+        ]
+
+        for endpoint , bucket in self.buckets.items() : lines.append(f'vps_admission_tokens{{endpoint="{endpoint}"}} {bucket.level}')
+
+        lines.append('# HELP vps_admission_tracked_keys Tenants with a rate limit bucket.')
+        lines.append('# TYPE vps_admission_tracked_keys gauge')
+        lines.append(f'vps_admission_tracked_keys {len(self.key_buckets)}')
+
+        return lines
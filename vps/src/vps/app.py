@@ -1,51 +1,207 @@
+import asyncio
+import contextlib
+import hmac
+import math
 from contextlib import asynccontextmanager
 from logging import Logger
 import os
-from deepgram import DeepgramClient
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Request , HTTPException, UploadFile
-from fastapi.responses import FileResponse
-from google.genai import Client
-from pymongo import MongoClient
-import uvicorn
-
-from .loader import load_all_clients
-from .services import env_str_to_bool , env_str_to_list
+from fastapi import FastAPI, Request , HTTPException, UploadFile , WebSocket , WebSocketDisconnect
+from fastapi.responses import JSONResponse , StreamingResponse , PlainTextResponse , Response
+from pymongo import AsyncMongoClient
+
+from .loader import load_all_clients , load_config , load_scenario_repository
+from .logs import RequestIdMiddleware , stop_logger
+from .services import env_str_to_bool , env_str_to_list , cancel_on_disconnect
 from dotenv import load_dotenv
-from .routers import add_scenario_route , edit_scenario_route
+from .routers import add_scenario_route , add_scenarios_route , edit_scenario_route , get_scenario_route , list_scenarios_route
+from .routers import SCENARIO_FIELDS , SCENARIO_SUMMARY_FIELDS
+from .assets import AssetRegistry
+from .llm import json_stats , StringFieldStream , ContextCache , configure_context_cache
+from .metrics import MetricsMiddleware , registry , stats_collector , enable_opentelemetry , stage_listener_var
+from .repository import ScenarioRepository
+from .speech import stream_tts , prefetch , TTSCache , find_speak_strings , prewarm_tts_cache
+from .speech import transcribe_upload , relay_live_transcription , check_upload_size , UploadTooLarge , UploadLimitMiddleware
+from .startup import LazyClient , Startup
+from .voxio import VoxioClient
+from .jobs import JobQueue , JobQueueFull , JobStore , TERMINAL_STATUSES
+from .cache import ResultCache , request_fingerprint
+from .admission import Admission , AdmissionRejected , configure_bulkheads
+from .resilience import CircuitOpen , DeadlineExceeded , DeadlineMiddleware , configure_breakers , get_breaker , time_left , within_deadline
+from .server import resolve_implementations , serve
+from .codec import AddScenarioRequest , AddScenariosRequest , EditScenarioRequest , FastJSONResponse , decode_request , dumps , etag , etag_matches
+from .profiling import Profiling , ProfilerBusy
+from bson import ObjectId
 
 load_dotenv()
 
 class AppState : 
 
-    deepgram_client : DeepgramClient
-    gemini_client : Client
+    deepgram_client : LazyClient
+    gemini_client : LazyClient
 
     config : dict
     logger : Logger
     llm_client : dict
-    mongo_client : MongoClient
+    mongo_client : AsyncMongoClient
+    scenario_repository : ScenarioRepository
+    assets : AssetRegistry
+    tts_cache : TTSCache
+    voxio_client : VoxioClient
+    startup : Startup
+    jobs : JobQueue
+    generation_cache : ResultCache | None
+    idempotency : ResultCache
+    scenario_reads : ResultCache
+    admission : Admission
+    context_cache : ContextCache
+    profiling : Profiling
 
 state = AppState()
 
 @asynccontextmanager
 async def lifespan(app : FastAPI) : 
 
-    deepgram_client , config , logger , gemini_client , mongo_client = load_all_clients()
+    deepgram_client , config , logger , gemini_client , mongo_client , voxio_client = load_all_clients()
     
     state.config = config
+
+    if config['metrics']['opentelemetry'] and not enable_opentelemetry() : logger.warning('OpenTelemetry is not installed, spans are disabled.')
     state.logger = logger
     state.gemini_client = gemini_client
     state.deepgram_client = deepgram_client
     state.mongo_client = mongo_client
+    state.voxio_client = voxio_client
+
+    configure_bulkheads(config['admission']['upstreams'])
+    configure_breakers(config['resilience']['breakers'])
+    state.admission = Admission(config['admission'])
+    state.profiling = Profiling(config['profiling'])
+
+    # * In memory only : each worker drops its own reads on its own writes, the short TTL bounds what other workers wrote
+    state.scenario_reads = ResultCache(None , config['scenario-reads']['cache'] , logger)
+
+    state.scenario_repository = load_scenario_repository(mongo_client , config['mongo'] , logger)
+    state.scenario_repository.on_write = state.scenario_reads.clear
+
+    state.context_cache = configure_context_cache(config['context-cache'] , logger)
+    state.context_cache.start()
+
+    # * A changed prompt gets a new cache entry on its next use, the one of the old prompt is deleted on reload
+    state.assets = AssetRegistry(
+        configs = {name : config[name] for name in ('add-scenario' , 'edit-scenario')} , 
+        logger = logger , 
+        on_load = state.context_cache.retain
+    )
+
+    state.tts_cache = TTSCache(config['tts']['cache'] , logger)
+
+    database = mongo_client[config['mongo']['database-name']]
+
+    job_collection = database[config['jobs']['collection-name']] if config['jobs']['persist'] else None
+
+    state.jobs = JobQueue(JobStore(job_collection , config['jobs'] , logger) , config['jobs'] , logger)
+    state.jobs.start()
+
+    generation_cache_config : dict = config['generation-cache']
+
+    state.generation_cache = ResultCache(
+        database[generation_cache_config['collection-name']] if generation_cache_config['persist'] else None , 
+        generation_cache_config , 
+        logger
+    ) if generation_cache_config['enabled'] else None
+
+    state.idempotency = ResultCache(
+        database[config['idempotency']['collection-name']] if config['idempotency']['persist'] else None , 
+        config['idempotency'] , 
+        logger , 
+        detached = True
+    )
+
+    registry.add_collector(stats_collector('vps_llm_json_total' , 'Outcomes of parsing JSON generations.' , json_stats))
+    registry.add_collector(stats_collector('vps_tts_cache_total' , 'TTS cache hits, misses and evictions.' , state.tts_cache.stats))
+    registry.add_collector(stats_collector('vps_idempotency_total' , 'Idempotency-Key lookups by outcome.' , state.idempotency.stats))
+    registry.add_collector(stats_collector('vps_scenario_read_cache_total' , 'Scenario read cache lookups by outcome.' , state.scenario_reads.stats))
+    registry.add_collector(state.admission.collect)
+    registry.add_collector(stats_collector('vps_voxio_flow_sync_total' , 'Voxio flow writes by kind, and the request body bytes they sent.' , voxio_client.stats))
+    registry.add_collector(stats_collector('vps_gemini_context_cache_total' , 'Gemini context cache entries and lookups by outcome.' , state.context_cache.stats))
+
+    if state.generation_cache is not None : 
+        registry.add_collector(stats_collector('vps_generation_cache_total' , 'Scenario generation cache lookups by outcome.' , state.generation_cache.stats))
+
+    async def warm_gemini() -> None : 
+
+        await gemini_client.get()
+        await state.assets.start(config['assets']['reload-interval'])
+
+    async def warm_mongo() -> None : 
+
+        await mongo_client.admin.command('ping')
+        await state.scenario_repository.start()
+        await state.jobs.store.start()
+        await state.idempotency.start()
+
+        if state.generation_cache is not None : await state.generation_cache.start()
+
+    # * The checks run concurrently in the background, so the port opens right away and `/ready` reports progress
+    state.startup = Startup(logger , config['startup']['retry-interval'])
+    state.startup.add('gemini' , warm_gemini)
+    state.startup.add('mongo' , warm_mongo)
+    state.startup.add('voxio' , lambda : voxio_client.warm(config['voxio']['warm-connections']))
+    state.startup.add('tts-cache' , state.tts_cache.start)
+    state.startup.start()
+
+    async def prewarm() -> None : 
+
+        await state.startup.wait()
+
+        await prewarm_tts_cache(
+            cache = state.tts_cache , 
+            texts = find_speak_strings(state.assets.get('add-scenario').workflow) , 
+            fetch = lambda text : deepgram_tts(text , config['tts']) , 
+            model = config['tts']['model'] , 
+            encoding = config['tts']['encoding'] , 
+            logger = logger
+        )
+
+    if config['tts']['cache']['prewarm'] : prewarm_task = asyncio.create_task(prewarm())
     
     logger.info("System Startup: Models and Config Loaded.")
+
+    loop_name , http_name = resolve_implementations(config['server'])
+    logger.info(f'Worker {os.getpid()} serving with the {loop_name} loop and {http_name} parser.')
     
     yield
     
+    if config['tts']['cache']['prewarm'] : prewarm_task.cancel()
+
+    await state.jobs.stop(config['jobs']['drain-timeout'])
+    state.profiling.memory.stop()
+    await state.idempotency.stop()
+    await state.scenario_reads.stop()
+
+    if state.generation_cache is not None : await state.generation_cache.stop()
+
+    await state.startup.stop()
+    await state.tts_cache.stop()
+    await state.assets.stop()
+    await state.context_cache.stop()
+    await state.scenario_repository.close()
+    await mongo_client.close()
+    await voxio_client.aclose()
+
     logger.info("System Shutdown.")
 
-app = FastAPI(lifespan = lifespan)
+    stop_logger()
+
+app = FastAPI(lifespan = lifespan , default_response_class = FastJSONResponse)
+
+app.add_middleware(MetricsMiddleware)
+
+app.add_middleware(DeadlineMiddleware)
+
+# * Read once the lifespan has loaded the config, the first upload comes after it
+app.add_middleware(UploadLimitMiddleware , paths = ('/stt' ,) , max_bytes = lambda : state.config['stt']['max-upload-bytes'])
 
 app.add_middleware(
     CORSMiddleware , 
@@ -55,78 +211,737 @@ app.add_middleware(
     allow_headers = env_str_to_list(os.environ['ALLOWED_HEADERS']) 
 )
 
+# * Added last so it is the outermost layer and every log line of a request carries its id
+app.add_middleware(RequestIdMiddleware)
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open(request : Request , e : CircuitOpen) -> JSONResponse : 
+
+    return JSONResponse({'detail' : str(e)} , status_code = 503 , headers = {'Retry-After' : str(e.retry_after)})
+
+# * An upstream bulkhead that found no free slot within its `max-wait` once the request was admitted
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request : Request , e : AdmissionRejected) -> JSONResponse : 
+
+    return JSONResponse({'detail' : str(e)} , status_code = e.status_code , headers = {'Retry-After' : str(e.retry_after)})
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request : Request , e : DeadlineExceeded) -> JSONResponse : 
+
+    return JSONResponse({'detail' : str(e)} , status_code = 504)
+
+@app.exception_handler(ProfilerBusy)
+async def profiler_busy(request : Request , e : ProfilerBusy) -> JSONResponse : 
+
+    return JSONResponse({'detail' : str(e)} , status_code = 409)
+
+@app.get('/metrics')
+async def metrics() -> PlainTextResponse : 
+
+    return PlainTextResponse(registry.render() , media_type = 'text/plain; version=0.0.4')
+
+# * What the scenario pipelines call; the read endpoints only need Mongo
+SCENARIO_CHECKS : tuple[str , ...] = ('gemini' , 'mongo' , 'voxio')
+READ_CHECKS : tuple[str , ...] = ('mongo' ,)
+
+async def require_ready(*checks : str) -> None : 
+    '''
+    Waits for the startup checks a request needs, for up to `startup.request-wait` seconds
+    and never past the request deadline : 503 with `Retry-After` when they have not passed by then,
+    so requests do not pile up behind an upstream that is down at boot
+    '''
+
+    if state.startup.ready_for(*checks) : return
+
+    config : dict = state.config['startup']
+
+    try : 
+
+        async with within_deadline(config['request-wait']) : await state.startup.wait(*checks)
+
+    except DeadlineExceeded : raise
+
+    except TimeoutError : raise HTTPException(
+        status_code = 503 , 
+        detail = 'The service is still starting : ' + ' , '.join(
+            f'{name} {state.startup.status[name]}' for name in checks if not state.startup.ready_for(name)
+        ) , 
+        headers = {'Retry-After' : str(max(1 , math.ceil(config['retry-interval'])))}
+    ) from None
+
+@app.get('/ready')
+async def ready() -> JSONResponse : 
+    '''
+    Readiness probe : 200 once every client is built and every pool is warm, 503 until then
+    '''
+
+    return JSONResponse(state.startup.report() , status_code = 200 if state.startup.ready else 503)
+
+async def run_add_scenario(query : str , on_text = None) -> dict : 
+
+    return await add_scenario_route(
+        query = query , 
+        scenario_repository = state.scenario_repository , 
+        gemini_client = state.gemini_client.client , 
+        voxio_client = state.voxio_client , 
+        assets = state.assets.get('add-scenario') , 
+        config = state.config['add-scenario'] , 
+        generation_cache = state.generation_cache , 
+        on_text = on_text
+    )
+
+async def run_edit_scenario(query : str , api_key : str , on_text = None) -> dict : 
+
+    return await edit_scenario_route(
+        query = query , 
+        scenario_repository = state.scenario_repository , 
+        gemini_client = state.gemini_client.client , 
+        voxio_client = state.voxio_client , 
+        assets = state.assets.get('edit-scenario') , 
+        config = state.config['edit-scenario'] , 
+        api_key = api_key , 
+        on_text = on_text
+    )
+
+def admit(
+    request : Request , 
+    endpoint : str , 
+    api_key : str | None = None , 
+    shed : bool = True
+) -> None : 
+    '''
+    Admission control of an expensive request : 429 past a rate limit, 503 when an upstream
+    it needs is overloaded, both with `Retry-After`. The tenant is the `api_key` of the
+    request or, without one, its client address
+    '''
+
+    try : state.admission.admit(endpoint , api_key or (request.client.host if request.client else '-') , shed)
+
+    except AdmissionRejected as e : raise HTTPException(
+        status_code = e.status_code , 
+        detail = str(e) , 
+        headers = {'Retry-After' : str(e.retry_after)}
+    )
+
+def wants_job(request : Request) -> bool : 
+    '''
+    A client opts into job mode with `Prefer: respond-async` or `?mode=async`
+    '''
+
+    return 'respond-async' in request.headers.get('prefer' , '') or request.query_params.get('mode') == 'async'
+
+async def submit_job(kind : str , work) -> dict : 
+
+    try : job = await state.jobs.submit(kind , work)
+
+    except JobQueueFull as e : raise HTTPException(
+        status_code = 503 , 
+        detail = str(e) , 
+        headers = {'Retry-After' : '5'}
+    )
+
+    return {
+        'job_id' : job.id , 
+        'status_url' : f'/jobs/{job.id}' , 
+        'events_url' : f'/jobs/{job.id}/events'
+    }
+
+def job_accepted(job : dict) -> JSONResponse : 
+
+    return FastJSONResponse(job , status_code = 202 , headers = {'Location' : job['status_url']})
+
+async def run_idempotent(
+    request : Request , 
+    scope : str , 
+    data : dict , 
+    run , 
+    should_store = None
+) -> dict : 
+    '''
+    Runs a POST at most once per `Idempotency-Key` : a retry with the same key and body gets
+    the stored result, or waits for the original while it is still running
+    '''
+
+    key : str | None = request.headers.get('idempotency-key')
+
+    if not key : return await run()
+
+    fingerprint : str = request_fingerprint(data)
+
+    async def run_once() -> dict : return {'fingerprint' : fingerprint , 'response' : await run()}
+
+    entry : dict = await state.idempotency.get_or_run(
+        f'{scope}:{key}' , 
+        run_once , 
+        None if should_store is None else lambda entry : should_store(entry['response'])
+    )
+
+    if entry['fingerprint'] != fingerprint : raise HTTPException(
+        status_code = 422 , 
+        detail = "Idempotency-Key was already used with a different request body."
+    )
+
+    return entry['response']
+
+def succeeded(response : dict) -> bool : return response.get('status') == 'success'
+
 @app.post('/add-scenario')
-async def add_scenario(request : Request) -> dict : 
+async def add_scenario(request : Request) : 
+
+    body : AddScenarioRequest = await decode_request(request , AddScenarioRequest , "Missing 'scenario_prompt' in request body.")
+    data : dict = body.model_dump()
+
+    await require_ready(*SCENARIO_CHECKS)
+
+    # * A job waits in the bounded job queue instead, so only the rate limits apply to it
+    admit(request , 'add-scenario' , shed = not wants_job(request))
+
+    if wants_job(request) : return job_accepted(await run_idempotent(
+        request , 
+        'add-scenario-job' , 
+        data , 
+        lambda : submit_job('add-scenario' , lambda : run_add_scenario(data['scenario_prompt']))
+    ))
+
+    response : dict | None = await cancel_on_disconnect(request , run_idempotent(
+        request , 
+        'add-scenario' , 
+        data , 
+        lambda : run_add_scenario(data['scenario_prompt']) , 
+        succeeded
+    ))
+
+    if response is None : raise HTTPException(
+        status_code = 499 , 
+        detail = "Client disconnected before the scenario was generated."
+    )
+
+    return FastJSONResponse({'response' : response})
+
+@app.post('/edit-scenario')
+async def edit_scenario(request : Request) : 
+
+    body : EditScenarioRequest = await decode_request(request , EditScenarioRequest , "Missing 'api_key' or 'scenario_prompt' in request body.")
+    data : dict = body.model_dump()
+
+    await require_ready(*SCENARIO_CHECKS)
+
+    admit(request , 'edit-scenario' , data['api_key'] , shed = not wants_job(request))
+
+    if wants_job(request) : return job_accepted(await run_idempotent(
+        request , 
+        'edit-scenario-job' , 
+        data , 
+        lambda : submit_job('edit-scenario' , lambda : run_edit_scenario(data['scenario_prompt'] , data['api_key']))
+    ))
+
+    response : dict | None = await cancel_on_disconnect(request , run_idempotent(
+        request , 
+        'edit-scenario' , 
+        data , 
+        lambda : run_edit_scenario(data['scenario_prompt'] , data['api_key']) , 
+        succeeded
+    ))
+
+    if response is None : raise HTTPException(
+        status_code = 499 , 
+        detail = "Client disconnected before the scenario was edited."
+    )
+
+    return FastJSONResponse({'response' : response})
+
+def event_stream(request : Request , events) -> StreamingResponse : 
+    '''
+    Streams event dicts as Server-Sent Events, or as NDJSON when the client accepts
+    `application/x-ndjson` or passes `?format=ndjson`
+    '''
+
+    ndjson : bool = 'application/x-ndjson' in request.headers.get('accept' , '') or request.query_params.get('format') == 'ndjson'
+
+    async def encoded() : 
+
+        async for event in events : 
+
+            if ndjson : yield dumps(event) + b'\n'
+            else : yield b'event: ' + event['event'].encode() + b'\ndata: ' + dumps(event) + b'\n\n'
+
+    return StreamingResponse(
+        encoded() , 
+        media_type = 'application/x-ndjson' if ndjson else 'text/event-stream' , 
+        headers = {'Cache-Control' : 'no-cache' , 'X-Accel-Buffering' : 'no'}
+    )
+
+def stream_scenario(request : Request , run) -> StreamingResponse : 
+    '''
+    Runs a scenario pipeline and streams it as Server-Sent Events, or as NDJSON when the
+    client accepts `application/x-ndjson` : `delta` events carry the generated name and
+    prompt as they arrive, `stage` events the pipeline stages, and a last `result` or `error` event ends it
+    '''
+
+    async def events() : 
+
+        queue : asyncio.Queue = asyncio.Queue()
+        fields = StringFieldStream(('scenario_name' , 'scenario_prompt'))
+
+        def on_text(chunk : str) -> None : 
+
+            for field , text in fields.feed(chunk) : queue.put_nowait({'event' : 'delta' , 'field' : field , 'text' : text})
+
+        def on_stage(stage : str , duration : float | None) -> None : 
+
+            if duration is None : queue.put_nowait({'event' : 'stage' , 'stage' : stage})
+
+        # * The task copies the context, so only the pipeline reports its stages here
+        token = stage_listener_var.set(on_stage)
+
+        try : task = asyncio.create_task(run(on_text))
+        finally : stage_listener_var.reset(token)
+
+        task.add_done_callback(lambda _ : queue.put_nowait(None))
+
+        try : 
+
+            while (event := await queue.get()) is not None : yield event
+
+            try : yield {'event' : 'result' , 'response' : task.result()}
+            except Exception as e : yield {'event' : 'error' , 'detail' : str(e)}
+
+        # * The client went away mid-stream : stop paying for the generation
+        finally : task.cancel()
+
+    return event_stream(request , events())
+
+@app.post('/add-scenario/stream')
+async def add_scenario_stream(request : Request) -> StreamingResponse : 
+
+    body : AddScenarioRequest = await decode_request(request , AddScenarioRequest , "Missing 'scenario_prompt' in request body.")
+
+    await require_ready(*SCENARIO_CHECKS)
+
+    admit(request , 'add-scenario')
+
+    return stream_scenario(request , lambda on_text : run_add_scenario(body.scenario_prompt , on_text))
+
+@app.post('/edit-scenario/stream')
+async def edit_scenario_stream(request : Request) -> StreamingResponse : 
+
+    body : EditScenarioRequest = await decode_request(request , EditScenarioRequest , "Missing 'api_key' or 'scenario_prompt' in request body.")
+
+    await require_ready(*SCENARIO_CHECKS)
+
+    admit(request , 'edit-scenario' , body.api_key)
+
+    return stream_scenario(request , lambda on_text : run_edit_scenario(body.scenario_prompt , body.api_key , on_text))
+
+@app.post('/add-scenarios')
+async def add_scenarios(request : Request) -> StreamingResponse : 
+    '''
+    Batch of `/add-scenario` : one `item` event per prompt, tagged with its `index`, in
+    completion order, then a `summary` event; a failed item does not stop the others
+    '''
 
-    data : dict = await request.json()
+    body : AddScenariosRequest = await decode_request(request , AddScenariosRequest , "'scenario_prompts' must be a non-empty list of strings.")
+    config : dict = state.config['add-scenarios']
 
-    if ('scenario_prompt' not in data) : raise HTTPException(
+    queries : list[str] = body.scenario_prompts
+
+    if not queries : raise HTTPException(
         status_code = 400 , 
-        detail = "Missing 'scenario_prompt' in request body."
+        detail = "'scenario_prompts' must be a non-empty list of strings."
     )
 
-    response : dict = await add_scenario_route(
-        query = data['scenario_prompt'] , 
-        mongo_client = state.mongo_client , 
-        gemini_client = state.gemini_client , 
-        config = state.config['add-scenario']
+    if len(queries) > config['max-items'] : raise HTTPException(
+        status_code = 413 , 
+        detail = f"At most {config['max-items']} scenario prompts per batch."
     )
 
-    return {'response' : response}
+    await require_ready(*SCENARIO_CHECKS)
 
-@app.post('/edit-scenario')
-async def edit_scenario(request : Request) -> dict : 
+    admit(request , 'add-scenarios')
+
+    async def events() : 
+
+        succeeded : int = 0
+
+        async for result in add_scenarios_route(
+            queries = queries , 
+            scenario_repository = state.scenario_repository , 
+            gemini_client = state.gemini_client.client , 
+            voxio_client = state.voxio_client , 
+            assets = state.assets.get('add-scenario') , 
+            config = state.config['add-scenario'] , 
+            max_concurrency = config['max-concurrency'] , 
+            generation_cache = state.generation_cache
+        ) : 
+
+            succeeded += result.get('status') == 'success'
+
+            yield {'event' : 'item' , **result}
+
+        yield {'event' : 'summary' , 'total' : len(queries) , 'succeeded' : succeeded , 'failed' : len(queries) - succeeded}
+
+    return event_stream(request , events())
+
+def read_fields(request : Request , default : tuple[str , ...]) -> tuple[str , ...] : 
+    '''
+    The scenario fields asked for with `?fields=a,b`, the default ones without it
+    '''
+
+    fields : str | None = request.query_params.get('fields')
 
-    data : dict = await request.json()
+    if not fields : return default
 
-    if ('api_key' not in data or 'scenario_prompt' not in data) : raise HTTPException(
+    requested : tuple[str , ...] = tuple(sorted({field.strip() for field in fields.split(',') if field.strip()}))
+
+    if not requested or any(field not in SCENARIO_FIELDS for field in requested) : raise HTTPException(
         status_code = 400 , 
-        detail = "Missing 'api_key' or 'scenario_prompt' in request body."
+        detail = f"'fields' must be a comma separated list of : {', '.join(SCENARIO_FIELDS)}."
     )
 
-    response : dict = await edit_scenario_route(
-        query = data['scenario_prompt'] , 
-        mongo_client = state.mongo_client , 
-        gemini_client = state.gemini_client , 
-        config = state.config['edit-scenario'] , 
-        api_key = data['api_key']
+    return requested
+
+async def cached_read(request : Request , key : str , read) -> Response : 
+    '''
+    Serves a scenario read from the short-TTL read cache, which keeps the encoded body and
+    its ETag : a client sending the ETag back in `If-None-Match` gets an empty 304. Any
+    scenario write drops the cache of the worker that made it
+    '''
+
+    async def run() -> dict : 
+
+        content : dict | None = await read()
+
+        if content is None : return {'status_code' : 404 , 'body' : dumps({'detail' : 'Scenario not found.'})}
+
+        body : bytes = dumps(content)
+
+        return {'status_code' : 200 , 'body' : body , 'etag' : etag(body)}
+
+    entry : dict = await state.scenario_reads.get_or_run(key , run)
+
+    if entry['status_code'] != 200 : return Response(entry['body'] , status_code = entry['status_code'] , media_type = 'application/json')
+
+    headers : dict = {'ETag' : entry['etag'] , 'Cache-Control' : 'no-cache'}
+
+    if etag_matches(request.headers.get('if-none-match') , entry['etag']) : return Response(status_code = 304 , headers = headers)
+
+    return Response(entry['body'] , media_type = 'application/json' , headers = headers)
+
+@app.get('/scenarios')
+async def list_scenarios(request : Request , limit : int | None = None , after : str | None = None) -> Response : 
+    '''
+    Scenarios newest first, a page at a time : pass the `next_cursor` of a page as `after`
+    to get the next one. Only the summary fields are returned unless `?fields=` asks for others
+    '''
+
+    config : dict = state.config['scenario-reads']
+
+    limit = config['page-size'] if limit is None else limit
+
+    if not 1 <= limit <= config['max-page-size'] : raise HTTPException(
+        status_code = 400 , 
+        detail = f"'limit' must be between 1 and {config['max-page-size']}."
+    )
+
+    if after is not None and not ObjectId.is_valid(after) : raise HTTPException(
+        status_code = 400 , 
+        detail = "'after' is not a cursor returned by this endpoint."
+    )
+
+    fields : tuple[str , ...] = read_fields(request , SCENARIO_SUMMARY_FIELDS)
+
+    await require_ready(*READ_CHECKS)
+
+    admit(request , 'scenarios')
+
+    return await cached_read(request , f'list:{after}:{limit}:{",".join(fields)}' , lambda : list_scenarios_route(
+        scenario_repository = state.scenario_repository , 
+        limit = limit , 
+        after = None if after is None else ObjectId(after) , 
+        fields = fields
+    ))
+
+@app.get('/scenarios/{api_key}')
+async def get_scenario(request : Request , api_key : str) -> Response : 
+
+    fields : tuple[str , ...] = read_fields(request , SCENARIO_FIELDS)
+
+    await require_ready(*READ_CHECKS)
+
+    admit(request , 'scenarios' , api_key)
+
+    return await cached_read(request , f'scenario:{api_key}:{",".join(fields)}' , lambda : get_scenario_route(
+        scenario_repository = state.scenario_repository , 
+        api_key = api_key , 
+        fields = fields
+    ))
+
+@app.get('/jobs/{job_id}')
+async def get_job(job_id : str) -> dict : 
+
+    job = await state.jobs.store.get(job_id)
+
+    if job is None : raise HTTPException(
+        status_code = 404 , 
+        detail = f"No job found with id: {job_id}"
+    )
+
+    return job.to_dict()
+
+@app.get('/jobs/{job_id}/events')
+async def job_events(job_id : str) -> StreamingResponse : 
+    '''
+    Server-Sent Events : a `progress` event on every stage change, then one `done` event
+    '''
+
+    job = await state.jobs.store.get(job_id)
+
+    if job is None : raise HTTPException(
+        status_code = 404 , 
+        detail = f"No job found with id: {job_id}"
     )
 
-    return {'response' : response}
+    async def events() : 
+
+        async for snapshot in state.jobs.store.updates(job) : 
+
+            event : str = 'done' if snapshot['status'] in TERMINAL_STATUSES else 'progress'
+
+            yield b'event: ' + event.encode() + b'\ndata: ' + dumps(snapshot) + b'\n\n'
+
+    return StreamingResponse(
+        events() , 
+        media_type = 'text/event-stream' , 
+        headers = {'Cache-Control' : 'no-cache' , 'X-Accel-Buffering' : 'no'}
+    )
 
 @app.post('/stt')
-async def stt(file : UploadFile) : 
+async def stt(request : Request , file : UploadFile) : 
     '''
     Endpoint for Speech to Text using Deepgram
     '''
 
-    audio_bytes : bytes = await file.read()
+    admit(request , 'stt')
 
-    response = state.deepgram_client.listen.v1.media.transcribe_file(
-        request = audio_bytes , 
-        model = "nova-3"
-    )
+    try : 
 
-    transcription : str = response.results.channels[0].alternatives[0].transcript
+        # * Before the breaker : an oversized upload is the client's fault, not Deepgram's
+        check_upload_size(file , state.config['stt']['max-upload-bytes'])
+
+        async with within_deadline() : 
+
+            with get_breaker('deepgram').guard() : transcription : str = await transcribe_upload(await state.deepgram_client.get() , file , state.config['stt'])
+
+    except UploadTooLarge as e : raise HTTPException(
+        status_code = 413 , 
+        detail = str(e)
+    )
 
     return transcription
 
+@app.websocket('/ws/stt')
+async def stt_websocket(
+    websocket : WebSocket , 
+    encoding : str | None = None , 
+    sample_rate : str | None = None
+) : 
+    '''
+    Live Speech to Text : binary audio frames in, interim and final transcripts out.
+    A session over the rate limits, or with Deepgram overloaded or its breaker open, is
+    closed with 1013 (try again later)
+    '''
+
+    # * Before the handshake completes, so a rejected client costs no Deepgram session
+    try : state.admission.admit('stt' , websocket.client.host if websocket.client else '-')
+
+    except AdmissionRejected as e : return await websocket.close(code = 1013 , reason = str(e))
+
+    await websocket.accept()
+
+    try : 
+
+        with get_breaker('deepgram').guard() : await relay_live_transcription(
+            websocket , 
+            await state.deepgram_client.get() , 
+            state.config['stt'] , 
+            encoding = encoding , 
+            sample_rate = sample_rate
+        )
+
+    except (AdmissionRejected , CircuitOpen) as e : 
+
+        with contextlib.suppress(RuntimeError) : await websocket.close(code = 1013 , reason = str(e))
+
+        return
+
+    with contextlib.suppress(RuntimeError) : await websocket.close()
+
+async def deepgram_tts(text : str , config : dict) : 
+
+    time_left()
+
+    with get_breaker('deepgram').guard() : 
+
+        async for chunk in stream_tts(await state.deepgram_client.get() , text , config , state.logger) : yield chunk
+
+def cached_tts(text : str , on_miss = None) : 
+
+    config : dict = state.config['tts']
+
+    return state.tts_cache.stream(
+        state.tts_cache.key(text , config['model'] , config['encoding']) , 
+        lambda : deepgram_tts(text , config) , 
+        on_miss
+    )
+
 @app.post('/tts')
-async def tts(text : str) : 
+async def tts(request : Request , text : str) : 
+    '''
+    Endpoint for Text to Speech using Deepgram, audio is forwarded chunk by chunk as it is synthesized.
+    Only a cache miss is admitted, cached audio costs no upstream call
+    '''
+
+    try : audio_stream = await prefetch(cached_tts(text , lambda : admit(request , 'tts')))
 
-    response = state.deepgram_client.speak.v1.audio.generate(
-        text = text , 
-        model = "aura-2-asteria-en"
+    except (AdmissionRejected , CircuitOpen , DeadlineExceeded , HTTPException) : raise
+
+    except Exception as e : raise HTTPException(
+        status_code = 502 , 
+        detail = f"Text to speech failed: {e}"
     )
 
-    audio_data = b"".join(response)
-    
-    with open("output.mp3", "wb") as audio_file:
-        audio_file.write(audio_data)
-    return FileResponse("output.mp3" , media_type = "audio/mpeg" , filename = "output.mp3")
-
-def main() : uvicorn.run(
-    app , 
-    host = '0.0.0.0' , 
-    port = 8888
-)
\ No newline at end of file
+    return StreamingResponse(
+        audio_stream , 
+        media_type = state.config['tts']['media-type'] , 
+        headers = {'Content-Disposition' : 'attachment; filename="output.mp3"'}
+    )
+
+@app.websocket('/ws/tts')
+async def tts_websocket(websocket : WebSocket) : 
+    '''
+    Streaming Text to Speech : every text message is answered with binary audio chunks
+    followed by a `{"event" : "done"}` message, so playback can start on the first chunk
+    '''
+
+    await websocket.accept()
+
+    try : 
+
+        while True : 
+
+            text : str = await websocket.receive_text()
+
+            try : 
+
+                async for chunk in cached_tts(text) : 
+                    await websocket.send_bytes(chunk)
+
+                await websocket.send_json({'event' : 'done'})
+
+            except WebSocketDisconnect : raise
+
+            except Exception as e : await websocket.send_json({'event' : 'error' , 'detail' : str(e)})
+
+    except WebSocketDisconnect : pass
+
+def require_admin(request : Request) -> None : 
+    '''
+    The admin endpoints exist only with `profiling.enabled` and an `ADMIN_API_KEY` set,
+    and answer only to `Authorization: Bearer <ADMIN_API_KEY>`
+    '''
+
+    key : str = os.environ.get('ADMIN_API_KEY' , '')
+
+    if not state.config['profiling']['enabled'] or not key : raise HTTPException(status_code = 404 , detail = 'Not Found')
+
+    if not hmac.compare_digest(request.headers.get('authorization' , '').encode() , f'Bearer {key}'.encode()) : raise HTTPException(
+        status_code = 401 , 
+        detail = 'Admin endpoints need the admin API key.' , 
+        headers = {'WWW-Authenticate' : 'Bearer'}
+    )
+
+def profile_seconds(seconds : float) -> float : 
+
+    max_seconds : float = state.config['profiling']['max-seconds']
+
+    if not 0 < seconds <= max_seconds : raise HTTPException(
+        status_code = 400 , 
+        detail = f"'seconds' must be more than 0 and at most {max_seconds}."
+    )
+
+    return seconds
+
+@app.post('/admin/profile/cpu' , include_in_schema = False)
+async def profile_cpu(request : Request , seconds : float = 10 , all_threads : bool = False) -> PlainTextResponse : 
+    '''
+    Samples the stacks of this worker for `seconds` seconds, the event loop thread alone
+    unless `all_threads` is set, and returns them as collapsed stacks for a flamegraph
+    '''
+
+    require_admin(request)
+
+    stacks , samples = await state.profiling.cpu.profile(profile_seconds(seconds) , all_threads)
+
+    return PlainTextResponse(stacks , headers = {'X-Profile-Samples' : str(samples) , 'X-Worker-Pid' : str(os.getpid())})
+
+@app.post('/admin/profile/loop' , include_in_schema = False)
+async def profile_loop(request : Request , seconds : float = 10) -> dict : 
+    '''
+    Watches the event loop of this worker for `seconds` seconds : its lag and the callbacks that blocked it
+    '''
+
+    require_admin(request)
+
+    return {'pid' : os.getpid() , **await state.profiling.loop.monitor(profile_seconds(seconds))}
+
+@app.post('/admin/profile/methods' , include_in_schema = False)
+async def profile_methods(request : Request , seconds : float = 10) -> dict : 
+    '''
+    Times the hot-path methods marked with `method_log_timer` in this worker for `seconds` seconds
+    '''
+
+    require_admin(request)
+
+    return {'pid' : os.getpid() , 'seconds' : seconds , 'methods' : await state.profiling.methods.time(profile_seconds(seconds))}
+
+@app.post('/admin/memory/start' , include_in_schema = False)
+async def memory_start(request : Request , frames : int | None = None) -> dict : 
+    '''
+    Starts tracing the allocations of this worker and takes the first snapshot
+    '''
+
+    require_admin(request)
+
+    return {'pid' : os.getpid() , 'started' : await state.profiling.memory.start(frames or state.config['profiling']['tracemalloc-frames'])}
+
+@app.get('/admin/memory/diff' , include_in_schema = False)
+async def memory_diff(request : Request , top : int | None = None , group_by : str = 'lineno') -> dict : 
+    '''
+    The allocation sites of this worker grown the most since the last snapshot, which the
+    new snapshot replaces : calling it again later shows the growth in between
+    '''
+
+    require_admin(request)
+
+    if group_by not in ('lineno' , 'filename' , 'traceback') : raise HTTPException(
+        status_code = 400 , 
+        detail = "'group_by' must be lineno, filename or traceback."
+    )
+
+    diff : dict | None = await state.profiling.memory.diff(top or state.config['profiling']['top'] , group_by)
+
+    if diff is None : raise HTTPException(
+        status_code = 409 , 
+        detail = 'Memory tracing is off, start it with POST /admin/memory/start.'
+    )
+
+    return {'pid' : os.getpid() , **diff}
+
+@app.post('/admin/memory/stop' , include_in_schema = False)
+async def memory_stop(request : Request) -> dict : 
+
+    require_admin(request)
+
+    return {'pid' : os.getpid() , 'stopped' : state.profiling.memory.stop()}
+
+def main() : serve('vps.app:app' , load_config()['server'])
\ No newline at end of file
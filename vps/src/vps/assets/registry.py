@@ -0,0 +1,157 @@
+import asyncio
+import contextlib
+import json
+import os
+import signal
+from collections.abc import Awaitable , Callable
+from logging import Logger
+from typing import TYPE_CHECKING
+
+from ..llm import get_scenario_schema , prompt_digest
+from ..services import create_generation_config , run_in_thread
+from ..voxio import FlowTemplate
+
+if TYPE_CHECKING : from google.genai.types import GenerateContentConfig
+
+# * Where each generated scenario field goes in the workflow
+WORKFLOW_FIELDS : dict[str , tuple[str , ...]] = {
+    'questions_for_feedback' : ('variables' , 'feedback_questions' , 'value') , 
+    'scenario_prompt' : ('nodes' , 'llm' , 'parameters' , 'system_prompt') , 
+}
+
+def _read_text(path : str) -> str : 
+
+    with open(path) as file : return file.read()
+
+def _read_json(path : str) -> dict : 
+
+    with open(path) as file : return json.load(file)
+
+class ScenarioAssets : 
+    '''
+    Prompt, generation config and workflow template of one scenario route, the template
+    also pre-encoded as a flow body.
+    '''
+
+    def __init__(
+        self , 
+        system_prompt : str , 
+        generation_config : 'GenerateContentConfig' , 
+        workflow : dict
+    ) -> None : 
+
+        self.system_prompt = system_prompt
+        self.generation_config = generation_config
+        self.workflow = workflow
+        self.flow_template = FlowTemplate(workflow , WORKFLOW_FIELDS)
+
+        # * Changes whenever the prompt file does, so cached generations of an old prompt are not reused
+        self.prompt_version : str = prompt_digest(system_prompt)
+
+class AssetRegistry : 
+    '''
+    Loads the scenario assets once and reloads them when their files change on disk
+    (polled every `reload-interval` seconds) or when the process receives SIGHUP.
+    `on_load` is awaited with the prompt versions in service after every load.
+    '''
+
+    def __init__(
+        self , 
+        configs : dict[str , dict] , 
+        logger : Logger | None = None , 
+        on_load : Callable[[set[str]] , Awaitable[None]] | None = None
+    ) -> None : 
+
+        self.configs = configs
+        self.logger = logger
+        self.on_load = on_load
+
+        self.assets : dict[str , ScenarioAssets] = {}
+        self.mtimes : dict[str , float] = {}
+
+        self.watcher : asyncio.Task | None = None
+
+    def get(self , name : str) -> ScenarioAssets : return self.assets[name]
+
+    async def load(self) -> None : 
+
+        assets : dict[str , ScenarioAssets] = {}
+        mtimes : dict[str , float] = {}
+
+        for name , config in self.configs.items() : 
+
+            system_prompt : str = await run_in_thread(_read_text , config['prompt-path'])
+            workflow : dict = await run_in_thread(_read_json , config['workflow-path'])
+
+            assets[name] = ScenarioAssets(
+                system_prompt = system_prompt , 
+                generation_config = await create_generation_config(system_prompt , get_scenario_schema()) , 
+                workflow = workflow
+            )
+
+            for path in (config['prompt-path'] , config['workflow-path']) : mtimes[path] = os.path.getmtime(path)
+
+        # * Swapped in one go so a request never sees half a reload
+        self.assets , self.mtimes = assets , mtimes
+
+        if self.on_load is not None : await self.on_load({scenario.prompt_version for scenario in assets.values()})
+
+    def _changed(self) -> bool : 
+
+        for path , mtime in self.mtimes.items() : 
+
+            try : 
+                if os.path.getmtime(path) != mtime : return True
+
+            except OSError : return False
+
+        return False
+
+    async def reload_if_changed(self) -> bool : 
+
+        if not await run_in_thread(self._changed) : return False
+
+        await self.reload()
+
+        return True
+
+    async def reload(self) -> None : 
+
+        try : 
+
+            await self.load()
+
+            if self.logger : self.logger.info('Scenario assets reloaded.')
+
+        # * A broken edit on disk keeps the last good assets in service
+        except Exception as e : 
+
+            if self.logger : self.logger.error(f'Failed to reload scenario assets : {e}')
+
+    async def _watch(self , interval : float) -> None : 
+
+        while True : 
+
+            await asyncio.sleep(interval)
+            await self.reload_if_changed()
+
+    async def start(self , interval : float) -> None : 
+
+        await self.load()
+
+        self.watcher = asyncio.create_task(self._watch(interval))
+
+        loop = asyncio.get_running_loop()
+
+        with contextlib.suppress(NotImplementedError , RuntimeError , AttributeError) : 
+            loop.add_signal_handler(signal.SIGHUP , lambda : asyncio.ensure_future(self.reload()))
+
+    async def stop(self) -> None : 
+
+        if self.watcher is not None : 
+
+            self.watcher.cancel()
+            self.watcher = None
+
+        with contextlib.suppress(NotImplementedError , RuntimeError , AttributeError) : 
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
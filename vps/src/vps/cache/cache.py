@@ -0,0 +1,240 @@
+import asyncio
+import copy
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Awaitable , Callable
+from datetime import datetime , timedelta , timezone
+from logging import Logger
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+
+from ..codec import dumps_canonical
+from ..services import method_log_timer
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def normalize_prompt(text : str) -> str : 
+    '''
+    Folds the differences that do not change what is asked for : unicode forms, case and whitespace.
+    '''
+
+    return _WHITESPACE_PATTERN.sub(' ' , unicodedata.normalize('NFKC' , text).casefold()).strip()
+
+def generation_key(
+    query : str , 
+    prompt_version : str , 
+    model : str
+) -> str : return hashlib.sha256(f'{model}\0{prompt_version}\0{normalize_prompt(query)}'.encode()).hexdigest()
+
+def request_fingerprint(data : dict) -> str : return hashlib.sha256(dumps_canonical(data)).hexdigest()
+
+class ResultCache : 
+    '''
+    TTL cache of JSON results with a bounded in-memory LRU tier, an optional Mongo tier
+    shared by every worker process, and single-flight : concurrent callers of a missing
+    key await one run. The run is a task of its own that counts its callers : when the
+    last one goes away it is cancelled, unless the cache is `detached`, where it runs on
+    so a retry finds its result.
+    '''
+
+    def __init__(
+        self , 
+        collection : AsyncCollection | None , 
+        config : dict , 
+        logger : Logger | None = None , 
+        detached : bool = False
+    ) -> None : 
+
+        self.collection = collection
+        self.logger = logger
+        self.detached = detached
+
+        self.ttl : float = config['ttl']
+        self.max_entries : int = config['max-entries']
+
+        self.entries : OrderedDict[str , tuple[float , dict]] = OrderedDict()
+        self.inflight : dict[str , asyncio.Task] = {}
+        self.waiters : dict[asyncio.Task , int] = {}
+
+        # * Bumped by `clear`, so a run started before it does not store what it read
+        self.epoch : int = 0
+
+        self.stats : dict[str , int] = {
+            'memory_hits' : 0 , 
+            'mongo_hits' : 0 , 
+            'misses' : 0 , 
+            'coalesced' : 0 , 
+            'not_stored' : 0 , 
+            'abandoned' : 0
+        }
+
+    async def start(self) -> None : 
+        '''
+        Makes sure expired entries leave Mongo through a TTL index.
+        '''
+
+        if self.collection is None : return
+
+        indexes : dict = await self.collection.index_information()
+
+        for index in indexes.values() : 
+
+            if index['key'] == [('expires_at' , ASCENDING)] and 'expireAfterSeconds' in index : return
+
+        await self.collection.create_index([('expires_at' , ASCENDING)] , expireAfterSeconds = 0 , name = 'expires_at_ttl')
+
+    async def stop(self) -> None : 
+
+        for task in list(self.inflight.values()) : task.cancel()
+
+    def clear(self) -> None : 
+        '''
+        Drops the in-memory entries once what they were computed from has changed. Runs
+        already in flight still answer their callers but their results are not kept, and
+        later callers start a new run. The Mongo tier is left as it is.
+        '''
+
+        self.epoch += 1
+        self.entries.clear()
+        self.inflight.clear()
+
+    def _remember(self , key : str , value : dict , expires : float) -> None : 
+
+        self.entries[key] = (expires , value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries : self.entries.popitem(last = False)
+
+    async def get(self , key : str) -> dict | None : 
+
+        entry : tuple[float , dict] | None = self.entries.get(key)
+
+        if entry is not None : 
+
+            if entry[0] > time.time() : 
+
+                self.entries.move_to_end(key)
+                self.stats['memory_hits'] += 1
+
+                return entry[1]
+
+            del self.entries[key]
+
+        if self.collection is None : return None
+
+        try : document : dict | None = await self.collection.find_one({'_id' : key})
+
+        except Exception as e : 
+
+            if self.logger : self.logger.warning(f'Could not read cache entry {key} : {e}')
+
+            return None
+
+        # * The TTL monitor only runs every minute, so expiry is checked here too
+        if document is None or document['expires_at'].replace(tzinfo = timezone.utc) <= datetime.now(timezone.utc) : return None
+
+        self.stats['mongo_hits'] += 1
+        self._remember(key , document['value'] , document['expires_at'].replace(tzinfo = timezone.utc).timestamp())
+
+        return document['value']
+
+    async def put(self , key : str , value : dict) -> None : 
+
+        self._remember(key , value , time.time() + self.ttl)
+
+        if self.collection is None : return
+
+        try : await self.collection.replace_one(
+            {'_id' : key} , 
+            {'_id' : key , 'value' : value , 'expires_at' : datetime.now(timezone.utc) + timedelta(seconds = self.ttl)} , 
+            upsert = True
+        )
+
+        except Exception as e : 
+
+            if self.logger : self.logger.warning(f'Could not persist cache entry {key} : {e}')
+
+    async def _run(
+        self , 
+        key : str , 
+        run : Callable[[] , Awaitable[dict]] , 
+        should_store : Callable[[dict] , bool] | None
+    ) -> dict : 
+
+        epoch : int = self.epoch
+
+        try : 
+
+            value : dict = await run()
+
+            if epoch == self.epoch and (should_store is None or should_store(value)) : await self.put(key , value)
+            else : self.stats['not_stored'] += 1
+
+            return value
+
+        finally : 
+
+            # * After a `clear` the key may already belong to a newer run
+            if self.inflight.get(key) is asyncio.current_task() : del self.inflight[key]
+
+    @method_log_timer
+    async def get_or_run(
+        self , 
+        key : str , 
+        run : Callable[[] , Awaitable[dict]] , 
+        should_store : Callable[[dict] , bool] | None = None
+    ) -> dict : 
+        '''
+        Returns the cached value of a key, running `run` once to produce it on a miss.
+
+        Args : 
+            - key (str) : The cache key.
+            - run (Callable) : Builds the coroutine producing the value.
+            - should_store (Callable) : Decides whether a produced value is kept, all are by default.
+
+        Returns : 
+            - dict : A private copy of the value, free for the caller to modify.
+        '''
+
+        task : asyncio.Task | None = self.inflight.get(key)
+
+        if task is None : 
+
+            value : dict | None = await self.get(key)
+
+            if value is not None : return copy.deepcopy(value)
+
+            # * Another caller may have started the run while Mongo was being read
+            task = self.inflight.get(key)
+
+        if task is None : 
+
+            self.stats['misses'] += 1
+
+            task = asyncio.create_task(self._run(key , run , should_store))
+            self.inflight[key] = task
+
+        else : self.stats['coalesced'] += 1
+
+        self.waiters[task] = self.waiters.get(task , 0) + 1
+
+        try : value = await asyncio.shield(task)
+
+        finally : 
+
+            self.waiters[task] -= 1
+
+            if not self.waiters[task] : 
+
+                del self.waiters[task]
+
+                # * The last caller went away : nobody is left to pay the run for
+                if not self.detached and not task.done() : 
+
+                    self.stats['abandoned'] += 1
+                    task.cancel()
+
+        return copy.deepcopy(value)
@@ -0,0 +1,2 @@
+from .codec import * 
+from .models import * 
\ No newline at end of file
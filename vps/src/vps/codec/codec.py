@@ -0,0 +1,103 @@
+import hashlib
+import json
+from typing import Any , TypeVar
+
+from fastapi import HTTPException , Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel , ValidationError
+
+# * orjson is a dependency; msgspec and the standard library only stand in where no orjson wheel installs
+try : 
+
+    import orjson
+
+    JSON_BACKEND : str = 'orjson'
+
+except ImportError : 
+
+    orjson = None
+
+    try : 
+
+        import msgspec
+
+        JSON_BACKEND = 'msgspec'
+
+    except ImportError : 
+
+        msgspec = None
+        JSON_BACKEND = 'json'
+
+# * Every backend writes compact UTF-8; `dumps_canonical` also sorts keys, so equal values encode to the same bytes
+if orjson is not None : 
+
+    def dumps(obj : Any) -> bytes : return orjson.dumps(obj)
+
+    def dumps_canonical(obj : Any) -> bytes : return orjson.dumps(obj , option = orjson.OPT_SORT_KEYS)
+
+    def loads(data : bytes | str) -> Any : return orjson.loads(data)
+
+elif msgspec is not None : 
+
+    _encoder = msgspec.json.Encoder()
+    _canonical_encoder = msgspec.json.Encoder(order = 'sorted')
+    _decoder = msgspec.json.Decoder()
+
+    def dumps(obj : Any) -> bytes : return _encoder.encode(obj)
+
+    def dumps_canonical(obj : Any) -> bytes : return _canonical_encoder.encode(obj)
+
+    def loads(data : bytes | str) -> Any : return _decoder.decode(data)
+
+else : 
+
+    _encoder = json.JSONEncoder(separators = (',' , ':') , ensure_ascii = False)
+    _canonical_encoder = json.JSONEncoder(separators = (',' , ':') , ensure_ascii = False , sort_keys = True)
+
+    def dumps(obj : Any) -> bytes : return _encoder.encode(obj).encode()
+
+    def dumps_canonical(obj : Any) -> bytes : return _canonical_encoder.encode(obj).encode()
+
+    def loads(data : bytes | str) -> Any : return json.loads(data)
+
+class FastJSONResponse(JSONResponse) : 
+    '''
+    `JSONResponse` rendered by the fastest JSON library installed. Returned directly from
+    a handler it also skips `jsonable_encoder`, so its content must already be plain JSON types.
+    '''
+
+    def render(self , content : Any) -> bytes : return dumps(content)
+
+def etag(body : bytes) -> str : return f'"{hashlib.sha256(body).hexdigest()[: 32]}"'
+
+def etag_matches(if_none_match : str | None , current : str) -> bool : 
+    '''
+    Whether an `If-None-Match` header names the current ETag, compared weakly as RFC 9110 asks.
+    '''
+
+    if not if_none_match : return False
+
+    return any(tag.strip().removeprefix('W/') in (current , '*') for tag in if_none_match.split(','))
+
+Model = TypeVar('Model' , bound = BaseModel)
+
+async def decode_request(
+    request : Request , 
+    model : type[Model] , 
+    detail : str
+) -> Model : 
+    '''
+    Parses and validates a JSON request body in one pass.
+
+    Args : 
+        - request (Request) : The request.
+        - model (type) : The pydantic model of its body.
+        - detail (str) : The 400 detail when the body is not valid JSON or does not fit the model.
+
+    Returns : 
+        - BaseModel : The body.
+    '''
+
+    try : return model.model_validate_json(await request.body())
+
+    except ValidationError : raise HTTPException(status_code = 400 , detail = detail) from None
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+
+class AddScenarioRequest(BaseModel) : 
+    '''
+    Body of `/add-scenario` and `/add-scenario/stream`.
+    '''
+
+    scenario_prompt : str
+
+class EditScenarioRequest(BaseModel) : 
+    '''
+    Body of `/edit-scenario` and `/edit-scenario/stream`.
+    '''
+
+    api_key : str
+    scenario_prompt : str
+
+class AddScenariosRequest(BaseModel) : 
+    '''
+    Body of `/add-scenarios`.
+    '''
+
+    scenario_prompts : list[str]
@@ -0,0 +1,407 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator , Awaitable , Callable
+from datetime import datetime , timedelta , timezone
+from logging import Logger
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+
+from ..metrics import JOB_QUEUE_DEPTH , JOB_RUN_SECONDS , JOB_WAIT_SECONDS , JOBS_TOTAL , stage_listener_var
+
+TERMINAL_STATUSES : set[str] = {'succeeded' , 'failed'}
+
+class JobQueueFull(Exception) : 
+
+    def __init__(self , max_queued : int) -> None : 
+
+        super().__init__(f'The job queue is full ({max_queued} jobs waiting).')
+        self.max_queued = max_queued
+
+class Job : 
+    '''
+    One queued scenario generation : its status, the stage it is in, and its result.
+    Every change wakes the subscribers of `updates`.
+    '''
+
+    def __init__(
+        self , 
+        kind : str , 
+        job_id : str | None = None
+    ) -> None : 
+
+        self.id : str = job_id or uuid.uuid4().hex
+        self.kind = kind
+
+        self.status : str = 'queued'
+        self.stage : str | None = None
+        self.stages : list[dict] = []
+        self.result : dict | None = None
+        self.error : str | None = None
+
+        self.created_at : float = time.time()
+        self.started_at : float | None = None
+        self.finished_at : float | None = None
+        self.enqueued_at : float = time.perf_counter()
+
+        self.version : int = 0
+        self.changed = asyncio.Event()
+        self.saving = asyncio.Lock()
+
+    @property
+    def done(self) -> bool : return self.status in TERMINAL_STATUSES
+
+    def _touch(self) -> None : 
+
+        self.version += 1
+
+        # * A fresh event per change, so a subscriber that was busy never misses one
+        changed , self.changed = self.changed , asyncio.Event()
+        changed.set()
+
+    def on_stage(self , stage : str , duration : float | None) -> None : 
+
+        if duration is None : self.stage = stage
+        else : self.stages.append({'stage' : stage , 'duration' : round(duration , 4)})
+
+        self._touch()
+
+    def start(self) -> None : 
+
+        self.status = 'running'
+        self.started_at = time.time()
+        self._touch()
+
+    def succeed(self , result : dict) -> None : 
+
+        self.status = 'succeeded'
+        self.result = result
+        self.stage = None
+        self.finished_at = time.time()
+        self._touch()
+
+    def fail(self , error : str , result : dict | None = None) -> None : 
+
+        self.status = 'failed'
+        self.result = result
+        self.error = error
+        self.stage = None
+        self.finished_at = time.time()
+        self._touch()
+
+    async def updates(self) -> AsyncIterator[dict] : 
+        '''
+        Yields a snapshot of the job now and after every change, until it is done.
+        '''
+
+        seen : int = -1
+
+        while True : 
+
+            changed : asyncio.Event = self.changed
+
+            if self.version != seen : 
+
+                seen = self.version
+
+                yield self.to_dict()
+
+            if self.done : return
+
+            await changed.wait()
+
+    def to_dict(self) -> dict : 
+
+        return {
+            'id' : self.id , 
+            'kind' : self.kind , 
+            'status' : self.status , 
+            'stage' : self.stage , 
+            'stages' : list(self.stages) , 
+            'result' : self.result , 
+            'error' : self.error , 
+            'created_at' : self.created_at , 
+            'started_at' : self.started_at , 
+            'finished_at' : self.finished_at
+        }
+
+    @classmethod
+    def from_document(cls , document : dict) -> 'Job' : 
+
+        job = cls(document['kind'] , document['_id'])
+
+        for field in ('status' , 'stage' , 'stages' , 'result' , 'error' , 'created_at' , 'started_at' , 'finished_at') : 
+            setattr(job , field , document.get(field))
+
+        return job
+
+class JobStore : 
+    '''
+    Jobs of this process kept in memory, mirrored to Mongo on every status change so a
+    job can still be looked up after a restart or from another worker process.
+    '''
+
+    def __init__(
+        self , 
+        collection : AsyncCollection | None , 
+        config : dict , 
+        logger : Logger | None = None
+    ) -> None : 
+
+        self.collection = collection
+        self.logger = logger
+
+        self.max_jobs : int = config['max-jobs']
+        self.ttl : float = config['ttl']
+        self.poll_interval : float = config['poll-interval']
+
+        self.jobs : OrderedDict[str , Job] = OrderedDict()
+        self.pending : dict[str , asyncio.Task] = {}
+
+    async def start(self) -> None : 
+        '''
+        Makes sure finished jobs expire from Mongo through a TTL index.
+        '''
+
+        if self.collection is None : return
+
+        indexes : dict = await self.collection.index_information()
+
+        for index in indexes.values() : 
+
+            if index['key'] == [('expires_at' , ASCENDING)] and 'expireAfterSeconds' in index : return
+
+        await self.collection.create_index([('expires_at' , ASCENDING)] , expireAfterSeconds = 0 , name = 'expires_at_ttl')
+
+    def add(self , job : Job) -> None : 
+
+        self.jobs[job.id] = job
+
+        self._evict()
+
+    def _evict(self) -> None : 
+
+        expired_before : float = time.time() - self.ttl
+
+        # * Oldest first; a job still queued or running is never dropped
+        for job_id , job in list(self.jobs.items()) : 
+
+            if len(self.jobs) <= self.max_jobs and (job.finished_at or time.time()) > expired_before : break
+
+            if job.done : del self.jobs[job_id]
+
+    async def get(self , job_id : str) -> Job | None : 
+
+        job : Job | None = self.jobs.get(job_id)
+
+        if job is not None or self.collection is None : return job
+
+        document : dict | None = await self.collection.find_one({'_id' : job_id})
+
+        return None if document is None else Job.from_document(document)
+
+    async def updates(self , job : Job) -> AsyncIterator[dict] : 
+        '''
+        Yields a snapshot of a job now and after every change, until it is done. A job
+        this process runs wakes its subscribers itself; one run by another worker process
+        is read back from Mongo every `poll_interval` seconds instead.
+        '''
+
+        if self.jobs.get(job.id) is job : 
+
+            async for snapshot in job.updates() : yield snapshot
+
+            return
+
+        seen : dict | None = None
+
+        while True : 
+
+            snapshot : dict = job.to_dict()
+
+            if snapshot != seen : 
+
+                seen = snapshot
+
+                yield snapshot
+
+            if job.done : return
+
+            await asyncio.sleep(self.poll_interval)
+
+            # * Gone once its TTL expired
+            if (job := await self.get(job.id)) is None : return
+
+    async def save(self , job : Job) -> None : 
+
+        if self.collection is None : return
+
+        # * One save of a job at a time, so an older snapshot never lands after a newer one
+        async with job.saving : 
+
+            document : dict = {
+                **job.to_dict() , 
+                'expires_at' : datetime.now(timezone.utc) + timedelta(seconds = self.ttl)
+            }
+            document['_id'] = document.pop('id')
+
+            # * Persistence is best effort, the in-memory job stays authoritative for this process
+            try : await self.collection.replace_one({'_id' : job.id} , document , upsert = True)
+
+            except Exception as e : 
+
+                if self.logger : self.logger.warning(f'Could not persist job {job.id} : {e}')
+
+    def save_later(self , job : Job) -> None : 
+        '''
+        Persists the progress of a running job at most once every `poll_interval` seconds,
+        which is as often as another worker process reads it back.
+        '''
+
+        if self.collection is None or job.id in self.pending : return
+
+        self.pending[job.id] = asyncio.create_task(self._save_later(job))
+
+    async def _save_later(self , job : Job) -> None : 
+
+        try : 
+
+            await asyncio.sleep(self.poll_interval)
+
+            # * A finished job was saved by its worker already
+            if not job.done : await self.save(job)
+
+        finally : self.pending.pop(job.id , None)
+
+class JobQueue : 
+    '''
+    Bounded queue of scenario jobs drained by a fixed pool of worker tasks.
+    '''
+
+    def __init__(
+        self , 
+        store : JobStore , 
+        config : dict , 
+        logger : Logger | None = None
+    ) -> None : 
+
+        self.store = store
+        self.logger = logger
+
+        self.worker_count : int = config['workers']
+        self.max_queued : int = config['max-queued']
+
+        self.queue : asyncio.Queue = asyncio.Queue(maxsize = self.max_queued)
+        self.workers : list[asyncio.Task] = []
+
+    def start(self) -> None : 
+
+        self.workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+
+    async def stop(self , drain_timeout : float = 0) -> None : 
+        '''
+        Lets the queued and running jobs finish for up to `drain_timeout` seconds, then
+        cancels whatever is left; a cancelled job is recorded as failed.
+        '''
+
+        if drain_timeout > 0 and self.workers : 
+
+            try : await asyncio.wait_for(self.queue.join() , drain_timeout)
+
+            except TimeoutError : 
+
+                if self.logger : self.logger.warning(f'{self.queue.qsize()} queued jobs left undrained after {drain_timeout}s.')
+
+        for worker in self.workers : worker.cancel()
+        for task in list(self.store.pending.values()) : task.cancel()
+
+        await asyncio.gather(*self.workers , *self.store.pending.values() , return_exceptions = True)
+
+        self.workers = []
+
+    async def submit(
+        self , 
+        kind : str , 
+        work : Callable[[] , Awaitable[dict]]
+    ) -> Job : 
+        '''
+        Queues a job and returns it right away.
+
+        Args : 
+            - kind (str) : What the job does, such as `add-scenario`.
+            - work (Callable) : Builds the coroutine to run once a worker is free.
+
+        Returns : 
+            - Job : The queued job.
+        '''
+
+        if self.queue.full() : raise JobQueueFull(self.max_queued)
+
+        job = Job(kind)
+
+        # * Queued before the first await, so concurrent submits cannot fill the queue in between
+        self.queue.put_nowait((job , work))
+        JOB_QUEUE_DEPTH.labels().set(self.queue.qsize())
+
+        self.store.add(job)
+        await self.store.save(job)
+
+        return job
+
+    async def _work(self) -> None : 
+
+        while True : 
+
+            job , work = await self.queue.get()
+
+            JOB_QUEUE_DEPTH.labels().set(self.queue.qsize())
+            JOB_WAIT_SECONDS.labels(job.kind).observe(time.perf_counter() - job.enqueued_at)
+
+            job.start()
+            await self.store.save(job)
+
+            def on_stage(stage : str , duration : float | None , job : Job = job) -> None : 
+
+                job.on_stage(stage , duration)
+
+                # * Subscribers on other worker processes only see the job through Mongo
+                self.store.save_later(job)
+
+            # * Every `stage_timer` the job goes through now reports to it
+            token = stage_listener_var.set(on_stage)
+            start_time : float = time.perf_counter()
+
+            try : 
+
+                result : dict = await work()
+
+                # * The routes report their own failures as a result rather than raising, kept as the job's result
+                if result.get('status') == 'error' : job.fail(result.get('message') or 'The job failed.' , result)
+                else : job.succeed(result)
+
+            except asyncio.CancelledError : 
+
+                job.fail('The service shut down before the job finished.')
+
+                # * The last save below is skipped by the re-raise, so the failure is persisted here
+                await asyncio.shield(self.store.save(job))
+
+                raise
+
+            except Exception as e : 
+
+                job.fail(str(e))
+
+                if self.logger : self.logger.error(f'Job {job.id} ({job.kind}) failed : {e}')
+
+            finally : 
+
+                stage_listener_var.reset(token)
+
+                JOB_RUN_SECONDS.labels(job.kind).observe(time.perf_counter() - start_time)
+                JOBS_TOTAL.labels(job.kind , job.status).inc()
+
+                self.queue.task_done()
+
+            await self.store.save(job)
@@ -1 +1,4 @@
-from .runner import * 
\ No newline at end of file
+from .runner import * 
+from .parser import * 
+from .schema import * 
+from .context_cache import * 
\ No newline at end of file
@@ -0,0 +1,311 @@
+import asyncio
+import contextlib
+import hashlib
+import time
+from logging import Logger
+from typing import TYPE_CHECKING
+
+from ..services import method_log_timer
+
+if TYPE_CHECKING : 
+
+    from google.genai import Client
+    from google.genai.types import GenerateContentConfig
+
+def prompt_digest(text : str) -> str : return hashlib.sha256(text.encode()).hexdigest()[: 16]
+
+def _instruction_text(system_instruction) -> str : 
+
+    if system_instruction is None : return ''
+
+    if isinstance(system_instruction , str) : return system_instruction
+
+    if not isinstance(system_instruction , list) : system_instruction = [system_instruction]
+
+    return ''.join(getattr(part , 'text' , None) or '' for part in system_instruction)
+
+class _CachedPrompt : 
+
+    __slots__ = ('name' , 'client' , 'model' , 'version' , 'expires_at' , 'used_at')
+
+    def __init__(
+        self , 
+        name : str , 
+        client : 'Client' , 
+        model : str , 
+        version : str , 
+        expires_at : float
+    ) -> None : 
+
+        self.name = name
+        self.client = client
+        self.model = model
+        self.version = version
+        self.expires_at = expires_at
+        self.used_at : float = time.monotonic()
+
+class ContextCache : 
+    '''
+    Gemini cached-content entries of the system prompts, one per (model, prompt) pair,
+    so a generation sends only its own turns and the prompt is billed at the cached rate.
+
+    Entries are created on first use, one creation per pair however many requests
+    arrive together. A background task extends the TTL of the entries still in use
+    before it runs out and deletes the idle ones; `retain` deletes those of a prompt
+    that changed. When an entry cannot be created, such as for a prompt under the
+    minimum size of the model, the pair is left uncached for `retry-interval` seconds.
+    '''
+
+    def __init__(
+        self , 
+        config : dict , 
+        logger : Logger | None = None
+    ) -> None : 
+
+        self.enabled : bool = config['enabled']
+        self.ttl : float = config['ttl']
+        self.refresh_interval : float = config['refresh-interval']
+        self.refresh_margin : float = config['refresh-margin']
+        self.idle_timeout : float = config['idle-timeout']
+        self.min_prompt_chars : int = config['min-prompt-chars']
+        self.retry_interval : float = config['retry-interval']
+        self.create_timeout : float = config['create-timeout']
+
+        self.logger = logger
+
+        self.entries : dict[tuple[str , str] , _CachedPrompt] = {}
+        self.locks : dict[tuple[str , str] , asyncio.Lock] = {}
+        self.unavailable_until : dict[tuple[str , str] , float] = {}
+
+        self.refresher : asyncio.Task | None = None
+
+        self.stats : dict[str , int] = {
+            'hits' : 0 , 
+            'created' : 0 , 
+            'refreshed' : 0 , 
+            'deleted' : 0 , 
+            'create_failures' : 0 , 
+            'rejected' : 0
+        }
+
+    @method_log_timer
+    async def resolve(
+        self , 
+        client : 'Client' , 
+        model : str , 
+        generation_config : 'GenerateContentConfig'
+    ) -> 'GenerateContentConfig | None' : 
+        '''
+        Returns the config of a generation that reads its system prompt from the cache,
+        or None when the generation should send the prompt itself.
+        '''
+
+        if not self.enabled : return None
+
+        text : str = _instruction_text(generation_config.system_instruction)
+
+        if len(text) < self.min_prompt_chars : return None
+
+        key : tuple[str , str] = (model , prompt_digest(text))
+
+        entry : _CachedPrompt | None = self._fresh(key)
+
+        if entry is None : 
+
+            if self.unavailable_until.get(key , 0) > time.monotonic() : return None
+
+            lock : asyncio.Lock = self.locks.setdefault(key , asyncio.Lock())
+
+            async with lock : 
+
+                entry = self._fresh(key) or await self._create(client , key , generation_config.system_instruction)
+
+            if entry is None : return None
+
+        else : self.stats['hits'] += 1
+
+        entry.used_at = time.monotonic()
+
+        # * The system instruction lives in the cache, the API rejects a request carrying both
+        return generation_config.model_copy(update = {'system_instruction' : None , 'cached_content' : entry.name})
+
+    def _fresh(self , key : tuple[str , str]) -> _CachedPrompt | None : 
+
+        entry : _CachedPrompt | None = self.entries.get(key)
+
+        # * An entry close to expiry is not handed out, a long generation could outlive it
+        if entry is None or entry.expires_at - time.monotonic() < self.refresh_margin / 2 : return None
+
+        return entry
+
+    async def _create(
+        self , 
+        client : 'Client' , 
+        key : tuple[str , str] , 
+        system_instruction
+    ) -> _CachedPrompt | None : 
+
+        from google.genai.types import CreateCachedContentConfig
+
+        model , version = key
+
+        try : 
+
+            async with asyncio.timeout(self.create_timeout) : cached = await client.aio.caches.create(
+                model = model , 
+                config = CreateCachedContentConfig(
+                    system_instruction = system_instruction , 
+                    display_name = f'vps-{version}' , 
+                    ttl = f'{self.ttl:.0f}s'
+                )
+            )
+
+        except Exception as e : 
+
+            self.stats['create_failures'] += 1
+            self.unavailable_until[key] = time.monotonic() + self.retry_interval
+
+            if self.logger : self.logger.warning(f'Context caching of prompt {version} on {model} unavailable, sending the prompt inline : {e}')
+
+            return None
+
+        entry = _CachedPrompt(cached.name , client , model , version , time.monotonic() + self.ttl)
+
+        previous : _CachedPrompt | None = self.entries.get(key)
+        self.entries[key] = entry
+        self.stats['created'] += 1
+
+        if previous is not None : await self._delete(previous)
+
+        if self.logger : self.logger.info(f'Cached prompt {version} on {model} as {entry.name}.')
+
+        return entry
+
+    def discard(self , name : str) -> None : 
+        '''
+        Forgets an entry Gemini no longer accepts, such as one deleted or expired upstream.
+        '''
+
+        for key , entry in list(self.entries.items()) : 
+
+            if entry.name == name : 
+
+                del self.entries[key]
+                self.stats['rejected'] += 1
+
+    async def retain(self , versions : set[str]) -> None : 
+        '''
+        Deletes the entries of every prompt outside `versions`, called when the prompts are reloaded.
+        '''
+
+        for key , entry in list(self.entries.items()) : 
+
+            if entry.version not in versions : 
+
+                del self.entries[key]
+                self.unavailable_until.pop(key , None)
+
+                await self._delete(entry)
+
+    async def _delete(self , entry : _CachedPrompt) -> None : 
+
+        self.stats['deleted'] += 1
+
+        try : 
+            async with asyncio.timeout(self.create_timeout) : await entry.client.aio.caches.delete(name = entry.name)
+
+        # * An entry that could not be deleted still expires at its TTL
+        except Exception as e : 
+            if self.logger : self.logger.warning(f'Could not delete cached prompt {entry.name} : {e}')
+
+    async def _refresh(self , key : tuple[str , str] , entry : _CachedPrompt) -> None : 
+
+        from google.genai.types import UpdateCachedContentConfig
+
+        try : 
+
+            async with asyncio.timeout(self.create_timeout) : await entry.client.aio.caches.update(
+                name = entry.name , 
+                config = UpdateCachedContentConfig(ttl = f'{self.ttl:.0f}s')
+            )
+
+        except Exception as e : 
+
+            # * The next request creates a new entry
+            if self.entries.get(key) is entry : del self.entries[key]
+
+            if self.logger : self.logger.warning(f'Could not refresh cached prompt {entry.name} : {e}')
+
+            return
+
+        entry.expires_at = time.monotonic() + self.ttl
+        self.stats['refreshed'] += 1
+
+    async def refresh(self) -> None : 
+        '''
+        Extends the entries used within `idle-timeout` that are about to expire and deletes the others.
+        '''
+
+        now : float = time.monotonic()
+
+        for key , entry in list(self.entries.items()) : 
+
+            if now - entry.used_at > self.idle_timeout : 
+
+                del self.entries[key]
+                await self._delete(entry)
+
+            elif entry.expires_at - now < self.refresh_margin : await self._refresh(key , entry)
+
+    async def _watch(self) -> None : 
+
+        while True : 
+
+            await asyncio.sleep(self.refresh_interval)
+
+            try : await self.refresh()
+
+            except Exception as e : 
+                if self.logger : self.logger.error(f'Context cache refresh failed : {e}')
+
+    def start(self) -> None : 
+
+        if self.enabled : self.refresher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None : 
+
+        if self.refresher is not None : 
+
+            self.refresher.cancel()
+            self.refresher = None
+
+        # * Storage is billed until the TTL, so entries of a stopping worker are deleted right away
+        entries : list[_CachedPrompt] = list(self.entries.values())
+        self.entries.clear()
+
+        with contextlib.suppress(Exception) : await asyncio.gather(*(self._delete(entry) for entry in entries))
+
+def rejects_cached_content(error : Exception) -> bool : 
+    '''
+    Whether Gemini refused a generation because of its cached content, not because of the request.
+    '''
+
+    code = getattr(error , 'code' , None)
+
+    return code in (400 , 403 , 404) and 'cache' in str(error).lower()
+
+# * The context cache of the process, set by `configure_context_cache` in the app lifespan
+_context_cache : ContextCache | None = None
+
+def configure_context_cache(
+    config : dict , 
+    logger : Logger | None = None
+) -> ContextCache : 
+
+    global _context_cache
+
+    _context_cache = ContextCache(config , logger)
+
+    return _context_cache
+
+def get_context_cache() -> ContextCache | None : return _context_cache
@@ -0,0 +1,242 @@
+import json
+import re
+
+from ..services import method_log_timer
+
+_FENCE_PATTERN = re.compile(r'^\s*```[a-zA-Z]*\s*|\s*```\s*$')
+
+class IncrementalJSONParser : 
+    '''
+    Tracks the structure of a JSON document as it is fed chunk by chunk, so a complete,
+    truncated or fenced document can be turned into a valid one at any point without
+    rescanning what was already seen.
+
+    Truncated string values are kept and closed; a dangling key, colon, comma or half
+    written literal is dropped back to the last complete value.
+    '''
+
+    def __init__(self) -> None : 
+
+        self.buffer : list[str] = []
+        self.length : int = 0
+
+        self.started : bool = False
+        self.complete : bool = False
+
+        self.stack : list[str] = []
+        self.in_string : bool = False
+        self.escape : bool = False
+        self.unicode_pending : int = 0
+        self.string_is_value : bool = False
+
+        # * Per open object : True while the next string is a key, and the last key seen
+        self.expect_key : list[bool] = []
+        self.keys : list[str | None] = []
+
+        self.string_start : int = 0
+
+        self.clean_length : int = 0
+        self.clean_stack : tuple[str , ...] = ()
+
+    def _mark_clean(self) -> None : 
+
+        self.clean_length = self.length
+        self.clean_stack = tuple(self.stack)
+
+    @method_log_timer
+    def feed(self , chunk : str) -> None : 
+
+        for char in chunk : 
+
+            if self.complete : return
+
+            if not self.started : 
+
+                if char not in '{[' : continue
+
+                self.started = True
+
+            self.buffer.append(char)
+            self.length += 1
+
+            if self.in_string : 
+
+                if self.unicode_pending : self.unicode_pending -= 1
+                elif self.escape : 
+
+                    self.escape = False
+                    if char == 'u' : self.unicode_pending = 4
+
+                elif char == '\\' : self.escape = True
+                elif char == '"' : 
+
+                    self.in_string = False
+
+                    if self.string_is_value : self._mark_clean()
+                    else : self.keys[-1] = json.loads(''.join(self.buffer[self.string_start - 1 : self.length]))
+
+                continue
+
+            if char == '"' : 
+
+                self.in_string = True
+                self.string_is_value = not (self.stack and self.stack[-1] == '{' and self.expect_key[-1])
+                self.string_start = self.length
+
+            elif char in '{[' : 
+
+                self.stack.append(char)
+
+                if char == '{' : 
+
+                    self.expect_key.append(True)
+                    self.keys.append(None)
+
+                self._mark_clean()
+
+            elif char in '}]' : 
+
+                if self.stack : 
+
+                    if self.stack.pop() == '{' : 
+
+                        self.expect_key.pop()
+                        self.keys.pop()
+
+                self._mark_clean()
+
+                if not self.stack : self.complete = True
+
+            elif char == ':' : 
+
+                if self.expect_key : self.expect_key[-1] = False
+
+            elif char == ',' : 
+
+                # * A literal or number ends at the comma, so the text before it is complete
+                self.length -= 1
+                self._mark_clean()
+                self.length += 1
+
+                if self.stack and self.stack[-1] == '{' : self.expect_key[-1] = True
+
+    def text(self) -> str : return ''.join(self.buffer)
+
+    def repaired(self) -> str : 
+        '''
+        Returns the document seen so far, closed into valid JSON.
+        '''
+
+        text : str = self.text()
+
+        if self.complete : return text
+
+        if self.in_string and self.string_is_value : 
+
+            # * Drop a half written escape sequence before closing the string
+            if self.escape : text = text[: -1]
+            elif self.unicode_pending : text = text[: -(6 - self.unicode_pending)]
+
+            text += '"'
+            stack : tuple[str , ...] = tuple(self.stack)
+
+        else : 
+
+            text = text[: self.clean_length]
+            stack = self.clean_stack
+
+        text = text.rstrip().rstrip(',')
+
+        return text + ''.join('}' if opener == '{' else ']' for opener in reversed(stack))
+
+class StringFieldStream : 
+    '''
+    Decodes the string values of chosen top-level fields while the document is still
+    being generated, so they can be forwarded to a client before the JSON is complete.
+    '''
+
+    _PIECE_PATTERN = re.compile(r'[^"]*"?')
+
+    def __init__(self , fields : tuple[str , ...]) -> None : 
+
+        self.fields = set(fields)
+        self.parser = IncrementalJSONParser()
+
+        self.active : str | None = None
+        self.emitted : int = 0
+
+    @method_log_timer
+    def feed(self , chunk : str) -> list[tuple[str , str]] : 
+        '''
+        Feeds a chunk of the document.
+
+        Returns : 
+            - list : The `(field , text)` pieces of field values decoded from this chunk.
+        '''
+
+        deltas : list[tuple[str , str]] = []
+        parser : IncrementalJSONParser = self.parser
+
+        # * Every string opens or closes on a quote, so feeding up to each quote is enough to follow them
+        for piece in self._PIECE_PATTERN.findall(chunk) : 
+
+            if not piece : continue
+
+            parser.feed(piece)
+
+            if self.active is None : 
+
+                if parser.in_string and parser.string_is_value and parser.stack == ['{'] and parser.keys[-1] in self.fields : 
+
+                    self.active = parser.keys[-1]
+                    self.emitted = parser.string_start
+
+                continue
+
+            if parser.in_string : 
+
+                # * A half written escape sequence waits for the next chunk
+                end : int = parser.length - (1 if parser.escape else 6 - parser.unicode_pending if parser.unicode_pending else 0)
+
+            else : end = parser.length - 1
+
+            text : str = json.loads('"' + ''.join(parser.buffer[self.emitted : end]) + '"')
+
+            # * The high half of an escaped surrogate pair waits for its low half
+            if parser.in_string and text and '\ud800' <= text[-1] <= '\udbff' : 
+
+                text = text[: -1]
+                end -= 6
+
+            if text : 
+
+                deltas.append((self.active , text))
+                self.emitted = end
+
+            if not parser.in_string : self.active = None
+
+        return deltas
+
+def strip_fences(text : str) -> str : return _FENCE_PATTERN.sub('' , text.strip())
+
+def parse_json_response(text : str) -> tuple[dict | list | None , bool] : 
+    '''
+    Parses a model response that should hold one JSON document.
+
+    Args : 
+        - text (str) : The raw response, possibly fenced, prefixed or truncated.
+
+    Returns : 
+        - tuple : The parsed document (None if nothing usable) and whether it had to be repaired.
+    '''
+
+    try : return json.loads(strip_fences(text)) , False
+    except ValueError : pass
+
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+
+    if not parser.started : return None , True
+
+    try : return json.loads(parser.repaired()) , True
+    except ValueError : return None , True
@@ -1,78 +1,275 @@
-import ast
-from google.genai import Client
-from google.genai.types import GenerateContentConfig
+import asyncio
+import time
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+from ..admission import AdmissionRejected , get_bulkhead
+from ..metrics import GEMINI_TOKENS , GEMINI_TTFT_SECONDS , stage_timer
+from ..resilience import CircuitOpen , DeadlineExceeded , get_breaker , within_deadline
+from ..services import create_generation_config , json_to_google_chat
+from .context_cache import get_context_cache , rejects_cached_content
+from .parser import parse_json_response
+from .schema import SCENARIO_KEYS
+
+if TYPE_CHECKING : 
+
+    from google.genai import Client
+    from google.genai.types import GenerateContentConfig
+
+REPAIR_SYSTEM_PROMPT : str = (
+    'You repair malformed or truncated JSON. Return only the corrected, complete JSON object, '
+    'keeping every key and value that is present and briefly completing any value that was cut off.'
+)
+
+SERVER_FALLBACK : dict = {
+    'scenario_name' : 'Error from Server' , 
+    'scenario_prompt' : 'Sorry we were having some issues with the server. Please try again later.' , 
+    'questions_for_feedback' : [] , 
+    'difficulty_level' : 'easy'
+}
+
+AI_FALLBACK : dict = {
+    'scenario_name' : 'Error from AI' , 
+    'scenario_prompt' : 'Sorry we were having some issues with the AI. Please try again later.' , 
+    'questions_for_feedback' : [] , 
+    'difficulty_level' : 'easy'
+}
+
+class GenerationFailed(Exception) : 
+
+    def __init__(self , fallback : dict) -> None : 
+
+        super().__init__(fallback['scenario_prompt'])
+        self.fallback = fallback
+
+# * Counters of the JSON path, the parse failure rate is parse_failures / responses
+json_stats : dict[str , int] = {
+    'responses' : 0 , 
+    'parse_failures' : 0 , 
+    'repaired' : 0 , 
+    'repair_retries' : 0 , 
+    'fallbacks' : 0
+}
+
+# * One limiter per model so a burst on one model cannot starve the others
+_model_semaphores : dict[str , asyncio.Semaphore] = {}
+
+def get_model_semaphore(
+    model : str , 
+    max_concurrency : int = 16
+) -> asyncio.Semaphore : 
+    '''
+    Returns the shared concurrency limiter of a model, creating it on first use.
+
+    Args : 
+        - model (str) : The Gemini model name.
+        - max_concurrency (int) : In-flight generations allowed for the model.
+
+    Returns : 
+        - asyncio.Semaphore : The limiter of the model.
+    '''
+
+    semaphore : asyncio.Semaphore | None = _model_semaphores.get(model)
+
+    if semaphore is None : 
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        _model_semaphores[model] = semaphore
+
+    return semaphore
 
 async def run_gemini(
-    gemini_client : Client , 
+    gemini_client : 'Client' , 
     contents : list , 
-    generation_config : GenerateContentConfig , 
-    model : str = 'gemini-1.5-flash'
+    generation_config : 'GenerateContentConfig' , 
+    model : str = 'gemini-1.5-flash' , 
+    max_concurrency : int = 16 , 
+    timeout : float | None = 120 , 
+    on_text : Callable[[str] , None] | None = None
 ) -> str : 
+    '''
+    Streams one generation and returns its full text; `on_text` sees every chunk as it arrives.
+    With a context cache configured, a long system prompt is read from its cached entry.
+    '''
+
+    context_cache = get_context_cache()
+
+    cached_config : 'GenerateContentConfig | None' = None
+
+    if context_cache is not None : cached_config = await context_cache.resolve(gemini_client , model , generation_config)
+
+    if cached_config is not None : 
+
+        try : return await _stream_gemini(gemini_client , contents , cached_config , model , max_concurrency , timeout , on_text)
+
+        # * Refused before anything streamed, so the same call is sent again with the prompt inline
+        except Exception as e : 
+
+            if not rejects_cached_content(e) : raise
+
+            context_cache.discard(cached_config.cached_content)
+
+    return await _stream_gemini(gemini_client , contents , generation_config , model , max_concurrency , timeout , on_text)
+
+async def _stream_gemini(
+    gemini_client : 'Client' , 
+    contents : list , 
+    generation_config : 'GenerateContentConfig' , 
+    model : str , 
+    max_concurrency : int , 
+    timeout : float | None , 
+    on_text : Callable[[str] , None] | None
+) -> str : 
+
+    cached : str = 'true' if generation_config.cached_content else 'false'
+
+    chunks : list[str] = []
+    usage_metadata = None
+    first_chunk_seen : bool = False
+
+    # * The bulkhead comes first, so every caller waiting for Gemini is one it sees and can shed
+    async with get_bulkhead('gemini').slot() , get_model_semaphore(model , max_concurrency) : 
+
+        with stage_timer('gemini') : 
+
+            # * The breaker is checked once a slot is free, so a queued call sees its latest state
+            with get_breaker('gemini').guard() as guard : 
+
+                try : 
 
-    response = ''
+                    # * A timeout of the call counts against Gemini, running out of the caller's deadline does not
+                    async with within_deadline(timeout) : 
 
-    for chunk in gemini_client.models.generate_content_stream(
-        model = model , 
-        contents = contents , 
-        config = generation_config
+                        start_time : float = time.perf_counter()
+
+                        async for chunk in await gemini_client.aio.models.generate_content_stream(
+                            model = model , 
+                            contents = contents , 
+                            config = generation_config
+                        ) : 
+                            # * Once per call : the first chunk may carry only metadata, and then no text would mark it
+                            if not first_chunk_seen : 
+
+                                first_chunk_seen = True
+                                GEMINI_TTFT_SECONDS.labels(model , cached).observe(time.perf_counter() - start_time)
+
+                            if chunk.text : 
+
+                                chunks.append(chunk.text)
+
+                                if on_text is not None : on_text(chunk.text)
+
+                            usage_metadata = getattr(chunk , 'usage_metadata' , None) or usage_metadata
+
+                # * A stale cached content is ours to fix by sending the prompt inline, not a sign that Gemini is down
+                except Exception as e : 
+
+                    if generation_config.cached_content and rejects_cached_content(e) : guard.release()
+
+                    raise
+
+    if usage_metadata is not None : record_token_usage(model , usage_metadata)
+
+    return ''.join(chunks)
+
+def record_token_usage(model : str , usage_metadata) -> None : 
+
+    for kind , field in (
+        ('prompt' , 'prompt_token_count') , 
+        ('candidates' , 'candidates_token_count') , 
+        ('cached' , 'cached_content_token_count') , 
+        ('total' , 'total_token_count')
     ) : 
-        if chunk.text : response += chunk.text
-        
-    return response
+
+        count : int | None = getattr(usage_metadata , field , None)
+
+        if count : GEMINI_TOKENS.labels(model , kind).inc(count)
+
+    # * Prompt tokens billed at the full rate, the cached ones are part of the prompt count
+    uncached : int = (getattr(usage_metadata , 'prompt_token_count' , None) or 0) - (getattr(usage_metadata , 'cached_content_token_count' , None) or 0)
+
+    if uncached > 0 : GEMINI_TOKENS.labels(model , 'uncached').inc(uncached)
+
+def _has_keys(document , required_keys : tuple[str , ...]) -> bool : 
+
+    return isinstance(document , dict) and all(key in document for key in required_keys)
 
 async def run_json_gemini(
-    gemini_client : Client ,  
+    gemini_client : 'Client' , 
     contents : list , 
-    generation_config : GenerateContentConfig , 
-    model : str = 'gemini-1.5-flash'
+    generation_config : 'GenerateContentConfig' , 
+    model : str = 'gemini-1.5-flash' , 
+    max_concurrency : int = 16 , 
+    timeout : float | None = 120 , 
+    required_keys : tuple[str , ...] = SCENARIO_KEYS , 
+    on_text : Callable[[str] , None] | None = None , 
+    raise_on_failure : bool = False
 ) -> dict : 
-    
+    '''
+    Runs a generation that must return a JSON object. Fenced or truncated output is
+    repaired locally; only when that is not enough is the broken fragment sent back
+    with a short repair prompt, instead of paying for a second full generation.
+
+    With `raise_on_failure` the fallback response is raised as `GenerationFailed`
+    instead of returned, so callers such as a cache can tell it apart from a real one.
+    '''
+
+    # * `except Exception` rather than a bare except so a client disconnect still cancels the call
     try : 
 
         response : str = await run_gemini(
             gemini_client , 
             contents , 
             generation_config , 
-            model
+            model , 
+            max_concurrency , 
+            timeout , 
+            on_text
         )
-        
-        try : 
-            
-            processed_response : str = response.replace('json' , '').replace('`' , '').strip()
 
-            json_response : dict = ast.literal_eval(processed_response)
+        json_stats['responses'] += 1
+
+        with stage_timer('json_parse') : json_response , repaired = parse_json_response(response)
+
+        if _has_keys(json_response , required_keys) : 
+
+            if repaired : json_stats['repaired'] += 1
 
             return json_response
 
-        except : 
+        json_stats['parse_failures'] += 1
+
+        if response.strip() : 
+
+            json_stats['repair_retries'] += 1
+
+            repair_config : 'GenerateContentConfig' = await create_generation_config(
+                REPAIR_SYSTEM_PROMPT , 
+                response_schema = generation_config.response_schema
+            )
 
-            rerun_response : str = await run_gemini(
+            repair_response : str = await run_gemini(
                 gemini_client , 
-                contents , 
-                generation_config , 
-                model
+                await json_to_google_chat([{'role' : 'user' , 'content' : response}]) , 
+                repair_config , 
+                model , 
+                max_concurrency , 
+                timeout
             )
-            
-            print(rerun_response)
-            
-            try : 
-                
-                    rerun_processed_response : str = rerun_response.replace('json' , '').replace('`' , '').strip()
-
-                    rerun_json_response : dict = ast.literal_eval(rerun_processed_response)
-
-                    return rerun_json_response
-
-            except : return {
-                'scenario_name' : 'Error from Server' , 
-                'scenario_prompt' : 'Sorry we were having some issues with the server. Please try again later.' ,
-                'question_for_feedback' : [] , 
-                'difficulty_level' : 'easy'
-            }
-
-    except : return {
-        'scenario_name' : 'Error from AI' , 
-        'scenario_prompt' : 'Sorry we were having some issues with the AI. Please try again later.' ,
-        'question_for_feedback' : [] , 
-        'difficulty_level' : 'easy'
-    }
\ No newline at end of file
+
+            json_response , _ = parse_json_response(repair_response)
+
+            if _has_keys(json_response , required_keys) : return json_response
+
+        fallback : dict = SERVER_FALLBACK
+
+    # * Nothing to gain from a fallback when Gemini is known to be down or overloaded, or the caller has given up
+    except (AdmissionRejected , CircuitOpen , DeadlineExceeded) : raise
+
+    except Exception : fallback = AI_FALLBACK
+
+    json_stats['fallbacks'] += 1
+
+    if raise_on_failure : raise GenerationFailed(dict(fallback))
+
+    return dict(fallback)
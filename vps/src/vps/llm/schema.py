@@ -0,0 +1,32 @@
+import functools
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING : from google.genai.types import Schema
+
+SCENARIO_KEYS : tuple[str , ...] = (
+    'scenario_name' , 
+    'scenario_prompt' , 
+    'questions_for_feedback' , 
+    'difficulty_level'
+)
+
+@functools.cache
+def get_scenario_schema() -> 'Schema' : 
+    '''
+    Response schema of the scenario generations, built on first use so importing
+    `vps` does not pull in the Google GenAI SDK.
+    '''
+
+    from google.genai.types import Schema , Type
+
+    return Schema(
+        type = Type.OBJECT , 
+        properties = {
+            'scenario_name' : Schema(type = Type.STRING) , 
+            'scenario_prompt' : Schema(type = Type.STRING) , 
+            'questions_for_feedback' : Schema(type = Type.ARRAY , items = Schema(type = Type.STRING)) , 
+            'difficulty_level' : Schema(type = Type.STRING)
+        } , 
+        required = list(SCENARIO_KEYS) , 
+        property_ordering = list(SCENARIO_KEYS)
+    )
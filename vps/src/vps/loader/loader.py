@@ -1,27 +1,34 @@
 import os
 import yaml
-from deepgram import DeepgramClient
-from google.genai import Client 
+from typing import TYPE_CHECKING
 
-import os
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
+
+from ..repository import ScenarioRepository
+from ..voxio import VoxioClient
+
+from logging import Logger
 
-from logging import (
-    Logger , getLogger , 
-    StreamHandler , Formatter , 
-    DEBUG , INFO , WARNING , ERROR , CRITICAL , 
-    LogRecord
-)
+from ..logs import load_logger
+from ..startup import LazyClient
 
-def load_mongo_client() -> MongoClient : 
+# * The SDKs are slow to import, they are loaded by `LazyClient` on first use
+if TYPE_CHECKING : 
 
-    client : MongoClient = MongoClient(os.environ['MONGO_URL'])
+    from deepgram import AsyncDeepgramClient
+    from google.genai import Client
+
+def load_mongo_client() -> AsyncMongoClient : 
+
+    client : AsyncMongoClient = AsyncMongoClient(os.environ['MONGO_URL'])
 
     return client 
 
-def load_deepgram_client() -> DeepgramClient : 
+def load_deepgram_client() -> 'AsyncDeepgramClient' : 
+
+    from deepgram import AsyncDeepgramClient
 
-    client : DeepgramClient = DeepgramClient(api_key = os.environ['DEEPGRAM_API_KEY'])
+    client : AsyncDeepgramClient = AsyncDeepgramClient(api_key = os.environ['DEEPGRAM_API_KEY'])
 
     return client 
 
@@ -33,78 +40,49 @@ def load_config() -> dict :
 
     return config
 
-def load_gemini_client() -> Client : 
+def load_gemini_client() -> 'Client' : 
+
+    from google.genai import Client
 
     client : Client = Client(api_key = os.environ['GEMINI_API_KEY'])
 
     return client
 
-class ColoredFormatter(Formatter) : 
-
-    def __init__(
-        self , 
-        fmt : str , 
-        config : dict , 
-        datefmt : str | None = None
-    ) -> None :
-
-        super().__init__(fmt , datefmt)
-        
-        self.COLORS = {
-            DEBUG : config['color']['debug'] ,
-            INFO : config['color']['info'] , 
-            WARNING : config['color']['warning'] , 
-            ERROR : config['color']['error'] , 
-            CRITICAL : config['color']['critical']
-        }
-
-        self.RESET = config['color']['reset']
-
-        self.fmt = fmt
+def load_voxio_client(config : dict) -> VoxioClient : 
 
-    def format(self , record : LogRecord) -> str : 
-
-        color = self.COLORS.get(record.levelno)
-
-        if color : log_fmt = color + self.fmt + self.RESET
-        else : log_fmt = self.fmt
-
-        formatter = Formatter(log_fmt , self.datefmt)
-
-        return formatter.format(record)
-
-def load_logger(config : dict) -> Logger:
-    
-    logger: Logger = getLogger(__name__)
-    logger.setLevel(DEBUG) 
-
-    if logger.handlers : 
-
-        for handler in logger.handlers : logger.removeHandler(handler)
+    client : VoxioClient = VoxioClient(
+        base_url = config['base-url'] , 
+        user_api_key = os.environ['VOXIO_API_KEY'] , 
+        config = config
+    )
 
-    console_handler = StreamHandler()
+    return client
 
-    log_format = config['log-format']
+def load_scenario_repository(
+    mongo_client : AsyncMongoClient , 
+    config : dict , 
+    logger : Logger | None = None
+) -> ScenarioRepository : 
 
-    formatter = ColoredFormatter(
-        fmt = log_format , 
-        config = config , 
-        datefmt = ''
-    )
-    console_handler.setFormatter(formatter)
+    collection = mongo_client[config['database-name']][config['collection-name']]
 
-    logger.addHandler(console_handler)
+    repository : ScenarioRepository = ScenarioRepository(collection , config , logger)
 
-    return logger
+    return repository
 
-def load_all_clients() -> tuple[DeepgramClient , dict , Logger , Client , MongoClient] : 
+def load_all_clients() -> tuple[LazyClient , dict , Logger , LazyClient , AsyncMongoClient , VoxioClient] : 
+    '''
+    Builds every client without touching the network. The Deepgram and Gemini clients
+    are lazy, their SDKs are imported in a worker thread the first time they are needed.
+    '''
 
-    deepgram_client : DeepgramClient = load_deepgram_client()
+    deepgram_client : LazyClient = LazyClient(load_deepgram_client)
 
     config : dict = load_config()
 
-    gemini_client : Client = load_gemini_client()
+    gemini_client : LazyClient = LazyClient(load_gemini_client)
     logger : Logger = load_logger(config['logger'])
-    mongo_client : MongoClient = load_mongo_client()
+    mongo_client : AsyncMongoClient = load_mongo_client()
+    voxio_client : VoxioClient = load_voxio_client(config['voxio'])
 
-    return deepgram_client , config , logger , gemini_client , mongo_client
\ No newline at end of file
+    return deepgram_client , config , logger , gemini_client , mongo_client , voxio_client
\ No newline at end of file
@@ -0,0 +1 @@
+from .logs import * 
\ No newline at end of file
@@ -0,0 +1,157 @@
+import json
+import queue
+import uuid
+from contextvars import ContextVar
+from logging import (
+    Logger , getLogger , 
+    StreamHandler , Formatter , 
+    DEBUG , INFO , WARNING , ERROR , CRITICAL , 
+    LogRecord
+)
+from logging.handlers import QueueHandler , QueueListener
+
+request_id_var : ContextVar[str] = ContextVar('request_id' , default = '-')
+
+_listener : QueueListener | None = None
+
+class ColoredFormatter(Formatter) : 
+
+    def __init__(
+        self , 
+        fmt : str , 
+        config : dict , 
+        datefmt : str | None = None
+    ) -> None : 
+
+        super().__init__(fmt , datefmt)
+
+        # * One formatter per level, built once instead of on every record
+        self.formatters : dict[int , Formatter] = {
+            level : Formatter(config['color'][name] + fmt + config['color']['reset'] , datefmt)
+            for level , name in ((DEBUG , 'debug') , (INFO , 'info') , (WARNING , 'warning') , (ERROR , 'error') , (CRITICAL , 'critical'))
+        }
+
+    def format(self , record : LogRecord) -> str : 
+
+        formatter : Formatter | None = self.formatters.get(record.levelno)
+
+        if formatter is None : return super().format(record)
+
+        return formatter.format(record)
+
+class JSONFormatter(Formatter) : 
+    '''
+    One JSON object per line, for log shippers.
+    '''
+
+    def format(self , record : LogRecord) -> str : 
+
+        entry : dict = {
+            'time' : self.formatTime(record , self.datefmt) , 
+            'level' : record.levelname , 
+            'logger' : record.name , 
+            'message' : record.getMessage() , 
+            'request_id' : getattr(record , 'request_id' , '-')
+        }
+
+        if record.exc_info : entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text : entry['exception'] = record.exc_text
+
+        return json.dumps(entry , ensure_ascii = False)
+
+class _InProcessQueueHandler(QueueHandler) : 
+    '''
+    `QueueHandler` for a queue that never leaves the process : the stock `prepare` formats
+    and copies every record on the calling thread, here only the arguments are merged and
+    the request id stamped, the formatting itself is left to the listener thread.
+    '''
+
+    def prepare(self , record : LogRecord) -> LogRecord : 
+
+        if record.args : 
+
+            record.msg = record.getMessage()
+            record.args = None
+
+        record.request_id = request_id_var.get()
+
+        return record
+
+class RequestIdMiddleware : 
+    '''
+    Pure ASGI middleware giving each request an id, taken from `X-Request-ID` when the
+    client sends one, and echoing it back on the response.
+    '''
+
+    def __init__(self , app) -> None : self.app = app
+
+    async def __call__(self , scope , receive , send) -> None : 
+
+        if scope['type'] not in ('http' , 'websocket') : return await self.app(scope , receive , send)
+
+        request_id : str = dict(scope['headers']).get(b'x-request-id' , b'').decode('latin-1')[: 64] or uuid.uuid4().hex
+
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message) -> None : 
+
+            if message['type'] == 'http.response.start' : 
+                message['headers'] = list(message.get('headers' , [])) + [(b'x-request-id' , request_id.encode('latin-1'))]
+
+            await send(message)
+
+        try : await self.app(scope , receive , send_wrapper)
+        finally : request_id_var.reset(token)
+
+def load_logger(config : dict) -> Logger:
+    '''
+    Configures the `vps` logger : records are stamped and queued on the calling thread,
+    then formatted and written by a `QueueListener` thread so log I/O never runs on the event loop.
+    '''
+
+    global _listener
+
+    logger: Logger = getLogger('vps')
+    logger.setLevel(DEBUG) 
+    logger.propagate = False
+
+    if logger.handlers : 
+
+        for handler in list(logger.handlers) : logger.removeHandler(handler)
+
+    stop_logger()
+
+    console_handler = StreamHandler()
+
+    if config.get('json') : formatter : Formatter = JSONFormatter(datefmt = config['date-format'])
+
+    else : formatter = ColoredFormatter(
+        fmt = config['log-format'] , 
+        config = config , 
+        datefmt = config['date-format']
+    )
+
+    console_handler.setFormatter(formatter)
+
+    log_queue : queue.SimpleQueue = queue.SimpleQueue()
+
+    queue_handler = _InProcessQueueHandler(log_queue)
+
+    logger.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue , console_handler , respect_handler_level = True)
+    _listener.start()
+
+    return logger
+
+def stop_logger() -> None : 
+    '''
+    Flushes the queued records and stops the listener thread.
+    '''
+
+    global _listener
+
+    if _listener is not None : 
+
+        _listener.stop()
+        _listener = None
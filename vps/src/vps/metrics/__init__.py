@@ -0,0 +1 @@
+from .metrics import * 
\ No newline at end of file
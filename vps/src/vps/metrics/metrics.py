@@ -0,0 +1,369 @@
+import time
+from bisect import bisect_left
+from collections.abc import Callable
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS : tuple[float , ...] = (0.005 , 0.01 , 0.025 , 0.05 , 0.1 , 0.25 , 0.5 , 1.0 , 2.5 , 5.0 , 10.0 , 30.0 , 60.0 , 120.0)
+
+def _format_labels(names : tuple[str , ...] , values : tuple , extra : str = '') -> str : 
+
+    pairs : list[str] = [f'{name}="{value}"' for name , value in zip(names , values)]
+
+    if extra : pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _CounterChild : 
+
+    __slots__ = ('value' ,)
+
+    def __init__(self) -> None : self.value : float = 0.0
+
+    def inc(self , amount : float = 1.0) -> None : self.value += amount
+
+class _GaugeChild(_CounterChild) : 
+
+    __slots__ = ()
+
+    def set(self , value : float) -> None : self.value = value
+
+    def dec(self , amount : float = 1.0) -> None : self.value -= amount
+
+class _HistogramChild : 
+
+    __slots__ = ('bounds' , 'counts' , 'sum' , 'count')
+
+    def __init__(self , bounds : tuple[float , ...]) -> None : 
+
+        self.bounds = bounds
+        self.counts : list[int] = [0] * (len(bounds) + 1)
+        self.sum : float = 0.0
+        self.count : int = 0
+
+    def observe(self , value : float) -> None : 
+
+        self.counts[bisect_left(self.bounds , value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metric : 
+    '''
+    A named metric with optional labels; `labels(...)` returns the cached child to update.
+    '''
+
+    kind : str = ''
+
+    def __init__(
+        self , 
+        name : str , 
+        documentation : str , 
+        labelnames : tuple[str , ...] = ()
+    ) -> None : 
+
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.children : dict[tuple , object] = {}
+
+    def _new_child(self) : raise NotImplementedError
+
+    def labels(self , *values) : 
+
+        child = self.children.get(values)
+
+        if child is None : 
+
+            child = self._new_child()
+            self.children[values] = child
+
+        return child
+
+    def render(self) -> list[str] : 
+
+        lines : list[str] = [f'# HELP {self.name} {self.documentation}' , f'# TYPE {self.name} {self.kind}']
+
+        for values , child in self.children.items() : 
+            lines.append(f'{self.name}{_format_labels(self.labelnames , values)} {child.value}')
+
+        return lines
+
+class Counter(Metric) : 
+
+    kind = 'counter'
+
+    def _new_child(self) -> _CounterChild : return _CounterChild()
+
+class Gauge(Metric) : 
+
+    kind = 'gauge'
+
+    def _new_child(self) -> _GaugeChild : return _GaugeChild()
+
+class Histogram(Metric) : 
+
+    kind = 'histogram'
+
+    def __init__(
+        self , 
+        name : str , 
+        documentation : str , 
+        labelnames : tuple[str , ...] = () , 
+        buckets : tuple[float , ...] = DEFAULT_BUCKETS
+    ) -> None : 
+
+        super().__init__(name , documentation , labelnames)
+        self.buckets = buckets
+
+    def _new_child(self) -> _HistogramChild : return _HistogramChild(self.buckets)
+
+    def render(self) -> list[str] : 
+
+        lines : list[str] = [f'# HELP {self.name} {self.documentation}' , f'# TYPE {self.name} {self.kind}']
+
+        for values , child in self.children.items() : 
+
+            cumulative : int = 0
+
+            for bound , count in zip(self.buckets + (float('inf') ,) , child.counts) : 
+
+                cumulative += count
+                le : str = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames , values , le)} {cumulative}')
+
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames , values)} {child.sum}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames , values)} {child.count}')
+
+        return lines
+
+class MetricsRegistry : 
+    '''
+    Holds every metric of the process and renders them in the Prometheus text format.
+    Collectors are called at scrape time for values that live elsewhere (stats dicts).
+    '''
+
+    def __init__(self) -> None : 
+
+        self.metrics : list[Metric] = []
+        self.collectors : list[Callable[[] , list[str]]] = []
+
+    def register(self , metric : Metric) -> Metric : 
+
+        self.metrics.append(metric)
+
+        return metric
+
+    def add_collector(self , collector : Callable[[] , list[str]]) -> None : self.collectors.append(collector)
+
+    def render(self) -> str : 
+
+        lines : list[str] = []
+
+        for metric in self.metrics : lines.extend(metric.render())
+        for collector in self.collectors : lines.extend(collector())
+
+        return '\n'.join(lines) + '\n'
+
+def stats_collector(
+    name : str , 
+    documentation : str , 
+    stats : dict[str , float] , 
+    label : str = 'event' , 
+    kind : str = 'counter'
+) -> Callable[[] , list[str]] : 
+    '''
+    Exposes a plain stats dict, such as `json_stats`, as one labelled metric.
+    '''
+
+    def collect() -> list[str] : 
+
+        lines : list[str] = [f'# HELP {name} {documentation}' , f'# TYPE {name} {kind}']
+
+        for key , value in stats.items() : lines.append(f'{name}{{{label}="{key}"}} {value}')
+
+        return lines
+
+    return collect
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS : Histogram = registry.register(Histogram(
+    'vps_http_request_duration_seconds' , 
+    'Latency of HTTP requests by route.' , 
+    ('method' , 'route' , 'status')
+))
+
+STAGE_SECONDS : Histogram = registry.register(Histogram(
+    'vps_stage_duration_seconds' , 
+    'Duration of each stage of the scenario pipeline.' , 
+    ('stage' ,)
+))
+
+GEMINI_TTFT_SECONDS : Histogram = registry.register(Histogram(
+    'vps_gemini_time_to_first_token_seconds' , 
+    'Time from sending a Gemini request to its first streamed chunk, by whether the prompt came from the context cache.' , 
+    ('model' , 'context_cache')
+))
+
+GEMINI_TOKENS : Counter = registry.register(Counter(
+    'vps_gemini_tokens_total' , 
+    'Gemini tokens reported in usage metadata.' , 
+    ('model' , 'kind')
+))
+
+TTS_TTFB_SECONDS : Histogram = registry.register(Histogram(
+    'vps_tts_time_to_first_byte_seconds' , 
+    'Time from requesting a synthesis to its first audio byte.'
+))
+
+JOB_QUEUE_DEPTH : Gauge = registry.register(Gauge(
+    'vps_job_queue_depth' , 
+    'Scenario jobs waiting for a worker.'
+))
+
+JOB_WAIT_SECONDS : Histogram = registry.register(Histogram(
+    'vps_job_wait_seconds' , 
+    'Time a scenario job spends queued before a worker picks it up.' , 
+    ('kind' ,)
+))
+
+JOB_RUN_SECONDS : Histogram = registry.register(Histogram(
+    'vps_job_run_seconds' , 
+    'Time a worker spends running a scenario job.' , 
+    ('kind' ,)
+))
+
+JOBS_TOTAL : Counter = registry.register(Counter(
+    'vps_jobs_total' , 
+    'Finished scenario jobs by outcome.' , 
+    ('kind' , 'status')
+))
+
+ADMISSION_IN_FLIGHT : Gauge = registry.register(Gauge(
+    'vps_admission_in_flight' , 
+    'Calls holding a slot of each upstream bulkhead.' , 
+    ('upstream' ,)
+))
+
+ADMISSION_WAITING : Gauge = registry.register(Gauge(
+    'vps_admission_waiting' , 
+    'Calls waiting for a slot of each upstream bulkhead.' , 
+    ('upstream' ,)
+))
+
+ADMISSION_WAIT_SECONDS : Histogram = registry.register(Histogram(
+    'vps_admission_wait_seconds' , 
+    'Time a call waits for a slot of an upstream bulkhead.' , 
+    ('upstream' ,)
+))
+
+ADMISSION_REJECTED : Counter = registry.register(Counter(
+    'vps_admission_rejected_total' , 
+    'Requests turned away at admission, 429 for rate limits and 503 for overload.' , 
+    ('endpoint' , 'status')
+))
+
+CIRCUIT_STATE : Gauge = registry.register(Gauge(
+    'vps_circuit_state' , 
+    'State of the circuit breaker of each upstream : 0 closed, 1 half open, 2 open.' , 
+    ('upstream' ,)
+))
+
+HEDGED_REQUESTS : Counter = registry.register(Counter(
+    'vps_hedged_requests_total' , 
+    'Hedged copies of slow idempotent calls, launched and won.' , 
+    ('upstream' , 'outcome')
+))
+
+# * Set by whoever wants to follow the stages of the current task, such as a job worker
+stage_listener_var : ContextVar[Callable[[str , float | None] , None] | None] = ContextVar('stage_listener' , default = None)
+
+_tracer = None
+
+def enable_opentelemetry() -> bool : 
+    '''
+    Mirrors every stage as an OpenTelemetry span when the API package is installed;
+    exporting is left to the OpenTelemetry SDK configuration of the deployment.
+    '''
+
+    global _tracer
+
+    try : from opentelemetry import trace
+
+    except ImportError : return False
+
+    _tracer = trace.get_tracer('vps')
+
+    return True
+
+class stage_timer : 
+    '''
+    Context manager timing one pipeline stage into `vps_stage_duration_seconds`, and
+    reporting its start and duration to the stage listener of the task, if any.
+    '''
+
+    __slots__ = ('child' , 'stage' , 'start_time' , 'span' , 'listener')
+
+    def __init__(self , stage : str) -> None : 
+
+        self.child : _HistogramChild = STAGE_SECONDS.labels(stage)
+        self.stage = stage
+        self.span = None
+
+    def __enter__(self) -> 'stage_timer' : 
+
+        if _tracer is not None : 
+
+            self.span = _tracer.start_as_current_span(self.stage)
+            self.span.__enter__()
+
+        self.listener = stage_listener_var.get()
+
+        if self.listener is not None : self.listener(self.stage , None)
+
+        self.start_time : float = time.perf_counter()
+
+        return self
+
+    def __exit__(self , *exc_info) -> None : 
+
+        duration : float = time.perf_counter() - self.start_time
+
+        self.child.observe(duration)
+
+        if self.listener is not None : self.listener(self.stage , duration)
+
+        if self.span is not None : self.span.__exit__(*exc_info)
+
+class MetricsMiddleware : 
+    '''
+    Pure ASGI middleware recording the latency of every HTTP request by route template.
+    '''
+
+    def __init__(self , app) -> None : self.app = app
+
+    async def __call__(self , scope , receive , send) -> None : 
+
+        if scope['type'] != 'http' : return await self.app(scope , receive , send)
+
+        status : list[int] = [500]
+
+        async def send_wrapper(message) -> None : 
+
+            if message['type'] == 'http.response.start' : status[0] = message['status']
+
+            await send(message)
+
+        start_time : float = time.perf_counter()
+
+        try : await self.app(scope , receive , send_wrapper)
+
+        finally : 
+
+            route = scope.get('route')
+
+            HTTP_REQUEST_SECONDS.labels(
+                scope['method'] , 
+                getattr(route , 'path' , 'unmatched') , 
+                status[0]
+            ).observe(time.perf_counter() - start_time)
@@ -0,0 +1 @@
+from .profiling import * 
\ No newline at end of file
@@ -0,0 +1,385 @@
+import asyncio
+import heapq
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from types import CodeType
+
+from ..services import method_timings , time_methods
+
+class ProfilerBusy(Exception) : 
+
+    def __init__(self , name : str) -> None : super().__init__(f'A {name} is already running in this worker.')
+
+def _quantiles(values : list[float]) -> dict : 
+
+    if not values : return {'samples' : 0}
+
+    ordered : list[float] = sorted(values)
+
+    def at(q : float) -> float : return ordered[min(len(ordered) - 1 , int(q * len(ordered)))]
+
+    return {
+        'samples' : len(ordered) , 
+        'p50' : at(0.5) , 
+        'p99' : at(0.99) , 
+        'max' : ordered[-1]
+    }
+
+class SamplingProfiler : 
+    '''
+    Wall-clock sampling profiler : a thread wakes every `interval` seconds and records the
+    Python stack of the sampled threads, so the profiled code runs untouched and the cost
+    is one stack walk per thread and sample. Nothing runs between profiles.
+
+    The report is in the collapsed-stack format of flamegraph.pl and speedscope : one
+    `thread;outer;...;inner count` line per distinct stack.
+    '''
+
+    def __init__(self , interval : float) -> None : 
+
+        self.interval = interval
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _label(code : CodeType , frame , labels : dict[CodeType , str]) -> str : 
+
+        label : str | None = labels.get(code)
+
+        if label is None : label = labels[code] = f'{frame.f_globals.get("__name__" , "?")}:{code.co_qualname}'
+
+        return label
+
+    def _sample(
+        self , 
+        thread_ids : set[int] | None , 
+        stop : threading.Event , 
+        counts : Counter
+    ) -> None : 
+
+        own : int = threading.get_ident()
+        labels : dict[CodeType , str] = {}
+
+        while not stop.wait(self.interval) : 
+
+            names : dict[int , str] = {thread.ident : thread.name for thread in threading.enumerate()}
+
+            for thread_id , frame in sys._current_frames().items() : 
+
+                if thread_id == own or (thread_ids is not None and thread_id not in thread_ids) : continue
+
+                stack : list[str] = []
+
+                while frame is not None : 
+
+                    stack.append(self._label(frame.f_code , frame , labels))
+                    frame = frame.f_back
+
+                stack.append(names.get(thread_id , str(thread_id)))
+                stack.reverse()
+
+                counts[';'.join(stack)] += 1
+
+    async def profile(self , seconds : float , all_threads : bool = False) -> tuple[str , int] : 
+        '''
+        Samples for `seconds` seconds.
+
+        Args : 
+            - seconds (float) : How long to sample.
+            - all_threads (bool) : Whether to sample every thread rather than the event loop thread alone.
+
+        Returns : 
+            - tuple : The collapsed stacks, most sampled first, and the number of samples.
+
+        Raises : 
+            - ProfilerBusy : When a profile is already running.
+        '''
+
+        if not self.lock.acquire(blocking = False) : raise ProfilerBusy('CPU profile')
+
+        try : 
+
+            counts : Counter = Counter()
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target = self._sample , 
+                args = (None if all_threads else {threading.get_ident()} , stop , counts) , 
+                name = 'vps-profiler' , 
+                daemon = True
+            )
+
+            sampler.start()
+
+            try : await asyncio.sleep(seconds)
+
+            finally : 
+
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+
+        finally : self.lock.release()
+
+        return ''.join(f'{stack} {count}\n' for stack , count in counts.most_common()) , sum(counts.values())
+
+class MemoryTracker : 
+    '''
+    Finds memory growth with `tracemalloc` : once tracing is started, every `diff` takes a
+    snapshot, compares it with the previous one and keeps it as the next baseline.
+    Tracing slows every allocation down, so it only runs between `start` and `stop`.
+    '''
+
+    # * Allocations of tracemalloc itself and of imports are not what is being looked for
+    FILTERS : tuple[tracemalloc.Filter , ...] = (
+        tracemalloc.Filter(False , tracemalloc.__file__) , 
+        tracemalloc.Filter(False , '<frozen importlib._bootstrap>') , 
+        tracemalloc.Filter(False , '<frozen importlib._bootstrap_external>') , 
+        tracemalloc.Filter(False , '<unknown>')
+    )
+
+    def __init__(self) -> None : 
+
+        self.baseline : tracemalloc.Snapshot | None = None
+        self.started_at : float | None = None
+
+    @property
+    def tracing(self) -> bool : return self.baseline is not None and tracemalloc.is_tracing()
+
+    def _snapshot(self) -> tracemalloc.Snapshot : return tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+
+    async def start(self , frames : int) -> bool : 
+        '''
+        Starts tracing with `frames` frames per allocation traceback and takes the first baseline.
+
+        Returns : 
+            - bool : False when tracing was already on, which leaves it as it was.
+        '''
+
+        if self.tracing : return False
+
+        tracemalloc.start(frames)
+
+        self.started_at = time.time()
+        self.baseline = await asyncio.to_thread(self._snapshot)
+
+        return True
+
+    async def diff(self , top : int , group_by : str = 'lineno') -> dict | None : 
+        '''
+        Allocations grown the most since the last snapshot.
+
+        Args : 
+            - top (int) : How many allocation sites to return.
+            - group_by (str) : `lineno`, `filename` or `traceback`, as `Snapshot.compare_to` takes.
+
+        Returns : 
+            - dict | None : The traced and peak bytes and the top allocation sites, None when not tracing.
+        '''
+
+        if not self.tracing : return None
+
+        snapshot : tracemalloc.Snapshot = await asyncio.to_thread(self._snapshot)
+        statistics : list[tracemalloc.StatisticDiff] = await asyncio.to_thread(snapshot.compare_to , self.baseline , group_by)
+
+        self.baseline = snapshot
+        current , peak = tracemalloc.get_traced_memory()
+
+        return {
+            'tracing_since' : self.started_at , 
+            'traced_bytes' : current , 
+            'peak_traced_bytes' : peak , 
+            'growth' : [
+                {
+                    'where' : [f'{frame.filename}:{frame.lineno}' for frame in statistic.traceback] , 
+                    'size_diff' : statistic.size_diff , 
+                    'size' : statistic.size , 
+                    'count_diff' : statistic.count_diff , 
+                    'count' : statistic.count
+                }
+                for statistic in statistics[: top]
+            ]
+        }
+
+    def stop(self) -> bool : 
+
+        if not self.tracing : return False
+
+        tracemalloc.stop()
+
+        self.baseline = None
+        self.started_at = None
+
+        return True
+
+def _describe(handle : asyncio.Handle) -> dict : 
+    '''
+    What a slow callback was : for a task step, the task, its coroutine and the chain of
+    coroutines it was suspended in once the step was done, outermost first.
+    '''
+
+    callback = handle._callback
+    owner = getattr(callback , '__self__' , None)
+
+    if not isinstance(owner , asyncio.Task) : return {'callback' : getattr(callback , '__qualname__' , repr(callback))}
+
+    coroutine = owner.get_coro()
+    awaiting : list[str] = []
+
+    while coroutine is not None and getattr(coroutine , 'cr_frame' , None) is not None : 
+
+        frame = coroutine.cr_frame
+        awaiting.append(f'{frame.f_globals.get("__name__" , "?")}:{frame.f_code.co_qualname}:{frame.f_lineno}')
+        coroutine = coroutine.cr_await
+
+    return {'callback' : f'task {owner.get_name()} : {getattr(owner.get_coro() , "__qualname__" , "?")}' , 'awaiting' : awaiting}
+
+class LoopMonitor : 
+    '''
+    Watches the event loop for a while : how late a periodic wake-up is (the loop lag) and
+    which callbacks ran longer than `slow_callback_duration` seconds, the ones that block
+    every other request of the worker. Callbacks are timed by swapping in a timed
+    `Handle._run` for the duration only; uvloop runs its handles natively, so there only
+    the lag is reported.
+    '''
+
+    def __init__(
+        self , 
+        interval : float , 
+        slow_callback_duration : float , 
+        max_slow_callbacks : int
+    ) -> None : 
+
+        self.interval = interval
+        self.slow_callback_duration = slow_callback_duration
+        self.max_slow_callbacks = max_slow_callbacks
+
+        self.running : bool = False
+
+    async def monitor(self , seconds : float) -> dict : 
+        '''
+        Watches the loop for `seconds` seconds.
+
+        Returns : 
+            - dict : The loop lag quantiles, the slowest callbacks (None under uvloop) and how many were slow in all.
+
+        Raises : 
+            - ProfilerBusy : When the loop is already being watched.
+        '''
+
+        if self.running : raise ProfilerBusy('loop monitor')
+
+        self.running = True
+
+        loop = asyncio.get_running_loop()
+        timed : bool = isinstance(loop , asyncio.BaseEventLoop)
+
+        # * A min-heap of (duration, order, handle description), so the slowest ones are kept
+        slowest : list[tuple[float , int , dict]] = []
+        slow_count : list[int] = [0]
+
+        run = asyncio.Handle._run
+        threshold : float = self.slow_callback_duration
+        limit : int = self.max_slow_callbacks
+
+        def timed_run(handle : asyncio.Handle) -> None : 
+
+            start_time : float = time.perf_counter()
+
+            run(handle)
+
+            duration : float = time.perf_counter() - start_time
+
+            if duration < threshold : return
+
+            slow_count[0] += 1
+
+            if len(slowest) < limit : heapq.heappush(slowest , (duration , slow_count[0] , _describe(handle)))
+            elif duration > slowest[0][0] : heapq.heapreplace(slowest , (duration , slow_count[0] , _describe(handle)))
+
+        if timed : asyncio.Handle._run = timed_run
+
+        lags : list[float] = []
+
+        try : 
+
+            deadline : float = time.perf_counter() + seconds
+
+            while time.perf_counter() < deadline : 
+
+                start_time : float = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                lags.append(max(0.0 , time.perf_counter() - start_time - self.interval))
+
+        finally : 
+
+            if timed : asyncio.Handle._run = run
+
+            self.running = False
+
+        return {
+            'seconds' : seconds , 
+            'loop' : type(loop).__module__ + '.' + type(loop).__qualname__ , 
+            'lag_seconds' : _quantiles(lags) , 
+            'slow_callback_seconds' : threshold , 
+            'slow_callbacks_total' : slow_count[0] if timed else None , 
+            'slow_callbacks' : [
+                {'duration' : duration , **description}
+                for duration , _ , description in sorted(slowest , key = lambda entry : entry[0] , reverse = True)
+            ] if timed else None
+        }
+
+class MethodTimer : 
+    '''
+    Times the hot-path methods marked with `method_log_timer` for a while : their timed
+    wrappers are swapped in for the duration only, and the plain methods put back after.
+    '''
+
+    def __init__(self) -> None : self.running : bool = False
+
+    async def time(self , seconds : float) -> dict : 
+        '''
+        Returns : 
+            - dict : Calls, total, mean and slowest seconds of every method called, by qualified name, most total time first.
+
+        Raises : 
+            - ProfilerBusy : When the methods are already being timed.
+        '''
+
+        if self.running : raise ProfilerBusy('method timing')
+
+        self.running = True
+        method_timings.clear()
+        time_methods(True)
+
+        try : await asyncio.sleep(seconds)
+
+        finally : 
+
+            time_methods(False)
+            self.running = False
+
+        return {
+            name : {
+                'calls' : calls , 
+                'total_seconds' : total , 
+                'mean_seconds' : total / calls , 
+                'max_seconds' : slowest
+            }
+            for name , (calls , total , slowest) in sorted(method_timings.items() , key = lambda item : item[1][1] , reverse = True)
+        }
+
+class Profiling : 
+    '''
+    The on-demand diagnostics of one worker process. None of them runs, and none of them
+    costs anything, until it is asked for.
+    '''
+
+    def __init__(self , config : dict) -> None : 
+
+        self.config = config
+
+        self.cpu = SamplingProfiler(config['sample-interval'])
+        self.memory = MemoryTracker()
+        self.loop = LoopMonitor(config['lag-interval'] , config['slow-callback-duration'] , config['max-slow-callbacks'])
+        self.methods = MethodTimer()
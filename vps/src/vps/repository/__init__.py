@@ -0,0 +1 @@
+from .repository import * 
\ No newline at end of file
@@ -0,0 +1,231 @@
+import asyncio
+from collections.abc import Callable
+from logging import Logger
+from bson import ObjectId
+from pymongo import ASCENDING , DESCENDING , InsertOne , UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import BulkWriteError , OperationFailure
+from pymongo.results import BulkWriteResult , UpdateResult
+
+from ..admission import get_bulkhead
+from ..services import method_log_timer
+
+class ScenarioRepository : 
+    '''
+    Async access to the scenario collection, keyed by the Voxio `api_key`.
+
+    With `write-behind` on, inserts and upserts are queued and flushed by a single
+    background task : every write waiting while a flush is in flight goes out in the
+    next `bulk_write`, so batches grow with load and stay at one document when idle.
+
+    `on_write` is called after every write, so caches of scenario reads can be dropped.
+    '''
+
+    def __init__(
+        self , 
+        collection : AsyncCollection , 
+        config : dict , 
+        logger : Logger | None = None , 
+        on_write : Callable[[] , None] | None = None
+    ) -> None : 
+
+        self.collection = collection
+        self.logger = logger
+        self.on_write = on_write
+
+        self.write_behind : bool = config['write-behind']
+        self.batch_size : int = config['batch-size']
+
+        self.queue : asyncio.Queue = asyncio.Queue()
+        self.flusher : asyncio.Task | None = None
+
+    async def start(self) -> None : 
+
+        await self.ensure_indexes()
+
+        # * Startup retries its checks, so `start` may run again once the flusher is up
+        if self.write_behind and (self.flusher is None or self.flusher.done()) : self.flusher = asyncio.create_task(self._flush_forever())
+
+    async def close(self) -> None : 
+
+        if self.flusher is None : return
+
+        await self.queue.join()
+
+        self.flusher.cancel()
+        self.flusher = None
+
+    async def ensure_indexes(self) -> None : 
+        '''
+        Makes sure `api_key` carries a unique index, creating it when missing.
+        '''
+
+        indexes : dict = await self.collection.index_information()
+
+        for index in indexes.values() : 
+
+            if index['key'] == [('api_key' , ASCENDING)] and index.get('unique') : return
+
+        try : await self.collection.create_index([('api_key' , ASCENDING)] , unique = True , name = 'api_key_unique')
+
+        # * Existing duplicates block the index; keep serving but make it visible
+        except OperationFailure as e : 
+
+            if self.logger : self.logger.error(f'Could not create unique index on api_key : {e}')
+            else : raise
+
+    def _written(self) -> None : 
+
+        if self.on_write is not None : self.on_write()
+
+    @method_log_timer
+    async def insert(self , document : dict) -> ObjectId : 
+
+        document.setdefault('_id' , ObjectId())
+
+        if self.write_behind : await self._enqueue(InsertOne(document))
+        else : 
+
+            async with get_bulkhead('mongo').slot() : await self.collection.insert_one(document)
+
+        self._written()
+
+        return document['_id']
+
+    async def insert_many(self , documents : list[dict]) -> dict[int , str] : 
+        '''
+        Inserts documents in one unordered round trip, bypassing write-behind.
+
+        Returns : 
+            - dict : The error message of every document that failed, by its position.
+        '''
+
+        for document in documents : document.setdefault('_id' , ObjectId())
+
+        try : 
+
+            async with get_bulkhead('mongo').slot() : await self.collection.insert_many(documents , ordered = False)
+
+        # * An unordered batch still inserts every document that did not fail
+        except BulkWriteError as e : return {error['index'] : error.get('errmsg' , 'write error') for error in e.details['writeErrors']}
+
+        finally : self._written()
+
+        return {}
+
+    async def upsert(
+        self , 
+        api_key : str , 
+        fields : dict
+    ) -> None : 
+
+        operation = UpdateOne({'api_key' : api_key} , {'$set' : fields} , upsert = True)
+
+        if self.write_behind : await self._enqueue(operation)
+        else : 
+
+            async with get_bulkhead('mongo').slot() : await self.collection.bulk_write([operation])
+
+        self._written()
+
+    @method_log_timer
+    async def update(
+        self , 
+        api_key : str , 
+        fields : dict
+    ) -> UpdateResult : 
+        '''
+        Updates an existing scenario in one round trip; `matched_count` is 0 when none exists.
+        '''
+
+        async with get_bulkhead('mongo').slot() : result : UpdateResult = await self.collection.update_one({'api_key' : api_key} , {'$set' : fields})
+
+        self._written()
+
+        return result
+
+    async def bulk(self , operations : list) -> BulkWriteResult : 
+
+        try : 
+
+            async with get_bulkhead('mongo').slot() : return await self.collection.bulk_write(operations , ordered = False)
+
+        finally : self._written()
+
+    @method_log_timer
+    async def find(
+        self , 
+        api_key : str , 
+        projection : dict | None = None
+    ) -> dict | None : 
+
+        async with get_bulkhead('mongo').slot() : return await self.collection.find_one({'api_key' : api_key} , projection)
+
+    @method_log_timer
+    async def page(
+        self , 
+        after : ObjectId | None , 
+        limit : int , 
+        projection : dict | None = None
+    ) -> list[dict] : 
+        '''
+        One page of scenarios, newest first. The page starts right after a cursor on the
+        `_id` index instead of skipping the scenarios before it, so its cost does not grow
+        with how deep it is or with the size of the collection.
+
+        Args : 
+            - after (ObjectId) : The `_id` of the last scenario of the previous page, None for the first page.
+            - limit (int) : The most scenarios to return.
+            - projection (dict) : The fields to return, all by default.
+
+        Returns : 
+            - list[dict] : The scenarios.
+        '''
+
+        query : dict = {} if after is None else {'_id' : {'$lt' : after}}
+
+        async with get_bulkhead('mongo').slot() : return await self.collection.find(query , projection).sort('_id' , DESCENDING).limit(limit).to_list(length = limit)
+
+    async def _enqueue(self , operation) -> None : 
+
+        future : asyncio.Future = asyncio.get_running_loop().create_future()
+
+        await self.queue.put((operation , future))
+        await future
+
+    async def _flush_forever(self) -> None : 
+
+        while True : 
+
+            batch : list = [await self.queue.get()]
+
+            while len(batch) < self.batch_size and not self.queue.empty() : batch.append(self.queue.get_nowait())
+
+            try : await self._flush(batch)
+            finally : 
+
+                for _ in batch : self.queue.task_done()
+
+    async def _flush(self , batch : list) -> None : 
+
+        try : 
+
+            async with get_bulkhead('mongo').slot() : await self.collection.bulk_write([operation for operation , _ in batch] , ordered = False)
+
+            failed : dict = {}
+
+        except BulkWriteError as e : failed = {error['index'] : error for error in e.details['writeErrors']}
+
+        except Exception as e : 
+
+            for _ , future in batch : 
+                if not future.done() : future.set_exception(e)
+
+            return
+
+        for index , (_ , future) in enumerate(batch) : 
+
+            if future.done() : continue
+
+            if index in failed : future.set_exception(OperationFailure(failed[index]['errmsg'] , failed[index]['code']))
+            else : future.set_result(None)
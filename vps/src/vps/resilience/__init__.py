@@ -0,0 +1 @@
+from .resilience import * 
@@ -0,0 +1,350 @@
+import asyncio
+import bisect
+import contextlib
+import math
+import random
+import time
+from collections import deque
+from collections.abc import AsyncIterator , Awaitable , Callable
+from contextvars import ContextVar
+
+from starlette.exceptions import HTTPException
+
+from ..admission import AdmissionRejected
+from ..metrics import CIRCUIT_STATE , HEDGED_REQUESTS
+
+# * Absolute `time.monotonic()` by which the current request must be answered, None without one
+deadline_var : ContextVar[float | None] = ContextVar('deadline' , default = None)
+
+CIRCUIT_STATES : dict[str , int] = {'closed' : 0 , 'half_open' : 1 , 'open' : 2}
+
+class CircuitOpen(Exception) : 
+
+    def __init__(self , upstream : str , retry_after : float) -> None : 
+
+        super().__init__(f'{upstream} is unavailable, calls are paused for {retry_after:.0f}s.')
+        self.upstream = upstream
+        self.retry_after : int = max(1 , math.ceil(retry_after))
+
+class DeadlineExceeded(TimeoutError) : 
+
+    def __init__(self) -> None : super().__init__('The request deadline passed before the work finished.')
+
+class ClientError(Exception) : 
+    '''
+    An error caused by what the caller sent rather than by the upstream, which a breaker does not count.
+    '''
+
+def caused_by_client(exc : BaseException | None) -> bool : 
+
+    if isinstance(exc , ClientError) : return True
+
+    return isinstance(exc , HTTPException) and 400 <= exc.status_code < 500
+
+def time_left(timeout : float | None = None) -> float | None : 
+    '''
+    The time budget of a call : `timeout`, cut down to what is left of the request deadline.
+
+    Raises : 
+        - DeadlineExceeded : When the deadline has already passed.
+    '''
+
+    deadline : float | None = deadline_var.get()
+
+    if deadline is None : return timeout
+
+    left : float = deadline - time.monotonic()
+
+    if left <= 0 : raise DeadlineExceeded()
+
+    return left if timeout is None else min(timeout , left)
+
+def deadline_passed() -> bool : 
+
+    deadline : float | None = deadline_var.get()
+
+    return deadline is not None and time.monotonic() >= deadline
+
+@contextlib.asynccontextmanager
+async def within_deadline(timeout : float | None = None) -> AsyncIterator[None] : 
+    '''
+    Times out the block after `timeout` seconds or at the request deadline, whichever
+    comes first; running out of the deadline raises `DeadlineExceeded`.
+    '''
+
+    try : 
+
+        async with asyncio.timeout(time_left(timeout)) : yield
+
+    except TimeoutError : 
+
+        if deadline_passed() : raise DeadlineExceeded() from None
+
+        raise
+
+def backoff_delay(
+    attempt : int , 
+    base : float , 
+    cap : float
+) -> float : 
+    '''
+    Full-jitter exponential backoff : a uniform delay up to `base * 2 ** attempt`, capped,
+    so retries of many callers spread out instead of arriving together.
+    '''
+
+    return random.uniform(0 , min(cap , base * (2 ** attempt)))
+
+class CircuitBreaker : 
+    '''
+    Stops calling an upstream after `failure-threshold` failures in a row. While open,
+    calls fail at once with `CircuitOpen`; after `reset-timeout` seconds a single probe
+    call is let through, which closes the circuit on success and reopens it on failure.
+    '''
+
+    def __init__(
+        self , 
+        name : str , 
+        failure_threshold : int , 
+        reset_timeout : float
+    ) -> None : 
+
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state : str = 'closed'
+        self.failures : int = 0
+        self.opened_at : float = 0.0
+        self.probing : bool = False
+
+        self.gauge = CIRCUIT_STATE.labels(name)
+        self.gauge.set(0)
+
+    def _set_state(self , state : str) -> None : 
+
+        self.state = state
+        self.gauge.set(CIRCUIT_STATES[state])
+
+    def check(self) -> None : 
+        '''
+        Raises `CircuitOpen` unless a call may go out now.
+        '''
+
+        if self.state == 'open' : 
+
+            elapsed : float = time.monotonic() - self.opened_at
+
+            if elapsed < self.reset_timeout : raise CircuitOpen(self.name , self.reset_timeout - elapsed)
+
+            self._set_state('half_open')
+
+        if self.state == 'half_open' : 
+
+            if self.probing : raise CircuitOpen(self.name , 1)
+
+            self.probing = True
+
+    def success(self) -> None : 
+
+        self.failures = 0
+        self.probing = False
+
+        if self.state != 'closed' : self._set_state('closed')
+
+    def failure(self) -> None : 
+
+        self.failures += 1
+        self.probing = False
+
+        if self.state == 'half_open' or self.failures >= self.failure_threshold : 
+
+            self.opened_at = time.monotonic()
+            self._set_state('open')
+
+    def release(self) -> None : 
+        '''
+        Ends a call that says nothing about the upstream, such as one cancelled by its caller.
+        '''
+
+        self.probing = False
+
+    def guard(self) -> '_Guard' : return _Guard(self)
+
+class _Guard : 
+    '''
+    Context manager of one call through a breaker : an exception is a failure, except
+    cancellation, the deadline of the caller, a call shed before it was sent and errors
+    caused by the caller's own input;
+    `fail()` marks a bad response as one, `release()` an error that says nothing about the upstream.
+    '''
+
+    __slots__ = ('breaker' , 'failed' , 'released')
+
+    def __init__(self , breaker : CircuitBreaker) -> None : 
+
+        self.breaker = breaker
+        self.failed : bool = False
+        self.released : bool = False
+
+    def fail(self) -> None : self.failed = True
+
+    def release(self) -> None : self.released = True
+
+    def __enter__(self) -> '_Guard' : 
+
+        self.breaker.check()
+
+        return self
+
+    def __exit__(self , exc_type , exc , traceback) -> None : 
+
+        if self.released : self.breaker.release()
+        elif exc_type is None and self.failed : self.breaker.failure()
+        elif exc_type is None : self.breaker.success()
+        elif issubclass(exc_type , (asyncio.CancelledError , AdmissionRejected , DeadlineExceeded , GeneratorExit)) or caused_by_client(exc) : self.breaker.release()
+        else : self.breaker.failure()
+
+# * One breaker per upstream, shared by every caller of the process
+_breakers : dict[str , CircuitBreaker] = {}
+
+def configure_breakers(config : dict) -> None : 
+    '''
+    Builds the breakers of the `resilience.breakers` section of the config.
+    '''
+
+    for name , breaker in config.items() : _breakers[name] = CircuitBreaker(
+        name , 
+        breaker['failure-threshold'] , 
+        breaker['reset-timeout']
+    )
+
+def get_breaker(name : str) -> CircuitBreaker : 
+    '''
+    Returns the breaker of an upstream, creating one with default settings when none was configured.
+    '''
+
+    breaker : CircuitBreaker | None = _breakers.get(name)
+
+    if breaker is None : 
+
+        breaker = CircuitBreaker(name , 5 , 30)
+        _breakers[name] = breaker
+
+    return breaker
+
+class LatencyTracker : 
+    '''
+    Recent latencies of one kind of call, kept sorted so a quantile is a lookup.
+    '''
+
+    def __init__(self , window : int = 200) -> None : 
+
+        self.recent : deque[float] = deque(maxlen = window)
+        self.ordered : list[float] = []
+
+    def observe(self , seconds : float) -> None : 
+
+        if len(self.recent) == self.recent.maxlen : self.ordered.pop(bisect.bisect_left(self.ordered , self.recent[0]))
+
+        self.recent.append(seconds)
+        bisect.insort(self.ordered , seconds)
+
+    def quantile(self , q : float , min_samples : int = 20) -> float | None : 
+
+        if len(self.ordered) < min_samples : return None
+
+        return self.ordered[min(len(self.ordered) - 1 , int(q * len(self.ordered)))]
+
+async def hedged(
+    call : Callable[[] , Awaitable] , 
+    delay : float | None , 
+    upstream : str
+) : 
+    '''
+    Runs an idempotent call and, when it has not answered after `delay` seconds, a second
+    copy of it; the first copy to succeed wins and the other is cancelled.
+
+    Args : 
+        - call (Callable) : Builds the coroutine of the call.
+        - delay (float) : Seconds before hedging, None to never hedge.
+        - upstream (str) : The upstream named in the metrics.
+    '''
+
+    first : asyncio.Task = asyncio.ensure_future(call())
+
+    if delay is None : return await first
+
+    pending : set[asyncio.Task] = {first}
+
+    try : 
+
+        done , pending = await asyncio.wait(pending , timeout = delay)
+
+        if done : return first.result()
+
+        HEDGED_REQUESTS.labels(upstream , 'launched').inc()
+
+        second : asyncio.Task = asyncio.ensure_future(call())
+        pending.add(second)
+
+        error : BaseException | None = None
+
+        while pending : 
+
+            done , pending = await asyncio.wait(pending , return_when = asyncio.FIRST_COMPLETED)
+
+            for task in done : 
+
+                if task.exception() is None : 
+
+                    if task is second : HEDGED_REQUESTS.labels(upstream , 'won').inc()
+
+                    return task.result()
+
+                error = task.exception()
+
+        raise error
+
+    finally : 
+
+        for task in pending : task.cancel()
+
+class DeadlineMiddleware : 
+    '''
+    Pure ASGI middleware reading the time budget of a request from a header, in seconds,
+    into `deadline_var`, so every upstream call below it is cut short when it runs out.
+    '''
+
+    def __init__(
+        self , 
+        app , 
+        header : str = 'x-request-timeout' , 
+        max_seconds : float = 300
+    ) -> None : 
+
+        self.app = app
+        self.header : bytes = header.lower().encode()
+        self.max_seconds = max_seconds
+
+    async def __call__(self , scope , receive , send) -> None : 
+
+        if scope['type'] != 'http' : return await self.app(scope , receive , send)
+
+        seconds : float | None = None
+
+        for name , value in scope['headers'] : 
+
+            if name == self.header : 
+
+                try : seconds = float(value)
+                except ValueError : pass
+
+                break
+
+        # * `nan` and `inf` parse too but make no deadline, so they are ignored like any malformed value
+        if seconds is None or not math.isfinite(seconds) or seconds <= 0 : return await self.app(scope , receive , send)
+
+        token = deadline_var.set(time.monotonic() + min(seconds , self.max_seconds))
+
+        try : await self.app(scope , receive , send)
+        finally : deadline_var.reset(token)
@@ -1,25 +1,42 @@
-import os
-from google.genai import Client
-from google.genai.types import GenerateContentConfig
-from pymongo import MongoClient
-import json
-from ..services import create_generation_config , json_to_google_chat
-from ..llm import run_json_gemini
-from requests import Response
-import requests 
-
-
-async def add_scenario_route(
+import asyncio
+from collections.abc import AsyncIterator , Callable
+from typing import TYPE_CHECKING
+from ..assets import ScenarioAssets
+from ..services import json_to_google_chat
+from ..cache import ResultCache , generation_key
+from ..llm import run_json_gemini , GenerationFailed
+from ..metrics import stage_timer
+from ..repository import ScenarioRepository
+from ..voxio import VoxioClient
+from ..codec import loads
+from bson import ObjectId
+from httpx import Response
+from logging import Logger , getLogger
+
+logger : Logger = getLogger(__name__)
+
+if TYPE_CHECKING : from google.genai import Client
+
+# * The scenario fields a read may return, and the ones a list returns by default : the prompt and questions are most of a document
+SCENARIO_FIELDS : tuple[str , ...] = ('api_key' , 'scenario_name' , 'scenario_prompt' , 'questions_for_feedback' , 'difficulty_status')
+SCENARIO_SUMMARY_FIELDS : tuple[str , ...] = ('api_key' , 'scenario_name' , 'difficulty_status')
+
+
+async def generate_scenario(
     query : str , 
-    mongo_client : MongoClient , 
-    gemini_client : Client , 
-    config : dict 
+    gemini_client : 'Client' , 
+    assets : ScenarioAssets , 
+    config : dict , 
+    generation_cache : ResultCache | None = None , 
+    on_text : Callable[[str] , None] | None = None
 ) -> dict : 
+    '''
+    Generates the scenario JSON of a query. With a cache, identical queries for the same
+    prompt version and model share one generation and failed generations are never kept.
+    A streamed generation bypasses it, since a cached or shared result streams no text.
+    '''
 
-    with open(config['prompt-path']) as system_prompt_file : 
-        system_prompt : str = system_prompt_file.read()
-
-    generation_config : GenerateContentConfig = await create_generation_config(system_prompt)
+    if on_text is not None : generation_cache = None
 
     messages = [{
         'role' : 'user' , 
@@ -28,186 +45,426 @@ async def add_scenario_route(
 
     contents : list = await json_to_google_chat(messages)
 
-    response : dict = await run_json_gemini(
+    generate = lambda : run_json_gemini(
         gemini_client = gemini_client , 
         contents = contents , 
-        generation_config = generation_config , 
-        model = config['model']
+        generation_config = assets.generation_config , 
+        model = config['model'] , 
+        max_concurrency = config['max-concurrency'] , 
+        timeout = config['timeout'] , 
+        on_text = on_text , 
+        raise_on_failure = generation_cache is not None
     )
 
-    with open(config['workflow-path']) as workflow_file : 
-        workflow : dict = json.load(workflow_file)
+    if generation_cache is None : return await generate()
 
-    workflow['variables']['feedback_questions']['value'] = response['questions_for_feedback']
-    workflow['nodes']['llm']['parameters']['system_prompt'] = response['scenario_prompt']
+    try : return await generation_cache.get_or_run(generation_key(query , assets.prompt_version , config['model']) , generate)
 
-    api_response : Response = requests.post(
-        'https://database.voxio.in/add-flow' , 
-        json = {
-            'agent' : {'workflow' : workflow} , 
-            'flow_name' : response['scenario_name'] ,
-        } , 
-        headers = {'api_key' : os.environ['VOXIO_API_KEY']}
-    )
+    except GenerationFailed as e : return e.fallback
 
-    if api_response.status_code == 200 : 
+async def create_flow(
+    query : str , 
+    gemini_client : 'Client' , 
+    voxio_client : VoxioClient , 
+    assets : ScenarioAssets , 
+    config : dict , 
+    generation_cache : ResultCache | None = None , 
+    on_text : Callable[[str] , None] | None = None
+) -> tuple[dict , dict | None] : 
+    '''
+    Generates a scenario and creates its Voxio flow, everything short of storing it.
+
+    Returns : 
+        - tuple : The response so far and the scenario document to insert, or an error response and None.
+    '''
+
+    response : dict = await generate_scenario(
+        query = query , 
+        gemini_client = gemini_client , 
+        assets = assets , 
+        config = config , 
+        generation_cache = generation_cache , 
+        on_text = on_text
+    )
 
-        api_key : str = api_response.json().get('api_key' , '')
+    with stage_timer('workflow_build') : 
 
-        try : 
+        body : bytes = assets.flow_template.render(response['scenario_name'] , response)
+        flow_hash : str = assets.flow_template.flow_hash(response['scenario_name'] , response)
 
-            db = mongo_client[config['database-name']]
-            collection = db[config['collection-name']]
-            
-            # * Prepare document to insert
-            scenario_doc = {
-                'scenario_name' : response.get('scenario_name' , '') , 
-                'scenario_prompt' : response.get('scenario_prompt' , '') , 
-                'questions_for_feedback' : response.get('questions_for_feedback' , []) , 
-                'difficulty_status' : response.get('difficulty_status' , '') , 
-                'api_key' : api_key
-            }
-            
-            # * Insert the document
-            result = collection.insert_one(scenario_doc)
-            
-            # * Add the inserted ID and API key to response
-            response['_id'] = str(result.inserted_id)
-            response['api_key'] = api_key
-            response['status'] = 'success'
-            response['message'] = 'Scenario added successfully'
-            
-            print(f"✓ Scenario added with ID: {result.inserted_id}")
+    with stage_timer('voxio_add_flow') : api_response : Response = await voxio_client.add_flow(
+        workflow = None , 
+        flow_name = response['scenario_name'] , 
+        flow_hash = flow_hash , 
+        body = body
+    )
 
-        except Exception as e : 
+    if api_response.status_code != 200 : 
 
-            print(f"✗ Error adding scenario to database: {e}")
-            response['status'] = 'error'
-            response['message'] = f'Failed to add scenario: {str(e)}'
+        logger.error(f'✗ Voxio responded {api_response.status_code} : {api_response.text}')
 
-        return response
+        return {
+            'status' : 'error' , 
+            'message' : 'Failed to create flow in Voxio' , 
+        } , None
 
-    else : print(api_response.json())
+    api_key : str = loads(api_response.content).get('api_key' , '')
 
-    return {
-        'status' : 'error' , 
-        'message' : 'Failed to create flow in Voxio' ,
+    # * Prepare document to insert
+    scenario_doc = {
+        'scenario_name' : response.get('scenario_name' , '') , 
+        'scenario_prompt' : response.get('scenario_prompt' , '') , 
+        'questions_for_feedback' : response.get('questions_for_feedback' , []) , 
+        'difficulty_status' : response.get('difficulty_status' , '') , 
+        'api_key' : api_key , 
+        'workflow_hash' : flow_hash
     }
 
-async def edit_scenario_route(
+    response['api_key'] = api_key
+
+    return response , scenario_doc
+
+def _added(response : dict , inserted_id) -> dict : 
+
+    response['_id'] = str(inserted_id)
+    response['status'] = 'success'
+    response['message'] = 'Scenario added successfully'
+
+    return response
+
+def _not_added(response : dict , error : str) -> dict : 
+
+    response['status'] = 'error'
+    response['message'] = f'Failed to add scenario: {error}'
+
+    return response
+
+async def add_scenario_route(
     query : str , 
-    mongo_client : MongoClient , 
-    gemini_client : Client , 
+    scenario_repository : ScenarioRepository , 
+    gemini_client : 'Client' , 
+    voxio_client : VoxioClient , 
+    assets : ScenarioAssets , 
     config : dict , 
-    api_key : str
-) : 
+    generation_cache : ResultCache | None = None , 
+    on_text : Callable[[str] , None] | None = None
+) -> dict : 
 
-    api_response : Response = requests.get(
-        'https://database.voxio.in/flow' , 
-        headers = {'api_key' : api_key}
+    response , scenario_doc = await create_flow(
+        query = query , 
+        gemini_client = gemini_client , 
+        voxio_client = voxio_client , 
+        assets = assets , 
+        config = config , 
+        generation_cache = generation_cache , 
+        on_text = on_text
     )
 
-    if api_response.status_code == 200 : 
+    if scenario_doc is None : return response
 
-        api_response = requests.get(
-            'https://database.voxio.in/agent' , 
-            headers = {'agent_id' : api_response.json()['agent_id']}
-        )
+    try : 
 
-        with open(config['prompt-path']) as system_prompt_file : 
-            system_prompt : str = system_prompt_file.read()
+        # * Insert the document
+        with stage_timer('mongo_insert') : inserted_id = await scenario_repository.insert(scenario_doc)
 
-        generation_config : GenerateContentConfig = await create_generation_config(system_prompt)
+    except Exception as e : 
 
-        messages = [{
-            'role' : 'user' , 
-            'content' : query
-        }]
+        logger.error(f'✗ Error adding scenario to database : {e}')
 
-        contents : list = await json_to_google_chat(messages)
+        return _not_added(response , str(e))
 
-        response : dict = await run_json_gemini(
-            gemini_client = gemini_client , 
-            contents = contents , 
-            generation_config = generation_config , 
-            model = config['model']
-        )
+    logger.info(f'✓ Scenario added with ID : {inserted_id}')
 
-        with open(config['workflow-path']) as workflow_file : 
-            workflow : dict = json.load(workflow_file)
+    return _added(response , inserted_id)
 
-        workflow['variables']['feedback_questions']['value'] = response['questions_for_feedback']
-        workflow['nodes']['llm']['parameters']['system_prompt'] = response['scenario_prompt']
+async def add_scenarios_route(
+    queries : list[str] , 
+    scenario_repository : ScenarioRepository , 
+    gemini_client : 'Client' , 
+    voxio_client : VoxioClient , 
+    assets : ScenarioAssets , 
+    config : dict , 
+    max_concurrency : int , 
+    generation_cache : ResultCache | None = None
+) -> AsyncIterator[dict] : 
+    '''
+    Runs the add-scenario pipeline over many queries, at most `max_concurrency` at a time,
+    and yields one result per query, tagged with its `index`, as soon as it is settled.
+
+    Documents are not inserted one by one : whatever is ready while an insert is in flight
+    goes out in the next `insert_many`, so batches grow with the fan-out.
+    '''
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    insert_lock = asyncio.Lock()
+
+    pending : list[tuple[int , dict , dict]] = []
+    results : asyncio.Queue = asyncio.Queue()
+
+    async def insert_pending() -> None : 
+
+        async with insert_lock : 
+
+            batch : list[tuple[int , dict , dict]] = pending[:]
+            pending.clear()
+
+            if not batch : return
+
+            try : 
+
+                with stage_timer('mongo_insert_many') : failed : dict[int , str] = await scenario_repository.insert_many([scenario_doc for _ , _ , scenario_doc in batch])
+
+            except Exception as e : failed = {position : str(e) for position in range(len(batch))}
+
+            for position , (index , response , scenario_doc) in enumerate(batch) : 
+
+                if position in failed : results.put_nowait({'index' : index , **_not_added(response , failed[position])})
+                else : results.put_nowait({'index' : index , **_added(response , scenario_doc['_id'])})
+
+            logger.info(f'✓ {len(batch) - len(failed)} of {len(batch)} scenarios added in one insert')
 
-        api_response = requests.put(
-        'https://database.voxio.in/edit-flow' , 
-        json = {'flow_name' : response['scenario_name'] , 'agent' : {'workflow' : workflow}} ,
-        headers = {'api_key' : api_key , 'user_api_key' : os.environ['VOXIO_API_KEY']} ,
-        )
+    async def run(index : int , query : str) -> None : 
 
         try : 
 
-            db = mongo_client[config['database-name']]
-            collection = db[config['collection-name']]
-            
-            # * Find the document by API key
-            existing_doc = collection.find_one({'api_key': api_key})
-            
-            if existing_doc is None : 
-
-                response['status'] = 'error'
-                response['message'] = f'No scenario found with api_key: {api_key}'
-                print(f"✗ No scenario found with api_key: {api_key}")
-
-                return response
-            
-            # * Prepare update data (only update fields that are present in response)
-            update_data = {}
-            
-            if 'scenario_name' in response : 
-                update_data['scenario_name'] = response['scenario_name']
-
-            if 'scenario_prompt' in response : 
-                update_data['scenario_prompt'] = response['scenario_prompt']
-
-            if 'questions_for_feedback' in response : 
-                update_data['questions_for_feedback'] = response['questions_for_feedback']
-
-            if 'difficulty_status' in response : 
-                update_data['difficulty_status'] = response['difficulty_status']
-            
-            # * Update the document
-            result = collection.update_one(
-                {'api_key' : api_key} , 
-                {'$set' : update_data}
+            async with semaphore : response , scenario_doc = await create_flow(
+                query = query , 
+                gemini_client = gemini_client , 
+                voxio_client = voxio_client , 
+                assets = assets , 
+                config = config , 
+                generation_cache = generation_cache
             )
-            
-            if result.modified_count > 0 : 
-                response['status'] = 'success'
-                response['message'] = 'Scenario updated successfully'
-                print(f"✓ Scenario updated for api_key: {api_key}")
-
-            else:
-
-                response['status'] = 'success'
-                response['message'] = 'No changes made (data was identical)'
-                response['modified_count'] = 0
-            
-            response['api_key'] = api_key
-            
+
         except Exception as e : 
 
-            print(f"✗ Error updating scenario in database: {e}")
-            response['status'] = 'error'
-            response['message'] = f'Failed to update scenario: {str(e)}'
+            results.put_nowait({'index' : index , 'status' : 'error' , 'message' : str(e)})
+            return
+
+        if scenario_doc is None : 
+
+            results.put_nowait({'index' : index , **response})
+            return
+
+        pending.append((index , response , scenario_doc))
+
+        await insert_pending()
+
+    tasks : list[asyncio.Task] = [asyncio.create_task(run(index , query)) for index , query in enumerate(queries)]
+
+    try : 
 
-        # * Edit flow to db and to the api voxio
+        for _ in queries : yield await results.get()
+
+    finally : 
+
+        for task in tasks : task.cancel()
+
+async def _find_scenario(
+    scenario_repository : ScenarioRepository , 
+    api_key : str
+) -> dict | None : 
+
+    with stage_timer('mongo_find') : return await scenario_repository.find(api_key , {'_id' : 1 , 'workflow_hash' : 1})
+
+async def _get_flow(
+    voxio_client : VoxioClient , 
+    api_key : str
+) -> Response : 
+
+    with stage_timer('voxio_get_flow') : return await voxio_client.get_flow(api_key)
+
+async def _edit_flow(
+    voxio_client : VoxioClient , 
+    api_key : str , 
+    flow_name : str , 
+    base_hash : str | None , 
+    flow_hash : str , 
+    body : bytes
+) -> Response : 
+
+    with stage_timer('voxio_edit_flow') : return await voxio_client.edit_flow(
+        api_key = api_key , 
+        workflow = None , 
+        flow_name = flow_name , 
+        base_hash = base_hash , 
+        flow_hash = flow_hash , 
+        body = body
+    )
+
+async def _update_scenario(
+    scenario_repository : ScenarioRepository , 
+    api_key : str , 
+    fields : dict
+) : 
+
+    with stage_timer('mongo_update') : return await scenario_repository.update(api_key , fields)
+
+async def edit_scenario_route(
+    query : str , 
+    scenario_repository : ScenarioRepository , 
+    gemini_client : 'Client' , 
+    voxio_client : VoxioClient , 
+    assets : ScenarioAssets , 
+    config : dict , 
+    api_key : str , 
+    on_text : Callable[[str] , None] | None = None
+) : 
+    '''
+    Edits a scenario as a small dependency graph rather than a chain : the Voxio flow
+    lookup and the Mongo existence check run alongside the Gemini generation, which is
+    cancelled if either fails, and the Voxio PUT and the Mongo update run together at the
+    end. The critical path is one generation plus one write.
+
+    The scenario document keeps the hash of the flow last synced to Voxio, so the PUT is
+    skipped when the flow is unchanged and sent as a patch against that flow otherwise.
+    The generation is speculative, so it does not go through the generation cache : a
+    shared run could not be cancelled when the checks fail.
+    '''
+
+    generation : asyncio.Task = asyncio.create_task(generate_scenario(
+        query = query , 
+        gemini_client = gemini_client , 
+        assets = assets , 
+        config = config , 
+        on_text = on_text
+    ))
+
+    try : flow_response , scenario = await asyncio.gather(
+        _get_flow(voxio_client , api_key) , 
+        _find_scenario(scenario_repository , api_key)
+    )
+
+    except BaseException : 
+
+        generation.cancel()
+        raise
+
+    if flow_response.status_code != 200 : 
+
+        generation.cancel()
+        logger.error(f'✗ Voxio responded {flow_response.status_code} : {flow_response.text}')
+
+        return {
+            'status' : 'error' , 
+            'message' : 'Failed to edit flow in Voxio' , 
+        }
+
+    if scenario is None : 
+
+        generation.cancel()
+        logger.warning(f'✗ No scenario found with api_key : {api_key}')
+
+        return {
+            'status' : 'error' , 
+            'message' : f'No scenario found with api_key: {api_key}'
+        }
+
+    response : dict = await generation
+
+    with stage_timer('workflow_build') : 
+
+        body : bytes = assets.flow_template.render(response['scenario_name'] , response)
+        flow_hash : str = assets.flow_template.flow_hash(response['scenario_name'] , response)
+
+    # * Prepare update data (only update fields that are present in response)
+    update_data = {
+        field : response[field] 
+        for field in ('scenario_name' , 'scenario_prompt' , 'questions_for_feedback' , 'difficulty_status') 
+        if field in response
+    }
+
+    update_data['workflow_hash'] = flow_hash
+
+    edit_response , result = await asyncio.gather(
+        _edit_flow(voxio_client , api_key , response['scenario_name'] , scenario.get('workflow_hash') , flow_hash , body) , 
+        _update_scenario(scenario_repository , api_key , update_data) , 
+        return_exceptions = True
+    )
+
+    if isinstance(edit_response , Exception) or edit_response.status_code != 200 : 
+
+        # * The hash went in with the update, it must not claim a flow Voxio never got
+        if not isinstance(result , Exception) : 
+
+            try : await _update_scenario(scenario_repository , api_key , {'workflow_hash' : None})
+            except Exception as e : logger.error(f'✗ Could not reset the workflow hash of {api_key} : {e}')
+
+        logger.error(f'✗ Could not edit flow in Voxio : {edit_response if isinstance(edit_response , Exception) else edit_response.text}')
+        response['status'] = 'error'
+        response['message'] = 'Failed to edit flow in Voxio'
+
+        return response
+
+    if isinstance(result , Exception) : 
+
+        logger.error(f'✗ Error updating scenario in database : {result}')
+        response['status'] = 'error'
+        response['message'] = f'Failed to update scenario: {str(result)}'
 
         return response
 
-    else : print(api_response.json())
+    # * The scenario can still be deleted between the existence check and the update
+    if result.matched_count == 0 : 
+
+        response['status'] = 'error'
+        response['message'] = f'No scenario found with api_key: {api_key}'
+        logger.warning(f'✗ No scenario found with api_key : {api_key}')
+
+        return response
+
+    if result.modified_count > 0 : 
+        response['status'] = 'success'
+        response['message'] = 'Scenario updated successfully'
+        logger.info(f'✓ Scenario updated for api_key : {api_key}')
+
+    else:
+
+        response['status'] = 'success'
+        response['message'] = 'No changes made (data was identical)'
+        response['modified_count'] = 0
+
+    response['api_key'] = api_key
+
+    return response
+
+def _scenario_projection(fields : tuple[str , ...]) -> dict : return {'_id' : 1 , **{field : 1 for field in fields}}
+
+async def get_scenario_route(
+    scenario_repository : ScenarioRepository , 
+    api_key : str , 
+    fields : tuple[str , ...] = SCENARIO_FIELDS
+) -> dict | None : 
+    '''
+    One scenario by its `api_key`, through the unique `api_key` index, with only the given fields.
+    '''
+
+    with stage_timer('mongo_find') : scenario : dict | None = await scenario_repository.find(api_key , _scenario_projection(fields))
+
+    if scenario is not None : scenario['_id'] = str(scenario['_id'])
+
+    return scenario
+
+async def list_scenarios_route(
+    scenario_repository : ScenarioRepository , 
+    limit : int , 
+    after : ObjectId | None = None , 
+    fields : tuple[str , ...] = SCENARIO_SUMMARY_FIELDS
+) -> dict : 
+    '''
+    A page of scenarios, newest first, with only the given fields.
+
+    Returns : 
+        - dict : The `scenarios` and the `next_cursor` to pass as `after` for the next page, None on the last one.
+    '''
+
+    # * One scenario past the page tells whether there is a next one without a count
+    with stage_timer('mongo_find') : scenarios : list[dict] = await scenario_repository.page(after , limit + 1 , _scenario_projection(fields))
+
+    next_cursor : str | None = str(scenarios[limit - 1]['_id']) if len(scenarios) > limit else None
+
+    scenarios = scenarios[: limit]
+
+    for scenario in scenarios : scenario['_id'] = str(scenario['_id'])
 
-    return {
-        'status' : 'error' , 
-        'message' : 'Failed to edit flow in Voxio' ,
-    }
\ No newline at end of file
+    return {'scenarios' : scenarios , 'next_cursor' : next_cursor}
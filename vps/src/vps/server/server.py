@@ -0,0 +1,63 @@
+import importlib.util
+import os
+import uvicorn
+
+def worker_count(configured : int) -> int : 
+    '''
+    Number of worker processes to run, one per core when `configured` is 0.
+    '''
+
+    return configured if configured > 0 else os.cpu_count() or 1
+
+def resolve_implementations(config : dict) -> tuple[str , str] : 
+    '''
+    Resolves `auto` to uvloop and httptools, which `uvicorn[standard]` installs, and to
+    the pure Python asyncio loop and h11 parser where they are not available.
+
+    Returns : 
+        - tuple : The event loop and the HTTP implementation uvicorn will use.
+    '''
+
+    loop : str = config['loop']
+    http : str = config['http']
+
+    if loop == 'auto' : loop = 'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio'
+    if http == 'auto' : http = 'httptools' if importlib.util.find_spec('httptools') else 'h11'
+
+    return loop , http
+
+def serve(
+    app : str , 
+    config : dict
+) -> None : 
+    '''
+    Runs the service under uvicorn.
+
+    With more than one worker the supervisor binds the socket once and starts worker
+    processes that all accept on it. Each worker runs the `lifespan` of the app, so every
+    process builds its own clients and pools, and keeps its own rate limits, circuit
+    breakers, bulkheads and in-memory caches : with N workers the service admits up to N
+    times what one process is configured for, which is why the default is one worker.
+    On SIGTERM a worker stops accepting, lets in-flight requests and streams finish for up
+    to `graceful-shutdown-timeout` seconds, then runs the lifespan shutdown, which drains
+    the job queue.
+
+    Args : 
+        - app (str) : Import string of the ASGI app, such as `vps.app:app`.
+        - config (dict) : The `server` section of the config.
+    '''
+
+    loop , http = resolve_implementations(config)
+
+    uvicorn.run(
+        app , 
+        host = config['host'] , 
+        port = config['port'] , 
+        workers = worker_count(config['workers']) , 
+        loop = loop , 
+        http = http , 
+        backlog = config['backlog'] , 
+        timeout_keep_alive = config['keep-alive-timeout'] , 
+        timeout_graceful_shutdown = config['graceful-shutdown-timeout'] , 
+        access_log = config['access-log']
+    )
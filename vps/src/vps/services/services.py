@@ -1,10 +1,11 @@
 import asyncio
+import contextlib
 import time
 import inspect
 import functools
 from functools import partial
 import ast
-from google.genai.types import GenerateContentConfig , Part , Content
+from typing import TYPE_CHECKING
 
 
 from ._services import (
@@ -12,7 +13,12 @@ from ._services import (
     _parse_list ,
 )
 
-from logging import Logger
+from logging import DEBUG , Logger , getLogger
+
+# * The GenAI SDK is slow to import, it is loaded on first use instead of with `vps`
+if TYPE_CHECKING : from google.genai.types import GenerateContentConfig , Schema
+
+_fallback_logger : Logger = getLogger('vps')
 
 async def process_link(href : str , config : dict) -> str | None : 
     
@@ -21,69 +27,81 @@ async def process_link(href : str , config : dict) -> str | None :
 
     return href
 
+# * Methods marked with `method_log_timer` : their class, attribute, plain function and timed wrapper
+_timed_methods : list[tuple[type , str , object , object]] = []
+
+# * Calls, total seconds and slowest call of every marked method while timing was on, by qualified name
+method_timings : dict[str , list] = {}
+
+class _TimedMethod : 
+    '''
+    Stands in the class body only until the class is created : it then records the method
+    and puts the plain function back, so a marked method costs nothing until timing is on.
+    '''
+
+    def __init__(self , func , wrapper) -> None : 
+
+        self.func = func
+        self.wrapper = wrapper
+
+    def __set_name__(self , owner : type , name : str) -> None : 
+
+        _timed_methods.append((owner , name , self.func , self.wrapper))
+        setattr(owner , name , self.func)
+
 def method_log_timer(func) : 
     '''
-    Decorator to log the execution time of a method.
-    
+    Marks a hot-path method for timing. While `time_methods(True)` is in effect every call
+    is counted into `method_timings` and logged at debug level; otherwise the class holds
+    the undecorated method.
+
     Args : 
-        - func (callable): The method to be decorated.
-        
+        - func (callable) : The method, sync or async.
+
     Returns : 
-        - callable: The wrapped method with logging functionality.
+        - _TimedMethod : The marker, replaced by `func` once the class is created.
     '''
 
+    name : str = f'{func.__module__}.{func.__qualname__}'
+
+    def record(self , duration : float) -> None : 
+
+        timing : list | None = method_timings.get(name)
+
+        if timing is None : timing = method_timings[name] = [0 , 0.0 , 0.0]
+
+        timing[0] += 1
+        timing[1] += duration
+        timing[2] = max(timing[2] , duration)
+
+        logger : Logger = getattr(self , 'logger' , None) or _fallback_logger
+
+        if logger.isEnabledFor(DEBUG) : logger.debug(f'⏱️ Execution time for "{func.__qualname__}" : {duration:.4f} seconds')
+
     @functools.wraps(func)
-    async def async_wrapper(self, *args , **kwargs) : 
-        '''
-        Asynchronous wrapper for the method to log execution time.
-        
-        Args : 
-            - self: The instance of the class.
-            - *args: Positional arguments for the method.
-            - **kwargs: Keyword arguments for the method.
-            
-        Returns : 
-            - result: The result of the method execution.
-        '''
-
-        logger : Logger | None = getattr(self , 'logger' , None)
-        
-        start_time = time.perf_counter()
-        result = await func(self , *args , **kwargs)
-        duration = time.perf_counter() - start_time
-        
-        if logger : logger.info(f'⏱️ Execution time for "{func.__name__}": "{duration:.4f}" seconds , response : "{result}"')
-        else : print(f'Self.logger not found')
-
-        return result
+    async def async_wrapper(self , *args , **kwargs) : 
+
+        start_time : float = time.perf_counter()
+
+        try : return await func(self , *args , **kwargs)
+        finally : record(self , time.perf_counter() - start_time)
 
     @functools.wraps(func)
-    def sync_wrapper(self, *args, **kwargs) : 
-        '''
-        Synchronous wrapper for the method to log execution time.
-        
-        Args :
-            - self: The instance of the class.
-            - *args: Positional arguments for the method.
-            - **kwargs: Keyword arguments for the method.
-            
-        Returns : 
-            - result: The result of the method execution.
-        '''
+    def sync_wrapper(self , *args , **kwargs) : 
 
-        logger : Logger | None = getattr(self , 'logger' , None)
+        start_time : float = time.perf_counter()
 
-        start_time = time.perf_counter()
-        result = func(self , *args , **kwargs)
-        duration = time.perf_counter() - start_time
+        try : return func(self , *args , **kwargs)
+        finally : record(self , time.perf_counter() - start_time)
 
-        if logger : logger.info(f'⏱️ Execution time for "{func.__name__}" : {duration:.4f} seconds , response : "{result}"')
-        else : print(f'Self.logger not found')
+    return _TimedMethod(func , async_wrapper if inspect.iscoroutinefunction(func) else sync_wrapper)
 
-        return result
+def time_methods(enabled : bool) -> None : 
+    '''
+    Swaps the timed wrappers of every method marked with `method_log_timer` in or out.
+    '''
 
-    if inspect.iscoroutinefunction(func) : return async_wrapper
-    else : return sync_wrapper
+    for owner , name , func , wrapper in _timed_methods : setattr(owner , name , wrapper if enabled else func)
 
 async def run_in_thread(
     func , 
@@ -97,6 +115,45 @@ async def run_in_thread(
 
     return await loop.run_in_executor(None , func_part)
 
+async def cancel_on_disconnect(
+    request , 
+    coroutine , 
+    poll_interval : float = 0.5
+) : 
+    '''
+    Runs a coroutine and cancels it as soon as the HTTP client disconnects.
+
+    Args : 
+        - request (Request) : The incoming FastAPI request.
+        - coroutine (Coroutine) : The work to run on behalf of the request.
+        - poll_interval (float) : Seconds between two disconnect checks.
+
+    Returns : 
+        - result : The result of the coroutine, None if the client went away first.
+    '''
+
+    task = asyncio.ensure_future(coroutine)
+
+    try : 
+
+        while not task.done() : 
+
+            await asyncio.wait({task} , timeout = poll_interval)
+
+            if not task.done() and await request.is_disconnected() : 
+
+                task.cancel()
+
+                with contextlib.suppress(asyncio.CancelledError) : await task
+
+                return None
+
+        return task.result()
+
+    finally : 
+
+        if not task.done() : task.cancel()
+
 async def parse_list_async(value : str) -> list : return await run_in_thread(_parse_list , value)
 async def parse_bool_async(value : str) -> bool : return await run_in_thread(_parse_bool , value)
 
@@ -140,6 +197,8 @@ async def json_to_google_chat(chat : list) -> list :
     ]
     ''' 
 
+    from google.genai.types import Content , Part
+
     contents = []
 
     for row in chat : 
@@ -162,10 +221,20 @@ async def json_to_google_chat(chat : list) -> list :
 
     return contents
 
-async def create_generation_config(system_prompt : str) -> GenerateContentConfig : 
+async def create_generation_config(
+    system_prompt : str , 
+    response_schema : 'Schema | None' = None
+) -> 'GenerateContentConfig' : 
+    '''
+    Builds the generation config of a system prompt; with a response schema the model
+    is constrained to emit JSON of that shape.
+    '''
+
+    from google.genai.types import GenerateContentConfig , Part
     
     generation_config : GenerateContentConfig = GenerateContentConfig(
-        response_mime_type = 'text/plain' , 
+        response_mime_type = 'text/plain' if response_schema is None else 'application/json' , 
+        response_schema = response_schema , 
         system_instruction = [Part.from_text(text = system_prompt)]
     )
     
@@ -0,0 +1,3 @@
+from .tts import * 
+from .cache import * 
+from .stt import * 
\ No newline at end of file
@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from collections.abc import AsyncIterator , Callable
+from logging import Logger
+
+from ..services import run_in_thread
+
+class _Flight : 
+    '''
+    One upstream synthesis shared by every request asking for the same audio.
+    '''
+
+    def __init__(self) -> None : 
+
+        self.chunks : list[bytes] = []
+        self.done : bool = False
+        self.error : Exception | None = None
+        self.condition = asyncio.Condition()
+        self.task : asyncio.Task | None = None
+
+    async def follow(self) -> AsyncIterator[bytes] : 
+
+        index : int = 0
+
+        while True : 
+
+            async with self.condition : 
+
+                await self.condition.wait_for(lambda : index < len(self.chunks) or self.done)
+
+                chunks : list[bytes] = self.chunks[index :]
+                done : bool = self.done
+
+            for chunk in chunks : yield chunk
+
+            index += len(chunks)
+
+            if done and index >= len(self.chunks) : 
+
+                if self.error is not None : raise self.error
+
+                return
+
+def _write_file(path : str , audio : bytes) -> None : 
+
+    os.makedirs(os.path.dirname(path) , exist_ok = True)
+
+    # * Written aside under a name of its own and renamed, so a reader never sees a partial file
+    # * and two workers storing the same key never write into one temporary file
+    descriptor , temporary_path = tempfile.mkstemp(dir = os.path.dirname(path) , suffix = '.tmp')
+
+    try : 
+
+        with os.fdopen(descriptor , 'wb') as file : file.write(audio)
+
+        os.replace(temporary_path , path)
+
+    except OSError : 
+
+        try : os.remove(temporary_path)
+        except OSError : pass
+
+        raise
+
+def _read_file(path : str) -> bytes : 
+
+    with open(path , 'rb') as file : return file.read()
+
+def _scan_directory(path : str) -> list[tuple[str , int , float]] : 
+
+    entries : list[tuple[str , int , float]] = []
+
+    for root , _ , files in os.walk(path) : 
+
+        for name in files : 
+
+            if name.endswith('.tmp') : continue
+
+            stat = os.stat(os.path.join(root , name))
+            entries.append((name , stat.st_size , stat.st_mtime))
+
+    return sorted(entries , key = lambda entry : entry[2])
+
+class TTSCache : 
+    '''
+    Content-addressed cache of synthesized audio with a bounded in-memory LRU tier
+    and a size-capped on-disk tier. Concurrent misses on the same key share one
+    upstream call.
+
+    Every worker process keeps its own index of the disk tier. A key missing from it
+    is still looked up on disk, since another worker may have stored it, and the
+    index is rebuilt from the directory before evicting, so the cap holds for the
+    directory as a whole.
+    '''
+
+    def __init__(
+        self , 
+        config : dict , 
+        logger : Logger | None = None
+    ) -> None : 
+
+        self.logger = logger
+
+        self.memory_max_bytes : int = config['memory-max-bytes']
+        self.disk_max_bytes : int = config['disk-max-bytes']
+        self.disk_path : str = config['disk-path']
+
+        self.memory : OrderedDict[str , bytes] = OrderedDict()
+        self.memory_bytes : int = 0
+
+        self.disk : OrderedDict[str , int] = OrderedDict()
+        self.disk_bytes : int = 0
+
+        self.inflight : dict[str , _Flight] = {}
+
+        self.stats : dict[str , int] = {
+            'memory_hits' : 0 , 
+            'disk_hits' : 0 , 
+            'misses' : 0 , 
+            'coalesced' : 0 , 
+            'memory_evictions' : 0 , 
+            'disk_evictions' : 0
+        }
+
+    @staticmethod
+    def key(
+        text : str , 
+        model : str , 
+        encoding : str
+    ) -> str : return hashlib.sha256(f'{model}\0{encoding}\0{text}'.encode()).hexdigest()
+
+    def _path(self , key : str) -> str : return os.path.join(self.disk_path , key[:2] , key)
+
+    async def start(self) -> None : 
+
+        await self._scan_disk()
+        await self._evict_disk()
+
+    async def _scan_disk(self) -> None : 
+
+        self.disk = OrderedDict()
+        self.disk_bytes = 0
+
+        # * Oldest files first, so the on-disk LRU order survives a restart
+        for name , size , _ in await run_in_thread(_scan_directory , self.disk_path) : 
+
+            self.disk[name] = size
+            self.disk_bytes += size
+
+    async def stop(self) -> None : 
+
+        for flight in list(self.inflight.values()) : 
+            if flight.task is not None : flight.task.cancel()
+
+    async def stream(
+        self , 
+        key : str , 
+        fetch : Callable[[] , AsyncIterator[bytes]] , 
+        on_miss : Callable[[] , None] | None = None
+    ) -> AsyncIterator[bytes] : 
+        '''
+        Yields the audio of a key from the first tier that has it, or from upstream.
+
+        Args : 
+            - key (str) : The cache key, see `TTSCache.key`.
+            - fetch (Callable) : Starts the upstream synthesis on a miss.
+            - on_miss (Callable | None) : Called before an upstream synthesis starts, an exception it raises ends the stream instead.
+        '''
+
+        audio : bytes | None = self.memory.get(key)
+
+        if audio is not None : 
+
+            self.memory.move_to_end(key)
+            self.stats['memory_hits'] += 1
+
+            yield audio
+            return
+
+        flight : _Flight | None = self.inflight.get(key)
+
+        # * Looked up on disk even when not indexed, another worker may have stored it
+        if flight is None : 
+
+            try : 
+
+                audio = await run_in_thread(_read_file , self._path(key))
+
+                if key not in self.disk : 
+
+                    self.disk[key] = len(audio)
+                    self.disk_bytes += len(audio)
+
+                self.disk.move_to_end(key)
+                self.stats['disk_hits'] += 1
+                self._remember(key , audio)
+
+                yield audio
+                return
+
+            # * Never stored, or removed behind our back, fall through to upstream
+            except OSError : self._forget_disk(key)
+
+            flight = self.inflight.get(key)
+
+        if flight is None : 
+
+            if on_miss is not None : on_miss()
+
+            self.stats['misses'] += 1
+
+            flight = _Flight()
+            self.inflight[key] = flight
+            flight.task = asyncio.create_task(self._fetch(key , flight , fetch))
+
+        else : self.stats['coalesced'] += 1
+
+        async for chunk in flight.follow() : yield chunk
+
+    async def _fetch(
+        self , 
+        key : str , 
+        flight : _Flight , 
+        fetch : Callable[[] , AsyncIterator[bytes]]
+    ) -> None : 
+
+        try : 
+
+            async for chunk in fetch() : 
+
+                async with flight.condition : 
+
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+
+            audio : bytes = b''.join(flight.chunks)
+
+            self._remember(key , audio)
+
+        except Exception as e : flight.error = e
+
+        # * Followers must not mistake a cancelled synthesis for a complete one
+        except asyncio.CancelledError : 
+
+            flight.error = ConnectionError('Text to speech synthesis was cancelled.')
+            raise
+
+        finally : 
+
+            async with flight.condition : 
+
+                flight.done = True
+                flight.condition.notify_all()
+
+            self.inflight.pop(key , None)
+
+        if flight.error is None : await self._store_disk(key , audio)
+
+    def _remember(self , key : str , audio : bytes) -> None : 
+
+        if len(audio) > self.memory_max_bytes : return
+
+        if key in self.memory : self.memory_bytes -= len(self.memory.pop(key))
+
+        self.memory[key] = audio
+        self.memory_bytes += len(audio)
+
+        while self.memory_bytes > self.memory_max_bytes : 
+
+            _ , evicted = self.memory.popitem(last = False)
+            self.memory_bytes -= len(evicted)
+            self.stats['memory_evictions'] += 1
+
+    async def _store_disk(self , key : str , audio : bytes) -> None : 
+
+        if len(audio) > self.disk_max_bytes or key in self.disk : return
+
+        try : await run_in_thread(_write_file , self._path(key) , audio)
+
+        except OSError as e : 
+
+            if self.logger : self.logger.warning(f'Could not write TTS cache entry : {e}')
+
+            return
+
+        self.disk[key] = len(audio)
+        self.disk_bytes += len(audio)
+
+        await self._evict_disk()
+
+    def _forget_disk(self , key : str) -> None : 
+
+        size : int | None = self.disk.pop(key , None)
+
+        if size is not None : self.disk_bytes -= size
+
+    async def _evict_disk(self) -> None : 
+
+        if self.disk_bytes <= self.disk_max_bytes : return
+
+        # * Other workers write to the same directory, so the index is refreshed before evicting
+        await self._scan_disk()
+
+        while self.disk_bytes > self.disk_max_bytes : 
+
+            key , _ = next(iter(self.disk.items()))
+            self._forget_disk(key)
+            self.stats['disk_evictions'] += 1
+
+            try : await run_in_thread(os.remove , self._path(key))
+            except OSError : pass
+
+def find_speak_strings(workflow : dict) -> list[str] : 
+    '''
+    Collects the static `speak` lines of a workflow's `out` nodes.
+    '''
+
+    speak_strings : list[str] = []
+
+    for node in workflow.get('nodes' , {}).values() : 
+
+        out_dict : dict = node.get('parameters' , {}).get('out_dict' , {})
+
+        if node.get('type') == 'out' and isinstance(out_dict.get('speak') , str) : speak_strings.append(out_dict['speak'])
+
+    return speak_strings
+
+async def prewarm_tts_cache(
+    cache : TTSCache , 
+    texts : list[str] , 
+    fetch : Callable[[str] , AsyncIterator[bytes]] , 
+    model : str , 
+    encoding : str , 
+    logger : Logger | None = None
+) -> None : 
+    '''
+    Synthesizes every text once so the first real request is a cache hit.
+    '''
+
+    for text in dict.fromkeys(texts) : 
+
+        try : 
+            async for _ in cache.stream(cache.key(text , model , encoding) , lambda : fetch(text)) : pass
+
+        except Exception as e : 
+
+            if logger : logger.warning(f'Could not pre-warm TTS for "{text}" : {e}')
+
+    if logger : logger.info(f'TTS cache pre-warmed with {len(texts)} lines.')
@@ -0,0 +1,222 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator , Callable
+from typing import TYPE_CHECKING
+from fastapi import HTTPException , UploadFile , WebSocket , WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+from ..admission import get_bulkhead
+from ..resilience import ClientError
+
+if TYPE_CHECKING : from deepgram import AsyncDeepgramClient
+
+_stt_semaphore : asyncio.Semaphore | None = None
+
+class UploadTooLarge(ClientError) : 
+
+    def __init__(self , max_bytes : int) -> None : 
+
+        super().__init__(f'Upload exceeds the maximum of {max_bytes} bytes.')
+        self.max_bytes = max_bytes
+
+class UploadLimitMiddleware : 
+    '''
+    Pure ASGI middleware capping the request body of the upload endpoints before the
+    multipart parser spools it : 413 right away when `Content-Length` is over the limit,
+    and as soon as the bytes received go past it when the body is chunked or understated.
+    The limit covers the whole body, multipart framing included.
+    '''
+
+    def __init__(
+        self , 
+        app , 
+        paths : tuple[str , ...] , 
+        max_bytes : Callable[[] , int]
+    ) -> None : 
+
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self , scope , receive , send) -> None : 
+
+        if scope['type'] != 'http' or scope['path'] not in self.paths : return await self.app(scope , receive , send)
+
+        max_bytes : int = self.max_bytes()
+
+        for name , value in scope['headers'] : 
+
+            if name == b'content-length' : 
+
+                if value.isdigit() and int(value) > max_bytes : 
+                    return await JSONResponse({'detail' : str(UploadTooLarge(max_bytes))} , status_code = 413)(scope , receive , send)
+
+                break
+
+        received : int = 0
+
+        async def limited_receive() -> dict : 
+
+            nonlocal received
+
+            message : dict = await receive()
+
+            if message['type'] == 'http.request' : 
+
+                received += len(message.get('body' , b''))
+
+                # * Raised inside the body parser, which lets an HTTPException through as it is
+                if received > max_bytes : raise HTTPException(status_code = 413 , detail = str(UploadTooLarge(max_bytes)))
+
+            return message
+
+        await self.app(scope , limited_receive , send)
+
+def get_stt_semaphore(max_concurrency : int = 8) -> asyncio.Semaphore : 
+
+    global _stt_semaphore
+
+    if _stt_semaphore is None : _stt_semaphore = asyncio.Semaphore(max_concurrency)
+
+    return _stt_semaphore
+
+def check_upload_size(file : UploadFile , max_bytes : int) -> None : 
+    '''
+    Rejects an upload early when the multipart parser already knows it is too large.
+
+    Raises : 
+        - UploadTooLarge : When the upload is larger than `max_bytes`.
+    '''
+
+    if file.size is not None and file.size > max_bytes : raise UploadTooLarge(max_bytes)
+
+async def read_upload(
+    file : UploadFile , 
+    chunk_size : int , 
+    max_bytes : int
+) -> AsyncIterator[bytes] : 
+    '''
+    Yields an upload chunk by chunk, stopping as soon as it grows past `max_bytes`.
+    '''
+
+    total : int = 0
+
+    while chunk := await file.read(chunk_size) : 
+
+        total += len(chunk)
+
+        if total > max_bytes : raise UploadTooLarge(max_bytes)
+
+        yield chunk
+
+async def transcribe_upload(
+    deepgram_client : 'AsyncDeepgramClient' , 
+    file : UploadFile , 
+    config : dict
+) -> str : 
+    '''
+    Streams an uploaded recording to Deepgram and returns its transcript.
+
+    Args : 
+        - deepgram_client (AsyncDeepgramClient) : The shared Deepgram client.
+        - file (UploadFile) : The uploaded recording.
+        - config (dict) : The `stt` section of config.yml.
+
+    Returns : 
+        - str : The transcript of the first channel.
+    '''
+
+    check_upload_size(file , config['max-upload-bytes'])
+
+    async with get_bulkhead('deepgram').slot() , get_stt_semaphore(config['max-concurrency']) : 
+
+        response = await deepgram_client.listen.v1.media.transcribe_file(
+            request = read_upload(file , config['chunk-size'] , config['max-upload-bytes']) , 
+            model = config['model']
+        )
+
+    return response.results.channels[0].alternatives[0].transcript
+
+async def relay_live_transcription(
+    websocket : WebSocket , 
+    deepgram_client : 'AsyncDeepgramClient' , 
+    config : dict , 
+    encoding : str | None = None , 
+    sample_rate : str | None = None
+) -> None : 
+    '''
+    Relays microphone audio from an accepted WebSocket to Deepgram's streaming listen API
+    and pushes interim and final transcripts back as `{"transcript", "is_final", "speech_final"}`.
+
+    Binary messages are audio; a text message `Finalize` flushes the current utterance.
+    The session holds a slot of the `deepgram` bulkhead for as long as it lasts.
+
+    Raises : 
+        - AdmissionRejected : When no Deepgram slot frees up in time.
+    '''
+
+    from deepgram.extensions.types.sockets import ListenV1ControlMessage , ListenV1ResultsEvent
+
+    async with get_bulkhead('deepgram').slot() , deepgram_client.listen.v1.connect(
+        model = config['model'] , 
+        encoding = encoding , 
+        sample_rate = sample_rate , 
+        interim_results = 'true' , 
+        smart_format = 'true'
+    ) as connection : 
+
+        async def upstream() -> None : 
+
+            try : 
+
+                while True : 
+
+                    message : dict = await websocket.receive()
+
+                    if message['type'] == 'websocket.disconnect' : break
+
+                    if message.get('bytes') : await connection.send_media(message['bytes'])
+                    elif message.get('text') == 'Finalize' : await connection.send_control(ListenV1ControlMessage(type = 'Finalize'))
+
+            finally : 
+
+                with contextlib.suppress(Exception) : await connection.send_control(ListenV1ControlMessage(type = 'CloseStream'))
+
+        async def keepalive() -> None : 
+
+            while True : 
+
+                await asyncio.sleep(config['keepalive-interval'])
+                await connection.send_control(ListenV1ControlMessage(type = 'KeepAlive'))
+
+        async def downstream() -> None : 
+
+            async for event in connection : 
+
+                if not isinstance(event , ListenV1ResultsEvent) or not event.channel.alternatives : continue
+
+                await websocket.send_json({
+                    'transcript' : event.channel.alternatives[0].transcript , 
+                    'is_final' : event.is_final , 
+                    'speech_final' : event.speech_final
+                })
+
+        tasks : list[asyncio.Task] = [
+            asyncio.create_task(upstream()) , 
+            asyncio.create_task(keepalive()) , 
+            asyncio.create_task(downstream())
+        ]
+
+        try : 
+
+            # * Deepgram closes once the final results are out, which ends the relay
+            await tasks[2]
+
+        # * The client went away while results were still being pushed
+        except (WebSocketDisconnect , RuntimeError) : pass
+
+        finally : 
+
+            for task in tasks : task.cancel()
+
+            await asyncio.gather(*tasks , return_exceptions = True)
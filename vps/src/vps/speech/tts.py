@@ -0,0 +1,72 @@
+import time
+from collections.abc import AsyncIterator
+from logging import Logger
+from typing import TYPE_CHECKING
+
+from ..admission import get_bulkhead
+from ..metrics import TTS_TTFB_SECONDS
+
+if TYPE_CHECKING : from deepgram import AsyncDeepgramClient
+
+async def stream_tts(
+    deepgram_client : 'AsyncDeepgramClient' , 
+    text : str , 
+    config : dict , 
+    logger : Logger | None = None
+) -> AsyncIterator[bytes] : 
+    '''
+    Yields audio chunks as Deepgram produces them and logs the time to the first audio byte.
+
+    Args : 
+        - deepgram_client (AsyncDeepgramClient) : The shared Deepgram client.
+        - text (str) : Text to synthesize.
+        - config (dict) : The `tts` section of config.yml.
+        - logger (Logger) : Where the time to first audio byte is reported.
+    '''
+
+    start_time : float = time.perf_counter()
+    first_byte : bool = True
+
+    async with get_bulkhead('deepgram').slot() : 
+
+        async for chunk in deepgram_client.speak.v1.audio.generate(
+            text = text , 
+            model = config['model'] , 
+            encoding = config['encoding']
+        ) : 
+
+            if not chunk : continue
+
+            if first_byte : 
+
+                first_byte = False
+
+                TTS_TTFB_SECONDS.labels().observe(time.perf_counter() - start_time)
+
+                if logger : logger.info(f'⏱️ TTS time to first audio byte : {time.perf_counter() - start_time:.4f} seconds')
+
+            yield chunk
+
+async def prefetch(stream : AsyncIterator[bytes]) -> AsyncIterator[bytes] : 
+    '''
+    Waits for the first chunk before handing the stream over, so an upstream failure
+    surfaces before any response header has been sent.
+
+    Args : 
+        - stream (AsyncIterator[bytes]) : The audio stream.
+
+    Returns : 
+        - AsyncIterator[bytes] : The same stream, first chunk included.
+    '''
+
+    first_chunk : bytes | None = await anext(stream , None)
+
+    async def replay() -> AsyncIterator[bytes] : 
+
+        if first_chunk is None : return
+
+        yield first_chunk
+
+        async for chunk in stream : yield chunk
+
+    return replay()
@@ -0,0 +1 @@
+from .startup import * 
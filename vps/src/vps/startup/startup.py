@@ -0,0 +1,149 @@
+import asyncio
+import time
+from collections.abc import Awaitable , Callable
+from logging import Logger
+
+from ..services import run_in_thread
+
+class LazyClient : 
+    '''
+    Builds an SDK client on first use. The factory runs in a worker thread so the
+    SDK import never blocks the event loop, and concurrent first callers share one build.
+    '''
+
+    def __init__(self , factory : Callable) -> None : 
+
+        self.factory = factory
+        self.client = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool : return self.client is not None
+
+    async def get(self) : 
+
+        if self.client is None : 
+
+            async with self.lock : 
+
+                if self.client is None : self.client = await run_in_thread(self.factory)
+
+        return self.client
+
+class Startup : 
+    '''
+    Runs the warm-up checks of the service concurrently and tracks readiness. A failing
+    check is retried until it passes; the service is ready once every check has passed,
+    and a request that needs only some of them can wait for those alone.
+    '''
+
+    def __init__(
+        self , 
+        logger : Logger | None = None , 
+        retry_interval : float = 2.0
+    ) -> None : 
+
+        self.logger = logger
+        self.retry_interval = retry_interval
+
+        self.checks : dict[str , Callable[[] , Awaitable]] = {}
+        self.status : dict[str , str] = {}
+        self.durations : dict[str , float] = {}
+        self.passed : dict[str , asyncio.Event] = {}
+
+        self.started_at : float = time.perf_counter()
+        self.ready_seconds : float | None = None
+
+        self.ready_event = asyncio.Event()
+        self.task : asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool : return self.ready_event.is_set()
+
+    def add(
+        self , 
+        name : str , 
+        check : Callable[[] , Awaitable]
+    ) -> None : 
+
+        self.checks[name] = check
+        self.status[name] = 'pending'
+        self.passed[name] = asyncio.Event()
+
+    def start(self) -> None : self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None : 
+
+        if self.task is not None and not self.task.done() : 
+
+            self.task.cancel()
+
+            await asyncio.gather(self.task , return_exceptions = True)
+
+    def ready_for(self , *names : str) -> bool : 
+        '''
+        Whether the named checks have passed, every check when none is named. A name that
+        was never added has nothing to wait for.
+        '''
+
+        if not names : return self.ready
+
+        return all(self.passed[name].is_set() for name in names if name in self.passed)
+
+    async def wait(self , *names : str) -> None : 
+        '''
+        Waits until the named checks have passed, every check when none is named.
+        '''
+
+        if not names : return await self.ready_event.wait()
+
+        for name in names : 
+
+            if name in self.passed : await self.passed[name].wait()
+
+    async def _run_check(
+        self , 
+        name : str , 
+        check : Callable[[] , Awaitable]
+    ) -> None : 
+
+        while True : 
+
+            start_time : float = time.perf_counter()
+
+            try : 
+
+                await check()
+
+                self.durations[name] = time.perf_counter() - start_time
+                self.status[name] = 'ok'
+                self.passed[name].set()
+
+                return
+
+            except Exception as e : 
+
+                self.status[name] = f'error : {e}'
+
+                if self.logger : self.logger.warning(f'Startup check "{name}" failed, retrying in {self.retry_interval}s : {e}')
+
+            await asyncio.sleep(self.retry_interval)
+
+    async def _run(self) -> None : 
+
+        await asyncio.gather(*(self._run_check(name , check) for name , check in self.checks.items()))
+
+        self.ready_seconds = time.perf_counter() - self.started_at
+        self.ready_event.set()
+
+        if self.logger : self.logger.info(f'Ready in {self.ready_seconds:.3f}s : ' + ' , '.join(
+            f'{name} {duration:.3f}s' for name , duration in self.durations.items()
+        ))
+
+    def report(self) -> dict : 
+
+        return {
+            'status' : 'ready' if self.ready else 'starting' , 
+            'checks' : dict(self.status) , 
+            'ready_seconds' : self.ready_seconds
+        }
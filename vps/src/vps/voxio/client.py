@@ -0,0 +1,349 @@
+import asyncio
+import gzip
+import time
+from collections import OrderedDict
+import httpx
+
+from ..admission import get_bulkhead
+from ..resilience import CircuitBreaker , LatencyTracker , backoff_delay , get_breaker , hedged , time_left , within_deadline
+from ..codec import dumps , loads
+from ..services import method_log_timer
+from .diff import document_hash , flow_document , json_patch
+
+# * Only idempotent calls are retried after the request may have reached Voxio
+IDEMPOTENT_METHODS : set[str] = {'GET' , 'PUT' , 'HEAD' , 'DELETE'}
+
+RETRYABLE_STATUS_CODES : set[int] = {429 , 502 , 503 , 504}
+
+# * Answers to a patch that say nothing about whether Voxio takes patches : the base moved on, or come back later
+PATCH_RETRY_STATUS_CODES : set[int] = {408 , 409 , 412 , 429}
+
+def _patch_unsupported(status_code : int) -> bool : 
+    '''
+    Whether Voxio turned a patch down for being a patch : any other client error, or 501.
+    '''
+
+    return status_code == 501 or (400 <= status_code < 500 and status_code not in PATCH_RETRY_STATUS_CODES)
+
+class VoxioClient : 
+    '''
+    Pooled async client for the Voxio flow API, shared across requests.
+    '''
+
+    def __init__(
+        self , 
+        base_url : str , 
+        user_api_key : str , 
+        config : dict
+    ) -> None : 
+
+        self.user_api_key = user_api_key
+        self.retries : int = config['retries']
+        self.backoff : float = config['backoff']
+        self.backoff_cap : float = config['backoff-cap']
+
+        self.hedge : dict = config['hedge']
+        self.flow_latency = LatencyTracker(self.hedge['window'])
+
+        delta_sync : dict = config['delta-sync']
+
+        # * Turned off for the process the first time Voxio turns a patch down as unsupported or malformed
+        self.patch : bool = delta_sync['patch']
+        self.gzip : bool = delta_sync['gzip']
+        self.gzip_min_bytes : int = delta_sync['gzip-min-bytes']
+
+        # * Flow documents last synced, by hash : a patch is computed against the one Voxio has
+        self.documents : OrderedDict[str , dict] = OrderedDict()
+        self.max_documents : int = delta_sync['cache-size']
+
+        self.stats : dict[str , int] = {
+            'full' : 0 , 
+            'patched' : 0 , 
+            'skipped' : 0 , 
+            'patch_conflicts' : 0 , 
+            'bytes_sent' : 0
+        }
+
+        self.client = httpx.AsyncClient(
+            base_url = base_url , 
+            http2 = config['http2'] , 
+            timeout = httpx.Timeout(
+                connect = config['timeout']['connect'] , 
+                read = config['timeout']['read'] , 
+                write = config['timeout']['write'] , 
+                pool = config['timeout']['pool']
+            ) , 
+            limits = httpx.Limits(
+                max_connections = config['max-connections'] , 
+                max_keepalive_connections = config['max-keepalive-connections'] , 
+                keepalive_expiry = config['keepalive-expiry']
+            )
+        )
+
+    @method_log_timer
+    async def request(
+        self , 
+        method : str , 
+        path : str , 
+        headers : dict | None = None , 
+        json : dict | None = None , 
+        content : bytes | None = None , 
+        idempotent : bool | None = None
+    ) -> httpx.Response : 
+        '''
+        Sends a request through the Voxio circuit breaker, with bounded retries and
+        full-jitter exponential backoff, all within the deadline of the incoming request.
+
+        Args : 
+            - method (str) : HTTP method.
+            - path (str) : Path relative to the Voxio base url.
+            - headers (dict) : Extra headers for the call.
+            - json (dict) : JSON body, if any.
+            - content (bytes) : Raw body, if any, sent as is.
+            - idempotent (bool) : Whether the call may be retried, by default decided from the method.
+
+        Returns : 
+            - httpx.Response : The last response received.
+        '''
+
+        if idempotent is None : idempotent = method.upper() in IDEMPOTENT_METHODS
+        breaker : CircuitBreaker = get_breaker('voxio')
+
+        response : httpx.Response | None = None
+        error : Exception | None = None
+
+        for attempt in range(self.retries + 1) : 
+
+            last_attempt : bool = attempt == self.retries
+
+            try : 
+
+                async with within_deadline() : 
+
+                    with breaker.guard() as guard : 
+
+                        async with get_bulkhead('voxio').slot() : response = await self.client.request(
+                            method , 
+                            path , 
+                            headers = headers , 
+                            json = json , 
+                            content = content
+                        )
+
+                        if response.status_code >= 500 or response.status_code == 429 : guard.fail()
+
+                if not idempotent or last_attempt or response.status_code not in RETRYABLE_STATUS_CODES : return response
+
+            # * The request never left, so retrying is safe whatever the method
+            except (httpx.ConnectError , httpx.ConnectTimeout , httpx.PoolTimeout) as e : 
+
+                if last_attempt : raise
+
+                error = e
+
+            except (httpx.ReadTimeout , httpx.RemoteProtocolError) as e : 
+
+                if last_attempt or not idempotent : raise
+
+                error = e
+
+            delay : float = backoff_delay(attempt , self.backoff , self.backoff_cap)
+            left : float | None = time_left()
+
+            # * A retry that cannot finish before the deadline is not worth its load
+            if left is not None and delay >= left : break
+
+            await asyncio.sleep(delay)
+
+        if response is not None : return response
+
+        raise error
+
+    def _remember(self , flow_hash : str , document : dict) -> None : 
+
+        self.documents[flow_hash] = document
+        self.documents.move_to_end(flow_hash)
+
+        while len(self.documents) > self.max_documents : self.documents.popitem(last = False)
+
+    @staticmethod
+    def _document(
+        workflow : dict | None , 
+        flow_name : str , 
+        body : bytes | None
+    ) -> dict : 
+        '''
+        The flow document, decoded back from its body when only that was built.
+        '''
+
+        return flow_document(workflow , flow_name) if body is None else loads(body)
+
+    def _body(self , payload , encoded : bytes | None = None) -> tuple[bytes , dict] : 
+        '''
+        Encodes a JSON body, or takes one already encoded, gzipped when that is enabled and
+        the body is large enough to gain from it.
+        '''
+
+        body : bytes = dumps(payload) if encoded is None else encoded
+        headers : dict = {}
+
+        if self.gzip and len(body) >= self.gzip_min_bytes : 
+
+            body = gzip.compress(body , compresslevel = 5)
+            headers['Content-Encoding'] = 'gzip'
+
+        self.stats['bytes_sent'] += len(body)
+
+        return body , headers
+
+    @method_log_timer
+    async def add_flow(
+        self , 
+        workflow : dict | None , 
+        flow_name : str , 
+        flow_hash : str | None = None , 
+        body : bytes | None = None
+    ) -> httpx.Response : 
+        '''
+        Creates a flow; once created and while patches are on, its document is kept so a
+        later edit can be sent as a patch. `body` is the document already encoded, as a
+        `FlowTemplate` renders it, with its `flow_hash`; `workflow` is then not needed.
+        '''
+
+        # * With the body and its hash given, the document is only built for a later patch to start from
+        document : dict | None = self._document(workflow , flow_name , body) if body is None or not flow_hash or self.patch else None
+        flow_hash = flow_hash or document_hash(document)
+        encoded , headers = self._body(document , body)
+
+        response : httpx.Response = await self.request(
+            'POST' , 
+            '/add-flow' , 
+            headers = {'api_key' : self.user_api_key , 'Content-Type' : 'application/json' , **headers} , 
+            content = encoded
+        )
+
+        if response.status_code == 200 and self.patch : self._remember(flow_hash , document)
+
+        return response
+
+    @method_log_timer
+    async def get_flow(self , api_key : str) -> httpx.Response : 
+        '''
+        Looks up a flow; a lookup slower than most recent ones is hedged with a second copy.
+        '''
+
+        start_time : float = time.perf_counter()
+
+        response : httpx.Response = await hedged(
+            lambda : self.request('GET' , '/flow' , headers = {'api_key' : api_key}) , 
+            self._hedge_delay() , 
+            'voxio'
+        )
+
+        self.flow_latency.observe(time.perf_counter() - start_time)
+
+        return response
+
+    def _hedge_delay(self) -> float | None : 
+
+        if not self.hedge['enabled'] : return None
+
+        delay : float | None = self.flow_latency.quantile(self.hedge['quantile'])
+
+        return None if delay is None else max(delay , self.hedge['min-delay'])
+
+    @method_log_timer
+    async def edit_flow(
+        self , 
+        api_key : str , 
+        workflow : dict | None , 
+        flow_name : str , 
+        base_hash : str | None = None , 
+        flow_hash : str | None = None , 
+        body : bytes | None = None
+    ) -> httpx.Response : 
+        '''
+        Brings a flow to a new document with as little as possible on the wire : nothing
+        when Voxio already has it, a JSON Patch against the document Voxio has when that
+        one is known and patches are accepted, the full document otherwise.
+
+        Args : 
+            - api_key (str) : The flow to edit.
+            - workflow (dict | None) : Its new workflow, not needed when `body` and `flow_hash` are given.
+            - flow_name (str) : Its new name.
+            - base_hash (str) : Hash of the document Voxio has, as last synced, if known.
+            - flow_hash (str) : Hash of the new document, computed when not given.
+            - body (bytes) : The new document already encoded, sent instead of encoding it again; it is only
+              decoded back into a dict when a patch is computed from it or kept to compute one later.
+
+        Returns : 
+            - httpx.Response : The answer of Voxio, a local 200 when nothing had to be sent.
+        '''
+
+        document : dict | None = self._document(workflow , flow_name , body) if body is None or not flow_hash else None
+        flow_hash = flow_hash or document_hash(document)
+
+        if base_hash == flow_hash : 
+
+            self.stats['skipped'] += 1
+
+            return httpx.Response(200 , json = {'status' : 'unchanged'})
+
+        headers : dict = {'api_key' : api_key , 'user_api_key' : self.user_api_key}
+        base : dict | None = self.documents.get(base_hash) if self.patch and base_hash else None
+
+        if base is not None : 
+
+            if document is None : document = self._document(workflow , flow_name , body)
+
+            patch , encoding = self._body(json_patch(base , document))
+
+            # * `If-Match` makes the patch apply only to the document it was computed against, so a retry is safe
+            response : httpx.Response = await self.request(
+                'PATCH' , 
+                '/edit-flow' , 
+                headers = {**headers , 'Content-Type' : 'application/json-patch+json' , 'If-Match' : f'"{base_hash}"' , **encoding} , 
+                content = patch , 
+                idempotent = True
+            )
+
+            if response.status_code == 200 : 
+
+                self.stats['patched'] += 1
+                self._remember(flow_hash , document)
+
+                return response
+
+            if _patch_unsupported(response.status_code) : self.patch = False
+            else : self.stats['patch_conflicts'] += 1
+
+        encoded , encoding = self._body(document , body)
+
+        response = await self.request(
+            'PUT' , 
+            '/edit-flow' , 
+            headers = {**headers , 'Content-Type' : 'application/json' , **encoding} , 
+            content = encoded
+        )
+
+        if response.status_code == 200 : 
+
+            self.stats['full'] += 1
+
+            if self.patch : self._remember(flow_hash , self._document(workflow , flow_name , body) if document is None else document)
+
+        return response
+
+    async def warm(self , connections : int = 1) -> None : 
+        '''
+        Opens `connections` keep-alive connections ahead of the first real call, so it
+        does not pay for the TCP and TLS handshakes. Any HTTP status counts as warm.
+        '''
+
+        responses : list[httpx.Response] = await asyncio.gather(*(
+            self.client.head('/') for _ in range(connections)
+        ))
+
+        for response in responses : await response.aclose()
+
+    async def aclose(self) -> None : await self.client.aclose()
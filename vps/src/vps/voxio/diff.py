@@ -0,0 +1,217 @@
+import copy
+import hashlib
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+from ..codec import dumps , dumps_canonical
+from ..services import method_log_timer
+
+def flow_document(workflow : dict , flow_name : str) -> dict : 
+    '''
+    The flow as Voxio stores it, the body of `/add-flow` and `/edit-flow`.
+    '''
+
+    return {'flow_name' : flow_name , 'agent' : {'workflow' : workflow}}
+
+def body_hash(body : bytes) -> str : return hashlib.sha256(body).hexdigest()[: 32]
+
+def document_hash(document : dict) -> str : 
+    '''
+    Hash of the canonical JSON of a document : equal documents hash alike whatever their key order.
+    '''
+
+    return body_hash(dumps_canonical(document))
+
+class _Fragments : 
+    '''
+    One encoding of a document cut around the markers standing for the fields filled in later.
+    '''
+
+    __slots__ = ('encode' , 'fields' , 'fragments')
+
+    def __init__(
+        self , 
+        document : dict , 
+        markers : dict[str , str | None] , 
+        encode : Callable[[Any] , bytes]
+    ) -> None : 
+
+        encoded : bytes = encode(document)
+
+        # * Markers in the order they appear in the encoded document, not in `fields` order
+        positions : list[tuple[int , bytes , str | None]] = sorted(
+            (encoded.index(encode(text)) , encode(text) , name) for text , name in markers.items()
+        )
+
+        self.encode = encode
+        self.fields : tuple[str | None , ...] = tuple(name for _ , _ , name in positions)
+        self.fragments : list[bytes] = []
+
+        start : int = 0
+
+        for position , text , _ in positions : 
+
+            self.fragments.append(encoded[start : position])
+            start = position + len(text)
+
+        self.fragments.append(encoded[start :])
+
+    def join(self , flow_name : str , values : dict[str , Any]) -> bytes : 
+
+        parts : list[bytes] = [self.fragments[0]]
+
+        for name , fragment in zip(self.fields , self.fragments[1 :]) : 
+
+            parts.append(self.encode(flow_name if name is None else values[name]))
+            parts.append(fragment)
+
+        return b''.join(parts)
+
+class FlowTemplate : 
+    '''
+    A flow document encoded once around the workflow fields a scenario fills in : a flow
+    body then costs the encoding of its name and those fields only. The body keeps the key
+    order of the workflow asset, as Voxio stores it; its hash is taken over the canonical
+    encoding, so it equals `document_hash(flow_document(...))`.
+    `fields` maps the name of each such field to its key path inside the workflow.
+    '''
+
+    __slots__ = ('body' , 'canonical')
+
+    def __init__(
+        self , 
+        workflow : dict , 
+        fields : dict[str , tuple[str , ...]]
+    ) -> None : 
+
+        workflow = copy.deepcopy(workflow)
+        markers : dict[str , str | None] = {}
+
+        def marker(name : str | None) -> str : 
+
+            text : str = f'vps-template-{uuid.uuid4().hex}'
+            markers[text] = name
+
+            return text
+
+        for name , path in fields.items() : 
+
+            node : dict = workflow
+
+            for key in path[: -1] : node = node[key]
+
+            node[path[-1]] = marker(name)
+
+        document : dict = flow_document(workflow , marker(None))
+
+        self.body = _Fragments(document , markers , dumps)
+        self.canonical = _Fragments(document , markers , dumps_canonical)
+
+    @method_log_timer
+    def render(self , flow_name : str , values : dict[str , Any]) -> bytes : 
+        '''
+        Args : 
+            - flow_name (str) : The name of the flow.
+            - values (dict) : The value of every field, by name; other keys are ignored.
+
+        Returns : 
+            - bytes : The JSON of the flow document, in the key order of the workflow asset.
+        '''
+
+        return self.body.join(flow_name , values)
+
+    def flow_hash(self , flow_name : str , values : dict[str , Any]) -> str : 
+        '''
+        The `document_hash` of the flow document `render` encodes.
+        '''
+
+        return body_hash(self.canonical.join(flow_name , values))
+
+def _pointer(path : str , key) -> str : return f'{path}/{str(key).replace("~" , "~0").replace("/" , "~1")}'
+
+def json_patch(
+    old : dict , 
+    new : dict , 
+    path : str = ''
+) -> list[dict] : 
+    '''
+    RFC 6902 operations turning `old` into `new`. Objects are compared key by key and
+    branches shared by both (as in workflows cloned from one template) are skipped
+    without being walked; any other changed value, arrays included, is replaced whole.
+
+    Args : 
+        - old (dict) : The document the receiver has.
+        - new (dict) : The document it should end up with.
+        - path (str) : JSON pointer of both documents inside the full one.
+
+    Returns : 
+        - list[dict] : The operations, empty when the documents are equal.
+    '''
+
+    operations : list[dict] = []
+
+    for key in old : 
+
+        if key not in new : operations.append({'op' : 'remove' , 'path' : _pointer(path , key)})
+
+    for key , value in new.items() : 
+
+        pointer : str = _pointer(path , key)
+
+        if key not in old : 
+
+            operations.append({'op' : 'add' , 'path' : pointer , 'value' : value})
+            continue
+
+        previous = old[key]
+
+        if previous is value : continue
+
+        if isinstance(previous , dict) and isinstance(value , dict) : operations.extend(json_patch(previous , value , pointer))
+
+        elif previous != value or type(previous) is not type(value) : operations.append({'op' : 'replace' , 'path' : pointer , 'value' : value})
+
+    return operations
+
+def apply_patch(document : dict , operations : list[dict]) -> dict : 
+    '''
+    Applies the `add`, `remove` and `replace` operations of `json_patch` to a copy of a document.
+
+    Raises : 
+        - ValueError : When an operation does not fit the document.
+    '''
+
+    document = copy.deepcopy(document)
+
+    for operation in operations : 
+
+        keys : list[str] = [key.replace('~1' , '/').replace('~0' , '~') for key in operation['path'].split('/')[1 :]]
+
+        if not keys : raise ValueError('The root of a document cannot be patched.')
+
+        parent = document
+
+        try : 
+
+            for key in keys[: -1] : parent = parent[int(key)] if isinstance(parent , list) else parent[key]
+
+        except (KeyError , IndexError , ValueError) : raise ValueError(f'Path {operation["path"]} is not in the document.') from None
+
+        if not isinstance(parent , dict) : raise ValueError(f'Path {operation["path"]} does not lead to an object member.')
+
+        if operation['op'] in ('add' , 'replace') : 
+
+            if operation['op'] == 'replace' and keys[-1] not in parent : raise ValueError(f'Path {operation["path"]} is not in the document.')
+
+            parent[keys[-1]] = operation['value']
+
+        elif operation['op'] == 'remove' : 
+
+            if keys[-1] not in parent : raise ValueError(f'Path {operation["path"]} is not in the document.')
+
+            del parent[keys[-1]]
+
+        else : raise ValueError(f'Unsupported operation {operation["op"]}.')
+
+    return document